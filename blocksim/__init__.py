@@ -24,5 +24,16 @@ custom miners read the documentation section pertaining to the
 `blocksim.miners` sub-module."""
 
 from .miners import *
-from .payoff import constant_payoff, alpha_beta_step_payoff
-from .simulation import Simulation, Block
\ No newline at end of file
+from .payoff import Payoff, CallablePayoff, constant_payoff, alpha_beta_step_payoff
+from .simulation import Simulation, Block
+from .events import EventSimulation
+from .results import Results
+from .store import ColumnarStore, BlockHandle
+from .checkpoint import Checkpointer
+from .propagation import Propagation, max_rounds
+from .progress import Progress, TqdmProgress, CallbackProgress, SharedCounter
+from .instrumentation import Instrumentation
+from .trace import Trace
+from .replay import Replay
+from .montecarlo import MonteCarlo, run_trials
+from .sweep import Sweep, MinerFactory
\ No newline at end of file
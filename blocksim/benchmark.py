@@ -0,0 +1,342 @@
+"""Benchmark suite for the simulation engine. `SCENARIOS` describes a set of standard
+configurations that exercise different parts of the engine: honest miners, which go
+through the vectorized engine of `blocksim.fastpath`, and the same population
+through the general engine, a selfish miner with a third of the hash power, default
+miners that have to choose between persistent forks, an always fork miner, a large
+number of miners, a high `safe_dist` and a discounted payoff.
+
+`run_benchmarks` runs each scenario in a fresh process, so that its peak memory
+can be measured, and reports the number of steps per second, the peak resident set
+size and the time spent building the simulation, running it and collecting its
+results. On request, each scenario that goes through the general engine is also
+run once more with a `blocksim.instrumentation.Instrumentation`, to report the time
+spent in each phase of its steps. The report can be written as JSON and compared
+with the report of another commit through `compare`. The module can also be run
+from the command line::
+
+    python -m blocksim.benchmark --output before.json
+    python -m blocksim.benchmark --output after.json --compare before.json"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from multiprocessing import get_context
+from os import path
+from time import perf_counter
+
+import numpy as np
+
+from .fastpath import honest
+from .instrumentation import Instrumentation
+from .miners import Miner, DefaultMiner, SelfishMiner, AlwaysForkMiner
+from .payoff import alpha_beta_step_payoff
+from .simulation import Simulation
+from .sweep import MinerFactory
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+SCENARIOS = {
+    'honest': {'miners': MinerFactory((Miner, 'Miner 1'), (Miner, 'Miner 2'), (DefaultMiner, 'Default Miner')),
+        'h': {'Miner 1': 1, 'Miner 2': 2, 'Default Miner': 3},
+        'step_nr': 1000000, 'safe_dist': 6, 'payoff': alpha_beta_step_payoff(1, 1, 1)},
+    'honest_general': {'miners': MinerFactory((Miner, 'Miner 1'), (Miner, 'Miner 2'), (DefaultMiner, 'Default Miner')),
+        'h': {'Miner 1': 1, 'Miner 2': 2, 'Default Miner': 3},
+        'step_nr': 50000, 'safe_dist': 6, 'payoff': alpha_beta_step_payoff(1, 1, 1),
+        'options': {'fast_path': False}},
+    'selfish': {'miners': MinerFactory((SelfishMiner, 'Selfish Miner'), (Miner, 'Miner')),
+        'h': {'Selfish Miner': 1, 'Miner': 2},
+        'step_nr': 50000, 'safe_dist': 6, 'payoff': alpha_beta_step_payoff(1, 1, 1)},
+    'default_forks': {'miners': MinerFactory((DefaultMiner, 'Default Miner 1'), (DefaultMiner, 'Default Miner 2'),
+        (AlwaysForkMiner, 'Always Fork Miner')),
+        'h': {'Default Miner 1': 1, 'Default Miner 2': 1, 'Always Fork Miner': 2},
+        'step_nr': 20000, 'safe_dist': 6, 'payoff': alpha_beta_step_payoff(1, 1, 1)},
+    'always_fork': {'miners': MinerFactory((AlwaysForkMiner, 'Always Fork Miner'), (Miner, 'Miner')),
+        'h': {'Always Fork Miner': 1, 'Miner': 2},
+        'step_nr': 50000, 'safe_dist': 6, 'payoff': alpha_beta_step_payoff(1, 1, 1)},
+    'many_miners': {'miners': MinerFactory(*([(SelfishMiner, 'Selfish Miner {}'.format(i)) for i in range(10)] +
+        [(Miner, 'Miner {}'.format(i)) for i in range(190)])),
+        'h': dict([('Selfish Miner {}'.format(i), 1) for i in range(10)] +
+        [('Miner {}'.format(i), 1) for i in range(190)]),
+        'step_nr': 20000, 'safe_dist': 6, 'payoff': alpha_beta_step_payoff(1, 1, 1)},
+    'high_safe_dist': {'miners': MinerFactory((SelfishMiner, 'Selfish Miner'), (Miner, 'Miner')),
+        'h': {'Selfish Miner': 1, 'Miner': 2},
+        'step_nr': 50000, 'safe_dist': 1000, 'payoff': alpha_beta_step_payoff(1, 1, 1)},
+    'discount': {'miners': MinerFactory((SelfishMiner, 'Selfish Miner'), (Miner, 'Miner')),
+        'h': {'Selfish Miner': 1, 'Miner': 2},
+        'step_nr': 50000, 'safe_dist': 6, 'payoff': alpha_beta_step_payoff(0.9999, 0.5, 1000)},
+}
+"""Standard scenarios of the suite, as dictionaries with the keys ``miners`` (a
+`blocksim.sweep.MinerFactory`), ``h``, ``step_nr``, ``safe_dist``, ``payoff`` and
+optionally ``options``, with further keyword arguments for
+`blocksim.simulation.Simulation`."""
+
+
+def peak_rss():
+
+    """Get the peak resident set size of the current process.
+
+    Results
+    -------
+
+    peak_rss : int
+        peak resident set size in bytes, or None if it can't be measured on
+        this platform"""
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def commit():
+
+    """Get the commit of the working copy of the package, if it is a git
+    repository.
+
+    Results
+    -------
+
+    commit : str
+        hash of the current commit, or None if it can't be found"""
+
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=path.dirname(path.abspath(__file__)),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_scenario(task):
+
+    """Run a scenario and measure it. This is meant to run in a fresh process,
+    so that the peak resident set size belongs to the scenario alone.
+
+    Parameters
+    ----------
+
+    task : tuple
+        tuple ``(name, step_nr, seed, repeat, step_phases)``, where ``step_nr``
+        overrides the step number of the scenario if it isn't None, ``repeat`` is
+        the number of times the scenario is run and ``step_phases`` is a flag
+        indicating whether the phases of the steps are measured in an additional
+        instrumented run
+
+    Results
+    -------
+
+    record : dict
+        dictionary with the steps per second of the fastest run, the wall time
+        of every run, the time spent in each phase of the fastest run, the peak
+        resident set size, the depth of the structure, the engine used, the
+        statistics of the propagation engine and, if requested, the report of
+        the instrumented run"""
+
+    name, step_nr, seed, repeat, step_phases = task
+    scenario = SCENARIOS[name]
+    step_nr = step_nr if step_nr is not None else scenario['step_nr']
+    start_rss = peak_rss()
+
+    runs = []
+    for _ in range(repeat):
+        phases = {}
+        started = perf_counter()
+        sim = Simulation(scenario['miners'](), scenario['h'], step_nr, scenario['safe_dist'], scenario['payoff'],
+            seed=seed, **scenario.get('options', {}))
+        phases['setup'] = perf_counter() - started
+        engine = 'vectorized' if sim.fast_path and honest(sim) else 'general'
+
+        started = perf_counter()
+        sim.simulate()
+        phases['run'] = perf_counter() - started
+
+        started = perf_counter()
+        results = sim.results()
+        phases['results'] = perf_counter() - started
+        runs.append((phases, results, engine, sim.propagation.stats()))
+
+    phases, results, engine, propagation = min(runs, key=lambda run: run[0]['run'])
+
+    instrumentation = None
+    if step_phases and engine == 'general':
+        instrumentation = Instrumentation()
+        Simulation(scenario['miners'](), scenario['h'], step_nr, scenario['safe_dist'], scenario['payoff'],
+            seed=seed, **scenario.get('options', {})).simulate(instrumentation=instrumentation)
+
+    return {'step_nr': step_nr, 'seed': seed, 'repeat': repeat,
+        'steps_per_sec': step_nr / phases['run'] if phases['run'] else None,
+        'wall_times': [run[0]['run'] for run in runs],
+        'phases': phases,
+        'start_rss': start_rss,
+        'peak_rss': peak_rss(),
+        'depth': results.depth,
+        'engine': engine,
+        'propagation': propagation,
+        'step_phases': instrumentation.report() if instrumentation is not None else None}
+
+
+def run_benchmarks(names=None, step_nr=None, seed=0, repeat=1, output=None, step_phases=False):
+
+    """Run scenarios of the suite, each one in a fresh process, one after the
+    other.
+
+    Parameters
+    ----------
+
+    names : list
+        names of the scenarios to run. Defaults to every scenario of
+        `SCENARIOS`
+    step_nr : int
+        if given, step number used for every scenario instead of their own
+    seed : int
+        seed of every simulation
+    repeat : int
+        number of times each scenario is run. The fastest run is reported
+    output : str
+        if given, path of the file to which the report is written as JSON
+    step_phases : bool
+        flag indicating whether the phases of the steps of each scenario are
+        measured in an additional instrumented run
+
+    Results
+    -------
+
+    report : dict
+        dictionary with the commit, the versions of Python and NumPy, the
+        platform, the date and, under the key ``scenarios``, the record of each
+        scenario as returned by `run_scenario`"""
+
+    names = list(SCENARIOS) if names is None else names
+    for name in names:
+        if name not in SCENARIOS:
+            raise ValueError("Unknown scenario '{}'".format(name))
+
+    report = {'commit': commit(), 'python': platform.python_version(), 'numpy': np.__version__,
+        'platform': platform.platform(), 'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'scenarios': {}}
+
+    context = get_context('spawn')
+    for name in names:
+        with context.Pool(1) as pool:
+            report['scenarios'][name] = pool.apply(run_scenario, ((name, step_nr, seed, repeat, step_phases),))
+
+    if output is not None:
+        with open(output, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+
+    return report
+
+
+def compare(baseline, report, tolerance=0.05):
+
+    """Compare the steps per second of the scenarios of two reports.
+
+    Parameters
+    ----------
+
+    baseline : dict
+        report to compare against, as returned by `run_benchmarks`
+    report : dict
+        report to compare
+    tolerance : float
+        relative slowdown above which a scenario counts as a regression
+
+    Results
+    -------
+
+    comparison : dict
+        dictionary of pairs ``scenario_name: dict`` for the scenarios present
+        in both reports, with the steps per second of each report
+        (``baseline``, ``current``), their ratio (``ratio``) and a flag
+        indicating whether the scenario regressed (``regression``)"""
+
+    comparison = {}
+    for name, record in report['scenarios'].items():
+        if name not in baseline['scenarios']:
+            continue
+        before = baseline['scenarios'][name]['steps_per_sec']
+        after = record['steps_per_sec']
+        ratio = after / before if before and after else None
+        comparison[name] = {'baseline': before, 'current': after, 'ratio': ratio,
+            'regression': ratio is not None and ratio < 1 - tolerance}
+    return comparison
+
+
+def print_report(report, comparison=None):
+
+    """Prints the steps per second, the peak resident set size and the time of
+    each phase of every scenario of a report, along with its comparison with a
+    baseline if there is one.
+
+    Parameters
+    ----------
+
+    report : dict
+        report returned by `run_benchmarks`
+    comparison : dict
+        comparison returned by `compare`"""
+
+    print("==========")
+    print("Commit: {}".format(report['commit']))
+    print("==========")
+    for name, record in report['scenarios'].items():
+        print("Scenario: {} ({} engine)".format(name, record['engine']))
+        print("Steps/sec: {:.0f}".format(record['steps_per_sec'] or 0))
+        if record['peak_rss'] is not None:
+            print("Peak RSS: {:.1f} MiB".format(record['peak_rss'] / 2**20))
+        print("Phases: {}".format(", ".join("{} {:.3f}s".format(phase, seconds)
+            for phase, seconds in record['phases'].items())))
+        if record.get('step_phases') is not None:
+            print("Step phases: {}".format(", ".join("{} {:.3f}s".format(phase, stats['time'])
+                for phase, stats in record['step_phases']['phases'].items())))
+        if comparison is not None and name in comparison and comparison[name]['ratio'] is not None:
+            print("Against baseline: {:.2f}x{}".format(comparison[name]['ratio'],
+                " (regression)" if comparison[name]['regression'] else ""))
+        print("==========")
+
+
+def main(args=None):
+
+    """Run the suite from the command line. Returns 1 if a baseline is given and
+    some scenario regressed against it, and 0 otherwise.
+
+    Parameters
+    ----------
+
+    args : list
+        command line arguments. Defaults to `sys.argv`"""
+
+    parser = argparse.ArgumentParser(prog='python -m blocksim.benchmark', description="Benchmark the simulation engine.")
+    parser.add_argument('scenarios', nargs='*', help="scenarios to run (default: all of them)")
+    parser.add_argument('--steps', type=int, help="step number for every scenario")
+    parser.add_argument('--seed', type=int, default=0, help="seed of every simulation")
+    parser.add_argument('--repeat', type=int, default=1, help="runs of each scenario, the fastest is reported")
+    parser.add_argument('--output', help="file to which the report is written as JSON")
+    parser.add_argument('--compare', help="report of a previous run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.05, help="relative slowdown counted as a regression")
+    parser.add_argument('--phases', action='store_true', help="also time the phases of the steps")
+    parser.add_argument('--list', action='store_true', help="list the scenarios and exit")
+    args = parser.parse_args(args)
+
+    if args.list:
+        for name, scenario in SCENARIOS.items():
+            print("{}: {} steps".format(name, scenario['step_nr']))
+        return 0
+
+    report = run_benchmarks(args.scenarios or None, args.steps, args.seed, args.repeat, args.output, args.phases)
+    comparison = None
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            comparison = compare(json.load(baseline_file), report, args.tolerance)
+    print_report(report, comparison)
+
+    return int(comparison is not None and any(result['regression'] for result in comparison.values()))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
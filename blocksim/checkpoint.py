@@ -0,0 +1,443 @@
+"""Checkpoints for long simulations. A `Checkpointer` saves the state of a simulation
+to a directory every `every` steps, and a simulation that has been interrupted can be
+resumed from the last checkpoint by creating it again with the same arguments and
+calling `Checkpointer.restore` before `blocksim.simulation.Simulation.simulate`.
+
+Published blocks are identified by their timestamp, which is their position in the
+order of publication, and hidden blocks by their position in the order of creation.
+Each checkpoint appends to the file ``blocks.bin`` one fixed-width row ``(parent,
+owner id, depth, creation position)`` for every block published since the previous
+one, and to ``paid.bin`` the identifier of every block paid since then, so
+checkpoints only write what has changed. The creation position is only kept for
+blocks that were hidden at the previous checkpoint, which other rows may reference
+if a miner published a block on top of them before they were revealed. Everything
+else, namely the hidden blocks, the private state of the miners, the tips of the
+structure, the payoff tables, the random stream and the counters of the
+simulation, is small and is rewritten to ``state.pkl`` on each checkpoint. Blocks
+are replaced by references in the state of the miners, so the structure is never
+pickled as an object graph.
+
+Restoring a simulation rebuilds the blocks of the structure from the rows, in order
+of publication, so children keep their order. If the structure has been pruned only
+the descendants of its root are rebuilt, along with any dropped block still reachable
+from the state of the miners, whose children are not restored."""
+
+import os
+import pickle
+from collections import OrderedDict
+from time import perf_counter
+
+import numpy as np
+
+from .simulation import Block, HiddenBlocks
+from .store import BlockHandle, ColumnarStore
+
+
+NO_PARENT = -1
+"""Reference of the missing parent of a root."""
+
+HIDDEN = -2
+"""Reference of the first hidden block. The hidden block created in position
+``seq`` among every block of the simulation is referenced by ``HIDDEN - seq``."""
+
+
+class BlockRef:
+
+    """Generate a reference to a block in the saved state of a miner. Published
+    blocks are referenced by their timestamp and hidden blocks by their position
+    in the order of creation, see `blocksim.checkpoint.HIDDEN`."""
+
+    __slots__ = ('id',)
+
+    def __init__(self, id):
+
+        """Parameters
+        ----------
+
+        id : int
+            identifier of the block"""
+
+        self.id = id
+
+    def __eq__(self, other):
+        return isinstance(other, BlockRef) and self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class HiddenBlocksRef:
+
+    """Generate a reference to a `blocksim.simulation.HiddenBlocks` collection in
+    the saved state of a miner."""
+
+    __slots__ = ('refs',)
+
+    def __init__(self, refs):
+
+        """Parameters
+        ----------
+
+        refs : list
+            references to the blocks of the collection, in order"""
+
+        self.refs = refs
+
+
+def encode(value, block_id):
+
+    """Replace the blocks in a value of the state of a miner with references. Lists,
+    tuples, sets, dictionaries and hidden block collections are searched for blocks,
+    whilst any other value is kept as it is.
+
+    Parameters
+    ----------
+
+    value : object
+        value to encode
+    block_id : function
+        function that returns the identifier of a block
+
+    Results
+    -------
+
+    encoded : object
+        value with references instead of blocks"""
+
+    if isinstance(value, (Block, BlockHandle)):
+        return BlockRef(block_id(value))
+    if isinstance(value, HiddenBlocks):
+        return HiddenBlocksRef([BlockRef(block_id(block)) for block in value])
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return type(value)(encode(item, block_id) for item in value)
+    if isinstance(value, dict):
+        return {encode(key, block_id): encode(item, block_id) for key, item in value.items()}
+    return value
+
+
+def decode(value, block):
+
+    """Replace the references in an encoded value with blocks.
+
+    Parameters
+    ----------
+
+    value : object
+        value encoded with `blocksim.checkpoint.encode`
+    block : function
+        function that returns the block with a given identifier
+
+    Results
+    -------
+
+    decoded : object
+        value with blocks instead of references"""
+
+    if isinstance(value, BlockRef):
+        return block(value.id)
+    if isinstance(value, HiddenBlocksRef):
+        return HiddenBlocks(block(ref.id) for ref in value.refs)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return type(value)(decode(item, block) for item in value)
+    if isinstance(value, dict):
+        return {decode(key, block): decode(item, block) for key, item in value.items()}
+    return value
+
+
+class Checkpointer:
+
+    """Generate a checkpointer that saves the state of a simulation to a
+    directory."""
+
+    row_size = 4
+    """Number of 64-bit integers in each row of ``blocks.bin``."""
+
+    chunk_size = 65536
+    """Number of rows read at once when restoring a simulation."""
+
+    def __init__(self, path, every=1000000):
+
+        """Parameters
+        ----------
+
+        path : str
+            directory where checkpoints are saved
+        every : int
+            number of steps between consecutive checkpoints"""
+
+        self.path = path
+        self.every = every
+        self.block_rows = 0
+        self.paid_rows = 0
+        self.hidden = {}
+
+    def file(self, name):
+
+        """Get the path of one of the files of the checkpoint.
+
+        Parameters
+        ----------
+
+        name : str
+            name of the file
+
+        Results
+        -------
+
+        path : str
+            path of the file"""
+
+        return os.path.join(self.path, name)
+
+    def attach(self, sim):
+
+        """Start recording the blocks that the structure of a simulation publishes
+        and pays, which are written on the next checkpoint. This method is called
+        by `blocksim.simulation.Simulation.simulate`.
+
+        Parameters
+        ----------
+
+        sim : blocksim.simulation.Simulation
+            simulation to checkpoint"""
+
+        if sim.struct.journal is not None:
+            return
+        if sim.steps:
+            raise ValueError("a checkpointer has to be used from the start of a simulation or after restoring it")
+
+        sim.struct.journal = []
+        sim.struct.paid_journal = []
+        self.block_rows = 0
+        self.paid_rows = 0
+        self.hidden = {}
+
+    def append(self, name, rows, size):
+
+        """Append rows to a file of the checkpoint, dropping anything written
+        after the last complete checkpoint, and make sure they reach the disk.
+
+        Parameters
+        ----------
+
+        name : str
+            name of the file
+        rows : numpy.ndarray
+            rows to append
+        size : int
+            size in bytes of the file at the last complete checkpoint"""
+
+        with open(self.file(name), 'ab') as output:
+            output.truncate(size)
+            output.write(rows.tobytes())
+            output.flush()
+            os.fsync(output.fileno())
+
+    def save(self, sim):
+
+        """Save the state of a simulation. The rows of the blocks published and
+        paid since the last checkpoint are appended first and the state is then
+        replaced atomically, so an interrupted checkpoint leaves the previous
+        one intact.
+
+        Parameters
+        ----------
+
+        sim : blocksim.simulation.Simulation
+            simulation to checkpoint"""
+
+        self.attach(sim)
+        os.makedirs(self.path, exist_ok=True)
+        struct = sim.struct
+        ids = sim.registry.ids
+
+        seqs = sim.hidden_blocks.blocks
+
+        def block_id(block):
+            return HIDDEN - seqs[block] if block.is_hidden() else block.tstamp
+
+        rows = np.array([(block_id(block.parent) if block.parent is not None else NO_PARENT, ids[block.owner.name],
+            block.depth, self.hidden.get(block, -1)) for block in struct.journal], dtype=np.int64).reshape(-1, self.row_size)
+        paid = np.array([block_id(block) for block in struct.paid_journal], dtype=np.int64)
+        self.append('blocks.bin', rows, 8 * self.row_size * self.block_rows)
+        self.append('paid.bin', paid, 8 * self.paid_rows)
+        self.block_rows += len(rows)
+        self.paid_rows += len(paid)
+        self.hidden = dict(seqs)
+        struct.journal.clear()
+        struct.paid_journal.clear()
+
+        branch_sums = None
+        if struct.branch_sums is not None:
+            branch_sums = ([block_id(block) for block in struct.branch_sums],
+                np.array(list(struct.branch_sums.values()), dtype=float).reshape(len(struct.branch_sums), -1))
+
+        state = {'block_rows': self.block_rows, 'paid_rows': self.paid_rows,
+            'steps': sim.steps,
+            'wall_time': sim.wall_time + (perf_counter() - sim.started if sim.started is not None else 0),
+            'rng': sim.rng.get_state(),
+            'hidden': [(seqs[block], block_id(block.parent), ids[block.owner.name]) for block in seqs],
+            'hidden_count': sim.hidden_blocks.count,
+            'miners': [encode(vars(miner), block_id) for miner in sim.miners],
+            'propagation': {name: getattr(sim.propagation, name) for name in ('last_rounds', 'last_published',
+                'last_informs', 'runs', 'rounds', 'published', 'informs', 'max_rounds')},
+            'base': block_id(struct.base),
+            'depth': struct.depth, 'last_tstamp': struct.last_tstamp,
+            'frontier': [block_id(block) for block in struct.frontier],
+            'safe_chain': [block_id(block) for block in struct.safe_chain],
+            'block_numbers': struct.block_numbers, 'payoffs': struct.payoffs,
+            'published_numbers': struct.published_numbers,
+            'pending': (struct.pending_owners, struct.pending_tstamps, struct.pending_depths),
+            'pruned': (struct.pruned_blocks, struct.pruned_orphans),
+            'branch_sums': branch_sums}
+
+        with open(self.file('state.tmp'), 'wb') as output:
+            pickle.dump(state, output, protocol=pickle.HIGHEST_PROTOCOL)
+            output.flush()
+            os.fsync(output.fileno())
+        os.replace(self.file('state.tmp'), self.file('state.pkl'))
+
+    def restore(self, sim):
+
+        """Restore the last checkpoint into a simulation that has just been
+        created with the same arguments as the one that was saved.
+
+        Parameters
+        ----------
+
+        sim : blocksim.simulation.Simulation
+            newly created simulation"""
+
+        with open(self.file('state.pkl'), 'rb') as state_file:
+            state = pickle.load(state_file)
+
+        struct = sim.struct
+        miners = sim.registry.miners
+        if struct.store is not None:
+            struct.store = ColumnarStore(struct.registry)
+            struct.new_block = struct.store
+        new_block = struct.new_block
+
+        self.block_rows = state['block_rows']
+        self.paid_rows = state['paid_rows']
+        rows = np.memmap(self.file('blocks.bin'), dtype=np.int64, mode='r',
+            shape=(self.block_rows, self.row_size)) if self.block_rows else np.zeros((0, self.row_size), dtype=np.int64)
+        published = np.flatnonzero(rows[:, 3] >= 0)
+        published = dict(zip(rows[published, 3].tolist(), (published + 1).tolist()))
+        paid_refs = np.fromfile(self.file('paid.bin'), dtype=np.int64, count=self.paid_rows)
+        paid = np.zeros(self.block_rows + 1, dtype=bool)
+        paid[0] = True
+        paid[paid_refs[paid_refs >= 0]] = True
+        paid_hidden = set()
+        for ref in paid_refs[paid_refs < 0].tolist():
+            block_id = published.get(HIDDEN - ref, ref)
+            if block_id >= 0:
+                paid[block_id] = True
+            else:
+                paid_hidden.add(block_id)
+        hidden = {HIDDEN - seq: (parent_ref, owner) for seq, parent_ref, owner in state['hidden']}
+        base_id = state['base']
+        built = {}
+        dropped = set()
+        mainline = set()
+
+        def key(ref):
+            if ref <= HIDDEN:
+                return published.get(HIDDEN - ref, ref)
+            return ref if ref != NO_PARENT else None
+
+        def parent_key(block_id):
+            if block_id < 0:
+                return key(hidden[block_id][0])
+            if block_id == base_id or block_id == 0:
+                return None
+            if block_id < base_id:
+                if not mainline:
+                    ancestor = base_id
+                    while ancestor is not None and ancestor > 0:
+                        mainline.add(ancestor)
+                        ancestor = key(int(rows[ancestor - 1][0]))
+                if block_id in mainline:
+                    return None
+            return key(int(rows[block_id - 1][0]))
+
+        def create(block_id, parent):
+            if block_id < 0:
+                block = new_block(parent, miners[hidden[block_id][1]])
+                if block_id in paid_hidden:
+                    block.set_paid()
+            else:
+                if block_id == 0:
+                    block = new_block(None, None, 0)
+                else:
+                    owner, depth = rows[block_id - 1][1:3].tolist()
+                    block = new_block(parent, miners[owner])
+                    if parent is None:
+                        block.depth = depth
+                    block.set_tstamp(block_id)
+                block.set_published()
+                if paid[block_id]:
+                    block.set_paid()
+                if block_id < base_id:
+                    dropped.add(block_id)
+            built[block_id] = block
+            return block
+
+        def lookup(block_id):
+            chain = []
+            while block_id is not None and block_id not in built:
+                parent_id = parent_key(block_id)
+                chain.append((block_id, parent_id))
+                block_id = parent_id
+            for chain_id, parent_id in reversed(chain):
+                create(chain_id, built[parent_id] if parent_id is not None else None)
+            return built[chain[0][0]] if chain else built[block_id]
+
+        create(base_id, None)
+        for start in range(base_id, self.block_rows, self.chunk_size):
+            for offset, (parent_ref, owner, depth, seq) in enumerate(rows[start:start + self.chunk_size].tolist()):
+                block_id = start + offset + 1
+                parent_id = key(parent_ref)
+                block = built[block_id] if block_id in built else create(block_id,
+                    lookup(parent_id) if parent_id is not None else None)
+                if parent_id is None or parent_id in dropped:
+                    dropped.add(block_id)
+                else:
+                    built[parent_id].add_child(block)
+
+        sim.hidden_blocks.clear()
+        for seq, parent_ref, owner in state['hidden']:
+            sim.hidden_blocks.count = seq
+            sim.hidden_blocks.append(lookup(HIDDEN - seq))
+        sim.hidden_blocks.count = state['hidden_count']
+        self.hidden = dict(sim.hidden_blocks.blocks)
+
+        for miner, miner_state in zip(sim.miners, state['miners']):
+            for name, value in decode(miner_state, lookup).items():
+                setattr(miner, name, value)
+
+        struct.base = built[base_id]
+        struct.depth = state['depth']
+        struct.last_tstamp = state['last_tstamp']
+        struct.frontier.clear()
+        for block_id in state['frontier']:
+            struct.frontier.add(lookup(block_id))
+        struct.safe_chain.clear()
+        struct.safe_chain.extend(lookup(block_id) for block_id in state['safe_chain'])
+        struct.block_numbers = state['block_numbers']
+        struct.payoffs = state['payoffs']
+        struct.published_numbers = state['published_numbers']
+        struct.pending_owners, struct.pending_tstamps, struct.pending_depths = state['pending']
+        struct.pruned_blocks, struct.pruned_orphans = state['pruned']
+        struct.branch_sums = None
+        if state['branch_sums'] is not None:
+            keys, sums = state['branch_sums']
+            struct.branch_sums = OrderedDict((lookup(block_id), row) for block_id, row in zip(keys, sums.tolist()))
+        struct.journal = []
+        struct.paid_journal = []
+
+        for name, value in state['propagation'].items():
+            setattr(sim.propagation, name, value)
+        sim.steps = state['steps']
+        sim.wall_time = state['wall_time']
+        sim.rng.set_state(state['rng'])
@@ -0,0 +1,626 @@
+"""Discrete-event mode for the simulations. In `blocksim.simulation.Simulation` every
+block is found in a step and published blocks reach every miner at once. An
+`EventSimulation` instead keeps a clock and a heap of pending events. Blocks are found
+after exponential inter-arrival times, so that each miner finds blocks at a rate
+proportional to its hash power, and published blocks and messages between miners
+arrive after a latency that can be different for every pair of miners.
+
+Each miner sees the structure through its own `View`, which only contains the blocks
+that have reached it, and which is given to its `strat`, `publish` and `inform`
+methods instead of the structure. Views behave like the structure for everything
+related to its tips (`depth`, `deep_blocks`, `random_deep_block` and the methods of
+`blocksim.simulation.Frontier`) and forward every other attribute to it. A miner
+that receives a block also learns its ancestors.
+
+Views are immutable and shared. A view is identified by its tips, and miners that
+have received the same blocks share the same view object, so that a block delivered
+to thousands of miners at once is applied once for each distinct view among them
+rather than once per miner. The view of each miner is kept as an id in a NumPy
+array, and the deliveries of a published block are grouped by arrival time, so each
+group of miners is updated with a single vectorized operation. Only miners that
+react to new blocks through the ``tip`` or ``depth`` events are called afterwards.
+
+Payoffs are computed on the structure that holds every published block, as in the
+step mode. Once every block has been found, the pending deliveries are completed
+and the simulation ends as in the step mode, with the propagation engine calling
+every miner with the whole structure."""
+
+from heapq import heappush, heappop
+from time import perf_counter
+
+import numpy as np
+
+from .payoff import alpha_beta_step_payoff
+from .progress import reporter
+from .simulation import Simulation
+
+
+FOUND = 0
+"""Kind of the events in which a miner finds a block."""
+
+DELIVERED = 1
+"""Kind of the events in which published blocks reach a group of miners."""
+
+INFORMED = 2
+"""Kind of the events in which hidden blocks communicated by a miner reach another
+one."""
+
+
+class View:
+
+    """Generate the view of the structure of one or more miners."""
+
+    __slots__ = ('views', 'leaves', 'depth', 'deep', 'id', 'next')
+
+    def __init__(self, views, leaves):
+
+        """Parameters
+        ----------
+
+        views : blocksim.events.Views
+            registry of the views of the simulation
+        leaves : frozenset
+            tips of the view, that is, the published blocks known by the miners
+            of the view whose children they don't know"""
+
+        self.views = views
+        self.leaves = leaves
+        self.depth = max(block.depth for block in leaves)
+        self.deep = sorted((block for block in leaves if block.depth == self.depth), key=lambda block: block.tstamp)
+        self.id = None
+        self.next = {}
+
+    @property
+    def deep_blocks(self):
+
+        """List of the deepest blocks of the view, in the order in which they were
+        published."""
+
+        return self.deep
+
+    @property
+    def frontier(self):
+
+        """The view itself, which follows the API of `blocksim.simulation.Frontier`."""
+
+        return self
+
+    def random_deep_block(self):
+
+        """Choose one of the deepest blocks of the view uniformly at random.
+
+        Results
+        -------
+
+        block : blocksim.simulation.Block
+            randomly chosen block among the deepest blocks of the view"""
+
+        if len(self.deep) == 1:
+            return self.deep[0]
+        return self.views.struct.rng.choice(self.deep)
+
+    def deepest(self):
+
+        """Get the deepest blocks of the view, in the order in which they were
+        published.
+
+        Results
+        -------
+
+        blocks : list
+            deepest blocks of the view"""
+
+        return self.deep
+
+    def peek(self):
+
+        """Get the deepest block of the view that was published first.
+
+        Results
+        -------
+
+        block : blocksim.simulation.Block
+            first published block among the deepest blocks of the view"""
+
+        return self.deep[0]
+
+    def tips(self, depth):
+
+        """Get the tips of the view at a given depth.
+
+        Parameters
+        ----------
+
+        depth : int
+            depth of the tips
+
+        Results
+        -------
+
+        blocks : list
+            tips at the given depth, in the order in which they were published"""
+
+        return sorted((block for block in self.leaves if block.depth == depth), key=lambda block: block.tstamp)
+
+    def within(self, distance):
+
+        """Get the tips of the view that are at most a given distance below its
+        deepest blocks, deepest first.
+
+        Parameters
+        ----------
+
+        distance : int
+            maximum distance between the depth of a tip and the depth of the
+            deepest blocks
+
+        Results
+        -------
+
+        blocks : list
+            tips at depths ``depth``, ``depth - 1``, ..., ``depth - distance``"""
+
+        return sorted((block for block in self.leaves if block.depth >= self.depth - distance),
+            key=lambda block: (-block.depth, block.tstamp))
+
+    def __iter__(self):
+        return iter(sorted(self.leaves, key=lambda block: (block.depth, block.tstamp)))
+
+    def __len__(self):
+        return len(self.leaves)
+
+    def __contains__(self, block):
+        return block in self.leaves
+
+    def __getattr__(self, name):
+        return getattr(self.views.struct, name)
+
+
+class Views:
+
+    """Generate the registry of the views of a simulation. Views are interned by
+    their tips, the transition of a view when it receives a block is computed once
+    and remembered, and the views that no miner holds are dropped from time to
+    time."""
+
+    def __init__(self, struct, horizon):
+
+        """Parameters
+        ----------
+
+        struct : blocksim.simulation.Structure
+            structure of the simulation
+        horizon : int
+            number of levels below its deepest blocks that a view keeps track
+            of. Tips further below are forgotten, which only matters to miners
+            that look for forks that far behind"""
+
+        self.struct = struct
+        self.horizon = horizon
+        self.interned = {}
+        self.views = []
+        self.limit = 1024
+
+    def intern(self, leaves):
+
+        """Get the view with the given tips, creating it if it doesn't exist.
+
+        Parameters
+        ----------
+
+        leaves : frozenset
+            tips of the view
+
+        Results
+        -------
+
+        view : blocksim.events.View
+            view with the given tips"""
+
+        view = self.interned.get(leaves)
+        if view is None:
+            view = self.interned[leaves] = View(self, leaves)
+            view.id = len(self.views)
+            self.views.append(view)
+        return view
+
+    def advance(self, view, blocks):
+
+        """Get the view that results from receiving some published blocks. A block
+        that is already known, or that is below the horizon of the view, leaves the
+        view as it is. Otherwise it becomes a tip and its ancestors stop being tips.
+
+        Parameters
+        ----------
+
+        view : blocksim.events.View
+            view that receives the blocks
+        blocks : list
+            received blocks, in order of publication
+
+        Results
+        -------
+
+        view : blocksim.events.View
+            resulting view"""
+
+        for block in blocks:
+            following = view.next.get(block)
+            if following is None:
+                ancestor = self.struct.ancestor
+                if block.depth < view.depth - self.horizon or any(tip.depth >= block.depth and
+                    ancestor(tip, block.depth) == block for tip in view.leaves):
+                    following = view
+                else:
+                    depth = max(view.depth, block.depth)
+                    leaves = [tip for tip in view.leaves if tip.depth >= depth - self.horizon and
+                        (tip.depth >= block.depth or ancestor(block, tip.depth) != tip)]
+                    leaves.append(block)
+                    following = self.intern(frozenset(leaves))
+                view.next[block] = following
+            view = following
+        return view
+
+    def compact(self, held):
+
+        """Drop the views that no miner holds and forget every transition, giving
+        new ids to the remaining views.
+
+        Parameters
+        ----------
+
+        held : numpy.ndarray
+            id of the view of each miner
+
+        Results
+        -------
+
+        held : numpy.ndarray
+            new id of the view of each miner"""
+
+        ids, inverse = np.unique(held, return_inverse=True)
+        self.views = [self.views[view_id] for view_id in ids]
+        self.interned = {}
+        for view_id, view in enumerate(self.views):
+            view.id = view_id
+            view.next = {}
+            self.interned[view.leaves] = view
+        self.limit = max(1024, 4 * len(self.views))
+        return inverse.reshape(held.shape)
+
+
+class EventSimulation(Simulation):
+
+    """Generate a simulation that runs as a sequence of timed events, with latency
+    between miners."""
+
+    def __init__(self, miners, h, step_nr, safe_dist=0, payoff=alpha_beta_step_payoff(1, 1, 1),
+        seed=None, chunk_size=None, prune_horizon=None, columnar=False, latency=0, block_interval=1,
+        view_horizon=16, payoffs=None, safe_dists=None):
+
+        """Parameters
+        ----------
+
+        miners : list
+            list of miners to participate in the simulation
+        h : dict
+            dictionary of pairs {miner name: hash power value}. Each miner
+            finds blocks at a rate proportional to its hash power value
+        step_nr : int
+            number of blocks to be found before the simulation ends
+        safe_dist : int
+            number indicating how many blocks have to be ahead of a certain
+            block in the blockchain for its payoff to be given out
+        payoff : blocksim.payoff.Payoff
+            payoff function for simulation blocks
+        seed : int
+            seed for every random draw of the simulation
+        chunk_size : int
+            if given, the random values are pre-drawn with NumPy in chunks of
+            this size
+        prune_horizon : int
+            if given, settled blocks far enough behind the deepest paid block
+            are dropped from the structure
+        columnar : bool
+            flag indicating whether blocks are kept in columns instead of one
+            object per block
+        latency : float or array_like
+            time it takes for published blocks and messages to reach a miner.
+            Either a single value for every pair of miners or a matrix whose
+            entry ``[i][j]`` is the latency from the i-th to the j-th miner of
+            `miners`. A miner knows its own blocks at once
+        block_interval : float
+            mean time between two blocks found by any of the miners
+        view_horizon : int
+            number of levels below its deepest blocks that the view of each
+            miner keeps track of, see `blocksim.events.Views`
+        payoffs : dict
+            dictionary of pairs ``name: payoff`` with other payoff functions to
+            settle the blocks with during the same run, see
+            `blocksim.settlement`
+        safe_dists : iterable
+            other safe distances to settle the blocks with during the same run"""
+
+        super().__init__(miners, h, step_nr, safe_dist, payoff, seed=seed, chunk_size=chunk_size,
+            prune_horizon=prune_horizon, columnar=columnar, fast_path=False, payoffs=payoffs,
+            safe_dists=safe_dists)
+
+        latency = np.asarray(latency, dtype=float)
+        if latency.ndim == 0:
+            latency = np.full((len(miners), len(miners)), float(latency))
+        if latency.shape != (len(miners), len(miners)):
+            raise ValueError("The latency has to be a single value or a square matrix with one row per miner")
+        self.latency = latency
+        self.block_interval = block_interval
+        self.time = 0.0
+        self.events = []
+        self.event_count = 0
+        self.deliveries = 0
+        self.routes = {}
+
+        self.views = Views(self.struct, view_horizon)
+        self.view_of = np.full(len(miners), self.views.intern(frozenset([self.struct.base])).id, dtype=np.intp)
+
+        ids = self.registry.ids
+        self.tip_mask = np.zeros(len(miners), dtype=bool)
+        self.tip_mask[[ids[miner.name] for miner in self.subscribers['tip']]] = True
+        self.depth_mask = np.zeros(len(miners), dtype=bool)
+        self.depth_mask[[ids[miner.name] for miner in self.subscribers['depth']]] = True
+        self.recalled = {ids[miner.name] for event in ('published', 'tip', 'depth') for miner in self.subscribers[event]}
+
+    def view(self, miner):
+
+        """Get the view of the structure of a miner.
+
+        Parameters
+        ----------
+
+        miner : blocksim.miners.Miner
+            miner whose view is requested
+
+        Results
+        -------
+
+        view : blocksim.events.View
+            view of the miner"""
+
+        return self.views.views[self.view_of[self.registry.ids[miner.name]]]
+
+    def schedule(self, time, kind, payload):
+
+        """Add an event to the heap of pending events.
+
+        Parameters
+        ----------
+
+        time : float
+            time of the event
+        kind : int
+            kind of the event, one of `FOUND`, `DELIVERED` and `INFORMED`
+        payload : object
+            data of the event"""
+
+        heappush(self.events, (time, self.event_count, kind, payload))
+        self.event_count += 1
+
+    def route(self, sender):
+
+        """Group the other miners by their latency from a miner, computing the
+        groups the first time they are needed.
+
+        Parameters
+        ----------
+
+        sender : int
+            id of the miner
+
+        Results
+        -------
+
+        route : list
+            list of pairs ``(latency, recipients)`` sorted by latency, where
+            ``recipients`` is an array with the ids of the miners with that
+            latency"""
+
+        route = self.routes.get(sender)
+        if route is None:
+            recipients = np.delete(np.arange(len(self.miners)), sender)
+            order = np.argsort(self.latency[sender, recipients], kind='stable')
+            recipients = recipients[order]
+            latencies, starts = np.unique(self.latency[sender, recipients], return_index=True)
+            route = self.routes[sender] = list(zip(latencies.tolist(), np.split(recipients, starts[1:])))
+        return route
+
+    def found(self, miner_id):
+
+        """Handle a block found by a miner. The miner chooses the parent of the
+        block with its own view and, if it reacts to its own blocks, is called
+        right away.
+
+        Parameters
+        ----------
+
+        miner_id : int
+            id of the miner"""
+
+        miner = self.registry.miners[miner_id]
+        parent = miner.strat(self.views.views[self.view_of[miner_id]])
+        self.add_hidden_block(miner, parent)
+        if miner in self.subscribers['own_block']:
+            self.react(miner_id)
+
+    def react(self, miner_id):
+
+        """Call the `publish` and `inform` methods of a miner with its view,
+        publishing and sending what it returns. Miners that react to the
+        publication of their own blocks or to new blocks are called again after
+        publishing, until they have nothing left to publish.
+
+        Parameters
+        ----------
+
+        miner_id : int
+            id of the miner"""
+
+        miner = self.registry.miners[miner_id]
+        while True:
+            view = self.views.views[self.view_of[miner_id]]
+            publish = miner.publish(view, False)
+            inform = miner.inform(view, False)
+            if inform:
+                for miner_name, blocks in inform.items():
+                    if blocks:
+                        receiver = self.registry.ids[miner_name]
+                        self.schedule(self.time + self.latency[miner_id, receiver], INFORMED,
+                            (receiver, list(blocks)))
+            if not publish:
+                return
+            self.publish(miner_id, publish)
+            if miner_id not in self.recalled:
+                return
+
+    def publish(self, miner_id, blocks):
+
+        """Publish blocks of a miner, adding them to the structure in the order in
+        which they were created. The miner knows them at once and the other
+        miners receive them after their latency. A single event is kept in the
+        heap for each publication, which delivers the blocks to each group of
+        miners with the same latency in turn.
+
+        Parameters
+        ----------
+
+        miner_id : int
+            id of the miner
+        blocks : iterable
+            blocks to publish"""
+
+        blocks = self.hidden_blocks.ordered(blocks)
+        for block in blocks:
+            self.struct.add_block(block)
+            self.hidden_blocks.remove(block)
+        self.view_of[miner_id] = self.views.advance(self.views.views[self.view_of[miner_id]], blocks).id
+        route = self.route(miner_id)
+        if route:
+            self.schedule(self.time + route[0][0], DELIVERED, (blocks, route, 0, self.time))
+
+    def deliver(self, blocks, recipients):
+
+        """Deliver published blocks to a group of miners, updating each distinct
+        view among them once, and call the miners whose view has changed and that
+        react to new blocks, in the order of their ids.
+
+        Parameters
+        ----------
+
+        blocks : list
+            published blocks, in order of publication
+        recipients : numpy.ndarray
+            ids of the miners that receive the blocks"""
+
+        views = self.views.views
+        self.deliveries += len(recipients)
+
+        if len(recipients) == 1:
+            miner_id = int(recipients[0])
+            view = views[self.view_of[miner_id]]
+            advanced = self.views.advance(view, blocks)
+            if advanced is not view:
+                self.view_of[miner_id] = advanced.id
+                if self.tip_mask[miner_id] or (self.depth_mask[miner_id] and advanced.depth > view.depth):
+                    self.react(miner_id)
+            return
+
+        held = self.view_of[recipients]
+        ids, inverse = np.unique(held, return_inverse=True)
+        advanced = [self.views.advance(views[view_id], blocks) for view_id in ids]
+        new_ids = np.array([view.id for view in advanced], dtype=np.intp)
+        if (new_ids == ids).all():
+            return
+
+        deeper = np.array([view.depth > views[view_id].depth for view, view_id in zip(advanced, ids)])
+        inverse = inverse.reshape(held.shape)
+        self.view_of[recipients] = new_ids[inverse]
+        changed = new_ids[inverse] != held
+        reacting = changed & (self.tip_mask[recipients] | (self.depth_mask[recipients] & deeper[inverse]))
+        for miner_id in np.sort(recipients[reacting]).tolist():
+            self.react(miner_id)
+
+    def inform_miner(self, receiver, blocks):
+
+        """Deliver hidden blocks communicated to a miner, calling it afterwards if
+        it reacts to messages.
+
+        Parameters
+        ----------
+
+        receiver : int
+            id of the miner that receives the blocks
+        blocks : list
+            communicated blocks"""
+
+        miner = self.registry.miners[receiver]
+        for block in blocks:
+            miner.add_known_block(block)
+            if self.struct.trace is not None:
+                self.struct.trace.informed(block, receiver)
+        self.propagation.informs += len(blocks)
+        if miner in self.subscribers['inform']:
+            self.react(receiver)
+
+    def simulate(self, progress=None, trace=None):
+
+        """Conducts the simulation, handling events in order of time until every
+        block has been found and every delivery has been completed. The miners are
+        then given the chance to publish their remaining blocks, as in the step
+        mode, and the simulation ends.
+
+        Parameters
+        ----------
+
+        progress : bool or blocksim.progress.Progress
+            progress reporter, see `blocksim.progress`, updated with the number
+            of blocks found
+        trace : blocksim.trace.Trace
+            trace to which a record is written for every block created,
+            published, communicated to a miner or paid, see `blocksim.trace`"""
+
+        if trace is not None:
+            trace.attach(self)
+
+        progress = reporter(progress)
+        self.started = perf_counter()
+        try:
+            if progress is not None:
+                progress.start(self.step_nr)
+
+            if self.steps < self.step_nr and not self.events:
+                self.schedule(self.time + self.rng.exponential(self.block_interval), FOUND, None)
+
+            while self.events:
+                self.time, _, kind, payload = heappop(self.events)
+                if kind == FOUND:
+                    self.found(self.rng.winner())
+                    self.steps += 1
+                    if self.steps < self.step_nr:
+                        self.schedule(self.time + self.rng.exponential(self.block_interval), FOUND, None)
+                    if progress is not None and (self.steps % progress.every == 0 or self.steps == self.step_nr):
+                        progress.update(self.steps)
+                elif kind == DELIVERED:
+                    blocks, route, group, published = payload
+                    if group + 1 < len(route):
+                        self.schedule(published + route[group + 1][0], DELIVERED, (blocks, route, group + 1, published))
+                    self.deliver(blocks, route[group][1])
+                else:
+                    self.inform_miner(*payload)
+                if len(self.views.views) > self.views.limit:
+                    self.view_of = self.views.compact(self.view_of)
+
+            if progress is not None:
+                progress.close()
+            self.uncover_on_end()
+        finally:
+            if trace is not None:
+                trace.detach()
+        self.wall_time += perf_counter() - self.started
+        self.started = None
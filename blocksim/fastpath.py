@@ -0,0 +1,270 @@
+"""Vectorized engine for simulations in which every miner is honest. When every miner
+is a plain `blocksim.miners.Miner` or `blocksim.miners.DefaultMiner`, each new block
+is published as soon as it is found, on top of the deepest block. Since that block
+becomes the only deepest block, there are never ties and the structure is a single
+branch: the block found in step ``k`` has depth and timestamp ``k`` and it is paid
+``safe_dist`` steps later. The whole run is then a sequence of weighted draws of the
+owner of each block, which this module does with NumPy in large chunks.
+
+The owners are drawn from the random stream of the simulation through
+`blocksim.randomness.RandomStream.draw_winners`, which leaves the stream as if the
+draws had been made one at a time, and the payoff of the paid blocks is computed in
+the same batches as in `blocksim.simulation.Structure.settle`. A run through this
+engine therefore gives the same results as through the general one, for the same
+seed. The structure only keeps the blocks that have not been paid yet, on top of
+the deepest paid block, as if it had been pruned (see
+`blocksim.simulation.Structure.prune`). The records of a `blocksim.trace.Trace` are
+also built for whole chunks of steps, in the order in which the general engine
+writes them."""
+
+import numpy as np
+
+from .miners import Miner, DefaultMiner
+from .simulation import Block
+from .trace import RECORD, CREATED, PUBLISHED, PAID
+
+
+HONEST_STRATEGIES = frozenset({Miner, DefaultMiner})
+"""Miner classes that publish every block instantly on top of the deepest block.
+Subclasses are not included, since they can override any of this behaviour."""
+
+
+def honest(sim):
+
+    """Check whether a simulation can be run through the vectorized engine, that
+    is, whether every miner follows one of `HONEST_STRATEGIES` and the simulation
+    hasn't started yet. Simulations that keep their blocks in a
+    `blocksim.store.ColumnarStore`, that evaluate their payoff one block at a time,
+    that keep the payoff of each branch or that settle their blocks under several
+    payoff functions or safe distances are run through the general engine.
+
+    Parameters
+    ----------
+
+    sim : blocksim.simulation.Simulation
+        simulation to check
+
+    Results
+    -------
+
+    honest : bool
+        flag indicating whether the vectorized engine can run the simulation"""
+
+    struct = sim.struct
+    policy = sim.propagation.policy
+    return all(type(miner) in HONEST_STRATEGIES for miner in sim.miners) and sim.steps == 0 and \
+        struct.depth == 0 and struct.store is None and struct.payoff.batched and \
+        struct.branch_sums is None and struct.journal is None and struct.settlements is None and \
+        (policy is None or not policy(0))
+
+
+def settle(struct, owners, first):
+
+    """Pay out consecutive blocks of the main branch, gathering them in the same
+    batches as `blocksim.simulation.Structure.settle`, so that the payoffs are
+    added up in the same order. Full batches are computed straight from the
+    arrays and the rest is left pending in the structure.
+
+    Parameters
+    ----------
+
+    struct : blocksim.simulation.Structure
+        data structure of the simulation
+    owners : numpy.ndarray
+        id of the owner of each block
+    first : int
+        depth of the first block, which is also its timestamp"""
+
+    batch = struct.settle_batch
+    miner_nr = len(struct.registry)
+    start = 0
+
+    if struct.pending_owners:
+        start = min(len(owners), batch - len(struct.pending_owners))
+        struct.pending_owners.extend(owners[:start].tolist())
+        struct.pending_tstamps.extend(range(first, first + start))
+        struct.pending_depths.extend(range(first, first + start))
+        if len(struct.pending_owners) >= batch:
+            struct.flush()
+
+    while len(owners) - start >= batch:
+        depths = np.arange(first + start, first + start + batch, dtype=np.int64)
+        block_numbers, payoffs = struct.payoff.settle(owners[start:start + batch], depths, depths, miner_nr)
+        struct.block_numbers += block_numbers
+        struct.payoffs += payoffs
+        start += batch
+
+    struct.pending_owners.extend(owners[start:].tolist())
+    struct.pending_tstamps.extend(range(first + start, first + len(owners)))
+    struct.pending_depths.extend(range(first + start, first + len(owners)))
+
+
+def build_branch(struct, genesis, owners, depth):
+
+    """Rebuild the blocks of the structure that have not been paid yet, on top of
+    the deepest paid block, and update the deepest blocks, the safe chain and the
+    pruning counters accordingly.
+
+    Parameters
+    ----------
+
+    struct : blocksim.simulation.Structure
+        data structure of the simulation
+    genesis : blocksim.simulation.Block
+        genesis block of the structure
+    owners : numpy.ndarray
+        id of the owner of each of the last ``safe_dist + 1`` blocks of the
+        branch, or of every block if there are less
+    depth : int
+        depth of the structure"""
+
+    miners = struct.registry.miners
+    paid = max(0, depth - struct.safe_dist)
+
+    if paid:
+        root = Block(None, miners[owners[0]], paid)
+        root.depth = paid
+        root.set_published()
+        root.set_paid()
+        owners = owners[1:]
+    else:
+        root = genesis
+        root.children = []
+
+    struct.base = root
+    struct.safe_chain.clear()
+    struct.safe_chain.append(root)
+    block = root
+    for tstamp, owner in enumerate(owners.tolist(), paid + 1):
+        child = Block(block, miners[owner], tstamp)
+        child.set_published()
+        block.add_child(child)
+        struct.safe_chain.append(child)
+        block = child
+
+    struct.frontier.clear()
+    struct.frontier.add(block)
+    struct.depth = depth
+    struct.last_tstamp = depth
+    struct.pruned_blocks = max(0, paid - 1)
+
+
+def trace_records(owners, paid_owners, first, safe_dist):
+
+    """Build the trace records of a chunk of steps. In each step the new block is
+    created, then published, and then the block found ``safe_dist`` steps
+    earlier, if any, is paid.
+
+    Parameters
+    ----------
+
+    owners : numpy.ndarray
+        id of the owner of the block found in each step of the chunk
+    paid_owners : numpy.ndarray
+        id of the owner of the block paid in each step of the chunk, which is
+        ignored for the steps in which no block is paid
+    first : int
+        first step of the chunk
+    safe_dist : int
+        distance at which blocks are paid
+
+    Results
+    -------
+
+    records : numpy.ndarray
+        array of `blocksim.trace.RECORD` items"""
+
+    steps = np.arange(first, first + len(owners), dtype=np.int64)
+    records = np.empty((len(owners), 3), dtype=RECORD)
+    records['receiver'] = -1
+    records['time'] = steps[:, None]
+    records['parent'] = -1
+
+    created, published, paid = records[:, 0], records[:, 1], records[:, 2]
+    for record, kind in ((created, CREATED), (published, PUBLISHED)):
+        record['kind'] = kind
+        record['owner'] = owners
+        record['depth'] = steps
+        record['block'] = steps
+        record['parent_tstamp'] = steps - 1
+    created['tstamp'] = -1
+    published['tstamp'] = steps
+
+    paid['kind'] = PAID
+    paid['owner'] = paid_owners
+    paid['depth'] = steps - safe_dist
+    paid['block'] = -1
+    paid['tstamp'] = steps - safe_dist
+    paid['parent_tstamp'] = -1
+
+    keep = np.ones(records.shape, dtype=bool)
+    keep[:, 2] = steps > safe_dist
+    return records[keep]
+
+
+def run_honest(sim, progress=None, chunk_size=1 << 20):
+
+    """Run every step of a simulation that passes `honest` through the vectorized
+    engine. The steps are run in chunks, after which the tables of the structure
+    are updated. The unpaid blocks are only rebuilt before updating the progress
+    reporter, so that it can take snapshots of the results, and at the end.
+
+    Parameters
+    ----------
+
+    sim : blocksim.simulation.Simulation
+        simulation to run
+    progress : blocksim.progress.Progress
+        progress reporter, updated every `every` steps
+    chunk_size : int
+        maximum number of steps run at once"""
+
+    struct = sim.struct
+    trace = struct.trace
+    propagation = sim.propagation
+    genesis = struct.base
+    miner_nr = len(sim.registry)
+    keep = struct.safe_dist + 1
+    tail = np.zeros(0, dtype=np.intp)
+
+    sim.vectorized = True
+    if progress is not None:
+        progress.start(sim.step_nr)
+
+    while sim.steps < sim.step_nr:
+        chunk = min(chunk_size, sim.step_nr - sim.steps)
+        if progress is not None:
+            chunk = min(chunk, progress.every - sim.steps % progress.every)
+
+        owners = sim.rng.draw_winners(chunk)
+        struct.published_numbers += np.bincount(owners, minlength=miner_nr)
+
+        # blocks[i] is the owner of the block at depth offset + i, and the block
+        # found in step k is paid in step k + safe_dist
+        blocks = np.concatenate((tail, owners))
+        offset = sim.steps + 1 - len(tail)
+        first_paid = max(1, sim.steps + 1 - struct.safe_dist)
+        last_paid = sim.steps + chunk - struct.safe_dist
+        if last_paid >= first_paid:
+            settle(struct, blocks[first_paid - offset:last_paid - offset + 1], first_paid)
+        if trace is not None:
+            paid = np.arange(sim.steps + 1, sim.steps + chunk + 1) - struct.safe_dist - offset
+            trace.extend(trace_records(owners, blocks[np.maximum(paid, 0)], sim.steps + 1, struct.safe_dist))
+        tail = blocks[-keep:]
+
+        sim.steps += chunk
+        sim.hidden_blocks.count += chunk
+        propagation.last_rounds = propagation.last_published = 1
+        propagation.last_informs = 0
+        propagation.runs += chunk
+        propagation.rounds += chunk
+        propagation.published += chunk
+        propagation.max_rounds = max(propagation.max_rounds, 1)
+
+        if progress is not None and (sim.steps % progress.every == 0 or sim.steps == sim.step_nr):
+            build_branch(struct, genesis, tail, sim.steps)
+            progress.update(sim.steps)
+
+    build_branch(struct, genesis, tail, sim.steps)
+    if progress is not None:
+        progress.close()
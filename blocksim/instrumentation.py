@@ -0,0 +1,186 @@
+"""Opt-in instrumentation of the phases of the simulation steps. An `Instrumentation`
+object given to `blocksim.simulation.Simulation.simulate` counts and times the
+drawing of the winner of each step, the `strat`, `publish` and `inform` methods of
+the miners, broken down by miner class, the creation of hidden blocks, the whole
+propagation of information after each step, `blocksim.simulation.Structure.add_block`,
+the payoff function, the running payoff sums of the branches that miners such as
+`blocksim.miners.DefaultMiner` compare and the propagation that ends the run. The
+payoff phase covers the blocks paid out, including the batches of the settlements
+under other payoff functions and safe distances, which the simulation flushes
+before the instrumentation is removed, while the values added to the branch sums
+and the comparison of the branches are counted in the branch payoff phase.
+
+Instead of checking whether it is enabled on every step, the instrumentation wraps
+the methods it times on the objects of the simulation when the run starts and
+removes the wrappers when it ends, so simulations that aren't instrumented run the
+same code as if this module didn't exist. The times of nested phases are included
+in the time of the phases that contain them, for example the time of `add_block` is
+part of the time of the propagation and includes the time of the payoff function.
+A call made while another call of its phase runs is left to the outer call.
+Runs through the vectorized engine of `blocksim.fastpath` have no steps to time, so
+instrumented simulations always go through the general engine."""
+
+from time import perf_counter
+
+
+PHASES = ('winner', 'strat', 'add_hidden_block', 'propagation', 'publish', 'inform', 'add_block', 'payoff', 'branch_payoff',
+    'end')
+"""Phases that are timed, in the order in which they are reported."""
+
+
+class Instrumentation:
+
+    """Generate an instrumentation layer that counts and times the phases of the
+    steps of the simulations it is attached to."""
+
+    def __init__(self):
+
+        """Start with every count and time at zero. The same object can be given
+        to several runs, whose counts and times are added up."""
+
+        self.phases = {phase: [0, 0.0, 0] for phase in PHASES if phase not in ('strat', 'publish', 'inform')}
+        self.miners = {}
+        self.wrapped = []
+
+    def timed(self, function, record, within=None):
+
+        """Wrap a function so that each call is counted and timed, unless it is
+        made while a call of the same phase, or of the phase given by ``within``,
+        is running.
+
+        Parameters
+        ----------
+
+        function : function
+            function to wrap
+        record : list
+            list ``[calls, seconds, running]`` to which each call is added, where
+            ``running`` is the number of calls in progress
+        within : list
+            record of a phase to which the calls made during its own calls are
+            left
+
+        Results
+        -------
+
+        wrapper : function
+            wrapped function"""
+
+        def wrapper(*args, **kwargs):
+            if record[2] or (within is not None and within[2]):
+                return function(*args, **kwargs)
+            record[2] += 1
+            started = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record[1] += perf_counter() - started
+                record[0] += 1
+                record[2] -= 1
+        return wrapper
+
+    def wrap(self, obj, name, record, within=None):
+
+        """Replace a method of an object by its timed version, keeping track of it
+        so that it can be removed by `detach`.
+
+        Parameters
+        ----------
+
+        obj : object
+            object whose method is wrapped
+        name : str
+            name of the method
+        record : list
+            list ``[calls, seconds, running]`` to which each call is added
+        within : list
+            record of a phase to which the calls made during its own calls are
+            left"""
+
+        setattr(obj, name, self.timed(getattr(obj, name), record, within))
+        self.wrapped.append((obj, name))
+
+    def attach(self, sim):
+
+        """Start timing the phases of a simulation.
+
+        Parameters
+        ----------
+
+        sim : blocksim.simulation.Simulation
+            simulation to instrument"""
+
+        self.wrap(sim.rng, 'winner', self.phases['winner'])
+        self.wrap(sim, 'add_hidden_block', self.phases['add_hidden_block'])
+        self.wrap(sim, 'check_publishable', self.phases['propagation'])
+        self.wrap(sim, 'uncover_on_end', self.phases['end'])
+        self.wrap(sim.struct, 'add_block', self.phases['add_block'])
+        self.wrap(sim.struct, 'add_values', self.phases['branch_payoff'])
+        self.wrap(sim.struct, 'best_branches', self.phases['branch_payoff'])
+        self.wrap(sim.struct.payoff, 'settle', self.phases['payoff'])
+        self.wrap(sim.struct.payoff, 'block_value', self.phases['payoff'], self.phases['branch_payoff'])
+        if sim.struct.settlements is not None:
+            self.wrap(sim.struct.settlements, 'flush', self.phases['payoff'])
+
+        for miner in sim.miners:
+            records = self.miners.setdefault(type(miner).__name__,
+                {method: [0, 0.0, 0] for method in ('strat', 'publish', 'inform')})
+            for method, record in records.items():
+                self.wrap(miner, method, record)
+
+    def detach(self):
+
+        """Stop timing, restoring the methods of the simulation."""
+
+        for obj, name in reversed(self.wrapped):
+            delattr(obj, name)
+        self.wrapped = []
+
+    def report(self):
+
+        """Summarize the calls and the time of each phase. The times of `strat`,
+        `publish` and `inform` are the sums over every miner class.
+
+        Results
+        -------
+
+        report : dict
+            dictionary with the key ``phases``, holding pairs ``phase: dict``, and
+            the key ``miners``, holding pairs ``class_name: {method: dict}``, where
+            each inner dictionary contains the number of calls (``calls``), the
+            total time in seconds (``time``) and the mean time per call
+            (``mean``)"""
+
+        def summary(record):
+            return {'calls': record[0], 'time': record[1], 'mean': record[1] / record[0] if record[0] else 0.0}
+
+        phases = {}
+        for phase in PHASES:
+            if phase in self.phases:
+                phases[phase] = summary(self.phases[phase])
+            else:
+                records = [methods[phase] for methods in self.miners.values()]
+                phases[phase] = summary([sum(record[0] for record in records), sum(record[1] for record in records)])
+
+        return {'phases': phases,
+            'miners': {name: {method: summary(record) for method, record in methods.items()}
+                for name, methods in self.miners.items()}}
+
+    def print_report(self):
+
+        """Prints the calls, the total time and the mean time per call of each
+        phase and of the methods of each miner class."""
+
+        report = self.report()
+
+        print("==========")
+        for phase, stats in report['phases'].items():
+            print("{}: {} calls, {:.3f}s ({:.2f} us/call)".format(phase, stats['calls'], stats['time'],
+                stats['mean'] * 1e6))
+        print("==========")
+        for name, methods in report['miners'].items():
+            print("Miner class: {}".format(name))
+            for method, stats in methods.items():
+                print("{}: {} calls, {:.3f}s ({:.2f} us/call)".format(method, stats['calls'], stats['time'],
+                    stats['mean'] * 1e6))
+            print("==========")
@@ -11,17 +11,29 @@ To create a new miner you need to create a class that inherits from the `Miner`
 class and overrides the methods you want to modify. Miner is a class model
 describing the different elements a miner has to possess to function with the
 implemented simulation. It implements the default strategy choosing randomly
-from the deepest blocks when there is a tie."""
+from the deepest blocks when there is a tie.
 
-from random import sample
+Each miner class can also declare, through the `events` class attribute, the
+events after which its `publish` and `inform` methods have to be called, so that
+the simulation doesn't call miners that have nothing to do. The available events
+are described in `blocksim.simulation.EVENTS`. A class that overrides `publish` or
+`inform` without declaring `events` is called after every event.
 
-from .simulation import Block
+Strategies that optimize a payoff, such as `DefaultMiner`, read it through
+`blocksim.simulation.Structure.branch_payoff`. When a simulation settles its blocks
+under several payoff functions, the `payoff` attribute of a miner names the one it
+optimizes, the payoff function of the simulation being used if it is None."""
+
+from .simulation import Block, HiddenBlocks
 
 class Miner:
 
     """Generate miner that uses the default strategy but when there is a tie in
     max depth the algorithm chooses randomly between the deepest blocks to mine."""
 
+    events = frozenset({'own_block'})
+    payoff = None
+
     def __init__(self, name):
 
         """Parameters
@@ -34,7 +46,7 @@ class Miner:
             called name."""
 
         self.name = name
-        self.hidden_blocks = []
+        self.hidden_blocks = HiddenBlocks()
         self.known_blocks = []
 
     def add_hidden_block(self, block):
@@ -58,7 +70,9 @@ class Miner:
     def delete_hidden_block(self, block):
 
         """This method is called when a miner chooses to publish a block so
-        that it can delete its reference from its hidden blocks.
+        that it can delete its reference from its hidden blocks. Hidden blocks
+        are kept in a `blocksim.simulation.HiddenBlocks` collection, so that
+        removing one takes constant time while keeping their order.
         
         Parameters
         ----------
@@ -101,7 +115,7 @@ class Miner:
         block : blocksim.simulation.Block
             block on top of which the current miner will place its next found block"""
 
-        return sample(struct.deep_blocks, 1)[0]
+        return struct.random_deep_block()
 
     def publish(self, struct, end=False):
 
@@ -125,7 +139,7 @@ class Miner:
             set containing the blocks that are to be published."""
 
         prev_blocks = self.hidden_blocks
-        self.hidden_blocks = []
+        self.hidden_blocks = HiddenBlocks()
         return set(prev_blocks)
 
     def inform(self, struct, end=False):
@@ -167,7 +181,8 @@ class DefaultMiner(Miner):
 
         """Choose a block to mine on top of. Choose the deepest block in the
         structure that belongs to the branch that maximizes the current miner's
-        payoff.
+        payoff from the common ancestor of the deepest blocks, as found by
+        `blocksim.simulation.Structure.best_branches`.
         
         Parameters
         ----------
@@ -181,31 +196,12 @@ class DefaultMiner(Miner):
         block : blocksim.simulation.Block
             chosen block to mine on top of"""
 
-        next_blocks = struct.deep_blocks.copy()
-
-        if len(next_blocks) > 1:
-            while len(next_blocks) > 1:
-                old_blocks = next_blocks
-                next_blocks = set()
-                for block in old_blocks:
-                    next_blocks.add(block.parent)
+        deep_blocks = struct.deep_blocks
+        if len(deep_blocks) == 1:
+            return deep_blocks[0]
 
-            common_block = next_blocks.pop()
-            block_payoff = {block: struct.payoff(block, common_block, struct.base)
-                for block in struct.deep_blocks}
-
-            for block in block_payoff:
-                if self.name not in block_payoff[block]:
-                    block_payoff[block][self.name] = {"block_number": 0, "payoff": 0}
-
-            max_payoff = max(block_payoff, key=lambda x: block_payoff[x][self.name]["payoff"])
-            max_payoff_blocks = set(filter(lambda x: block_payoff[x][self.name]["payoff"] == \
-                block_payoff[max_payoff][self.name]["payoff"], struct.deep_blocks))
-            sel_block = max_payoff_blocks.pop()
-        else:
-            sel_block = next_blocks.pop()
-
-        return sel_block
+        max_payoff_blocks = struct.best_branches(deep_blocks, self)
+        return struct.rng.choice(max_payoff_blocks) if len(max_payoff_blocks) > 1 else max_payoff_blocks[0]
 
 
 class SelfishMiner(Miner):
@@ -217,6 +213,8 @@ class SelfishMiner(Miner):
     ``n - 2``, the miner discloses every block that has a depth of ``n - 1``
     or less."""
 
+    events = frozenset({'own_block', 'published', 'depth'})
+
     def __init__(self, name):
 
         """Parameters
@@ -250,15 +248,13 @@ class SelfishMiner(Miner):
 
         if self.hidden_blocks:
             return self.hidden_blocks[-1]
-        
-        next_blocks = struct.deep_blocks.copy()
 
         if self.last_published is not None and self.last_published.depth == struct.depth:
             if len(struct.deep_blocks) == 1:
                 self.just_forked = True
             sel_block = self.last_published
         else:
-            sel_block = next_blocks.pop()
+            sel_block = struct.random_deep_block()
             self.just_forked = True
 
         return sel_block
@@ -286,7 +282,7 @@ class SelfishMiner(Miner):
 
         if end:
             prev_blocks = self.hidden_blocks
-            self.hidden_blocks = list(filter(lambda x: x.parent.is_hidden(), self.hidden_blocks))
+            self.hidden_blocks = HiddenBlocks(filter(lambda x: x.parent.is_hidden(), self.hidden_blocks))
             return set(filter(lambda x: not x.parent.is_hidden(), prev_blocks))
 
         if self.just_forked:
@@ -297,7 +293,7 @@ class SelfishMiner(Miner):
             if self.hidden_blocks == [self.first_block]:
                 if self.first_block.depth == struct.depth:
                     prev_blocks = self.hidden_blocks
-                    self.hidden_blocks = []
+                    self.hidden_blocks = HiddenBlocks()
                     self.last_published = self.first_block
                     return set(prev_blocks)
                 else:
@@ -305,13 +301,13 @@ class SelfishMiner(Miner):
             else:
                 if self.hidden_blocks[-1].depth <= struct.depth + 1:
                     prev_blocks = self.hidden_blocks
-                    self.hidden_blocks = list(filter(lambda x: x.parent.is_hidden(), self.hidden_blocks))
+                    self.hidden_blocks = HiddenBlocks(filter(lambda x: x.parent.is_hidden(), self.hidden_blocks))
                     publish = set(filter(lambda x: not x.parent.is_hidden(), prev_blocks))
                     self.last_published = max(publish, key=lambda x: x.depth)
                     return publish
                 else:
                     prev_blocks = self.hidden_blocks
-                    self.hidden_blocks = list(filter(lambda x: x.parent.is_hidden() or x.depth > struct.depth, self.hidden_blocks))
+                    self.hidden_blocks = HiddenBlocks(filter(lambda x: x.parent.is_hidden() or x.depth > struct.depth, self.hidden_blocks))
                     publish = set(filter(lambda x: not x.parent.is_hidden() and x.depth <= struct.depth, prev_blocks))
                     self.last_published = max(publish, default=self.last_published, key=lambda x: x.depth)
                     return publish
@@ -324,6 +320,8 @@ class AlwaysForkMiner(Miner):
     miner mines on top of the genesis block. After that, they only mine on
     top of the last block they have placed in the structure."""
 
+    events = frozenset({'own_block'})
+
     def __init__(self, name):
 
         """Parameters
@@ -356,9 +354,7 @@ class AlwaysForkMiner(Miner):
         if self.last_block:
             return self.last_block
         else:
-            block = struct.deep_blocks.pop()
-            struct.deep_blocks.add(block)
-            return block
+            return struct.random_deep_block()
 
     def publish(self, struct, end=False):
 
@@ -382,7 +378,7 @@ class AlwaysForkMiner(Miner):
         if self.hidden_blocks:
             self.last_block = self.hidden_blocks[-1]
             prev_blocks = self.hidden_blocks
-            self.hidden_blocks = []
+            self.hidden_blocks = HiddenBlocks()
             return set(prev_blocks)
         else:
             return set()
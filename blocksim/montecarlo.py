@@ -0,0 +1,284 @@
+"""Tools for repeating a simulation many times to estimate the distribution of its
+results. `run_trials` runs independent replicas of the same configuration across a
+process pool and aggregates the share of blocks and the share of payoff obtained by
+each miner in each replica.
+
+Miners are created inside each worker process through a factory, which has to be a
+function defined at module level so that it can be sent to the worker processes.
+Each replica gets a seed derived from the seed of the experiment, so the whole set
+of replicas is reproducible."""
+
+from concurrent.futures import ProcessPoolExecutor
+from math import erf, sqrt
+from os import cpu_count
+
+import numpy as np
+
+from .payoff import alpha_beta_step_payoff
+from .simulation import Simulation
+
+
+def normal_quantile(p):
+
+    """Compute the quantile of the standard normal distribution for a probability,
+    by bisection on its cumulative distribution function.
+    
+    Parameters
+    ----------
+    
+    p : float
+        probability, strictly between 0 and 1
+        
+    Results
+    -------
+    
+    z : float
+        value below which a standard normal variable falls with probability `p`"""
+
+    low, high = -40.0, 40.0
+    for _ in range(100):
+        middle = (low + high) / 2
+        if (1 + erf(middle / sqrt(2))) / 2 < p:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+
+def run_trial(config):
+
+    """Run a single replica of a simulation and compute the shares obtained by
+    each miner.
+    
+    Parameters
+    ----------
+    
+    config : tuple
+        tuple ``(miners_factory, h, step_nr, safe_dist, payoff, seed, chunk_size, progress)``
+        describing the replica, where ``progress`` is its progress reporter or None
+        
+    Results
+    -------
+    
+    shares : tuple
+        tuple ``(names, block_shares, payoff_shares)`` with the name of each miner
+        and the share of blocks and payoff it obtained"""
+
+    miners_factory, h, step_nr, safe_dist, payoff, seed, chunk_size, progress = config
+
+    sim = Simulation(miners_factory(), h, step_nr, safe_dist, payoff, seed=seed, chunk_size=chunk_size)
+    sim.simulate(progress)
+
+    results = sim.results()
+    return results.names, results.block_shares, results.payoff_shares
+
+
+class TrialsResult:
+
+    """Generate the aggregated results of a set of replicas of a simulation."""
+
+    def __init__(self, names, block_shares, payoff_shares):
+
+        """Parameters
+        ----------
+        
+        names : list
+            name of each miner
+        block_shares : numpy.ndarray
+            array of shape ``(trials, miners)`` with the share of blocks obtained
+            by each miner in each replica
+        payoff_shares : numpy.ndarray
+            array of shape ``(trials, miners)`` with the share of payoff obtained
+            by each miner in each replica"""
+
+        self.names = names
+        self.block_shares = block_shares
+        self.payoff_shares = payoff_shares
+        self.trials = len(block_shares)
+
+    def stats(self, shares, confidence=0.95):
+
+        """Compute the mean, the variance and the confidence interval of the mean
+        of each column of an array of shares, using a normal approximation.
+        
+        Parameters
+        ----------
+        
+        shares : numpy.ndarray
+            array of shape ``(trials, miners)``
+        confidence : float
+            confidence level of the intervals
+            
+        Results
+        -------
+        
+        stats : dict
+            dictionary of pairs ``miner_name: {'mean': float, 'var': float, 'ci': (float, float)}``"""
+
+        mean = shares.mean(axis=0)
+        var = shares.var(axis=0, ddof=1) if self.trials > 1 else np.zeros(len(self.names))
+        half_width = normal_quantile((1 + confidence) / 2) * np.sqrt(var / self.trials)
+
+        return {name: {'mean': float(mean[i]), 'var': float(var[i]),
+            'ci': (float(mean[i] - half_width[i]), float(mean[i] + half_width[i]))}
+            for i, name in enumerate(self.names)}
+
+    def summary(self, confidence=0.95):
+
+        """Compute the statistics of the block share and the payoff share of
+        each miner.
+        
+        Parameters
+        ----------
+        
+        confidence : float
+            confidence level of the intervals
+            
+        Results
+        -------
+        
+        summary : dict
+            dictionary of pairs ``miner_name: {'block_share': dict, 'payoff_share': dict}``,
+            where each inner dictionary contains the mean, the variance and the
+            confidence interval of the share"""
+
+        block_stats = self.stats(self.block_shares, confidence)
+        payoff_stats = self.stats(self.payoff_shares, confidence)
+
+        return {name: {'block_share': block_stats[name], 'payoff_share': payoff_stats[name]}
+            for name in self.names}
+
+    def print_results(self, confidence=0.95):
+
+        """Prints the mean and the confidence interval of the block share and
+        the payoff share of each miner.
+        
+        Parameters
+        ----------
+        
+        confidence : float
+            confidence level of the intervals"""
+
+        summary = self.summary(confidence)
+
+        print("==========")
+        print("Trials: {}".format(self.trials))
+        print("==========")
+        for name in self.names:
+            print("Miner: {}".format(name))
+            for label, key in (("Block Share", "block_share"), ("Payoff Share", "payoff_share")):
+                stats = summary[name][key]
+                print("{}: {:.2f}% ({:.0f}% CI: {:.2f}% - {:.2f}%)".format(label, stats["mean"] * 100,
+                    confidence * 100, stats["ci"][0] * 100, stats["ci"][1] * 100))
+            print("==========")
+
+
+class MonteCarlo:
+
+    """Generate an experiment that runs independent replicas of a simulation
+    configuration."""
+
+    def __init__(self, miners_factory, h, step_nr, safe_dist=0, payoff=alpha_beta_step_payoff(1, 1, 1),
+        seed=None, chunk_size=None):
+
+        """Parameters
+        ----------
+        
+        miners_factory : function
+            function without arguments that returns the list of miners to
+            participate in a replica. It has to be defined at module level
+            for the replicas to run in other processes
+        h : dict
+            dictionary of pairs {miner name: hash power value}
+        step_nr : int
+            number of blocks to generate in each replica
+        safe_dist : int
+            number indicating how many blocks have to be ahead of a certain
+            block in the blockchain for its payoff to be given out
+        payoff : blocksim.payoff.Payoff
+            payoff function for simulation blocks
+        seed : int
+            seed from which the seed of each replica is derived
+        chunk_size : int
+            chunk size for pre-drawing random values in each replica"""
+
+        self.miners_factory = miners_factory
+        self.h = h
+        self.step_nr = step_nr
+        self.safe_dist = safe_dist
+        self.payoff = payoff
+        self.seed = seed
+        self.chunk_size = chunk_size
+
+    def seeds(self, trials):
+
+        """Derive a deterministic seed for each replica from the seed of the
+        experiment.
+        
+        Parameters
+        ----------
+        
+        trials : int
+            number of replicas
+            
+        Results
+        -------
+        
+        seeds : list
+            seed of each replica"""
+
+        return [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(self.seed).spawn(trials)]
+
+    def run(self, trials, processes=None, progress=None):
+
+        """Run the replicas, distributing them across a process pool.
+        
+        Parameters
+        ----------
+        
+        trials : int
+            number of replicas to run
+        processes : int
+            number of worker processes. Defaults to the number of processors
+            of the machine. If it is 1 the replicas run in the current process
+        progress : blocksim.progress.SharedCounter
+            counters with at least one slot per replica, to which each replica
+            writes the number of steps it has done. The parent process can read
+            their total while the replicas run
+            
+        Results
+        -------
+        
+        result : blocksim.montecarlo.TrialsResult
+            aggregated results of the replicas"""
+
+        configs = [(self.miners_factory, self.h, self.step_nr, self.safe_dist, self.payoff, seed, self.chunk_size,
+            progress.reporter(trial) if progress is not None else None)
+            for trial, seed in enumerate(self.seeds(trials))]
+
+        processes = processes or cpu_count()
+
+        if processes == 1:
+            results = list(map(run_trial, configs))
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                results = list(executor.map(run_trial, configs, chunksize=max(1, trials // (4 * processes))))
+
+        names = results[0][0]
+        return TrialsResult(names, np.array([result[1] for result in results]), np.array([result[2] for result in results]))
+
+
+def run_trials(miners_factory, h, step_nr, trials, safe_dist=0, payoff=alpha_beta_step_payoff(1, 1, 1),
+    seed=None, chunk_size=None, processes=None, progress=None):
+
+    """Run independent replicas of a simulation configuration across a process
+    pool and aggregate their results. See `blocksim.montecarlo.MonteCarlo` for a
+    description of the parameters.
+    
+    Results
+    -------
+    
+    result : blocksim.montecarlo.TrialsResult
+        aggregated results of the replicas"""
+
+    return MonteCarlo(miners_factory, h, step_nr, safe_dist, payoff, seed, chunk_size).run(trials, processes, progress)
@@ -1,79 +1,192 @@
-"""Standard payoff functions for conducting the experiments. Each function receives
-a starting block and an ending block and returns the payoff corresponding to each miner
-for the branch between both blocks. The `start_block` is the deepest block in the
-branch and the `end_block` is the shallowest."""
+"""Standard payoff functions for conducting the experiments. Each payoff function
+is an instance of `Payoff` that can be called with a starting block and an ending
+block and returns the payoff corresponding to each miner for the branch between
+both blocks. The `start_block` is the deepest block in the branch and the
+`end_block` is the shallowest.
 
-def constant_payoff(start_block, end_block, base):
+Besides this, every payoff function can settle a whole batch of confirmed blocks
+at once through `Payoff.settle`, which receives arrays with the owner index, the
+timestamp and the depth of each block and evaluates them with NumPy. The
+simulation uses it to pay out blocks in batches. To create a custom payoff function
+you need to create a class that inherits from `Payoff` and implements the
+`Payoff.values` method. Plain functions following the old calling convention are
+still accepted by the simulation, which wraps them with `CallablePayoff`."""
+
+import numpy as np
+
+
+def branch_payoff(block_value, start_block, end_block, base):
+
+    """Add up the value of each block in the branch that exists between
+    `start_block` and `end_block`, including both ends.
 
-    """Payoff function that assigns a constant value for each block in the
-    branch that exists between `start_block` and `end_block`, including
-    both ends.
-    
     Parameters
     ----------
-    
+
+    block_value : function
+        function that receives a block and returns its payoff
     start_block : blocksim.simulation.Block
         deepest block in the branch
     end_block : blocksim.simulation.Block
         shallowest block in the branch
     base : blocksim.simulation.Block
         root of the structure. Used if `start_block` and `end_block`
-        are not on the same branch as an ending condition for the calculation
-        
+        are not on the same branch as an ending condition for the calculation.
+        The walk also stops at any block without a parent, which is the case
+        for roots left behind when the structure is pruned
+
     Results
     -------
-    
+
     payoff_dict : dict
         dictionary that contains the information regarding payoff and number
         of blocks owned by each miner in the branch"""
 
     payoff_dict = {}
-    
+
     block = start_block
 
-    while (block != end_block.parent) and (block != base):
+    while (block != end_block.parent) and (block != base) and (block.parent is not None):
         if block.owner.name not in payoff_dict:
             payoff_dict[block.owner.name] = {"block_number": 0, "payoff": 0}
         payoff_dict[block.owner.name]["block_number"] += 1
-        payoff_dict[block.owner.name]["payoff"] += 1
+        payoff_dict[block.owner.name]["payoff"] += block_value(block)
         block = block.parent
 
     return payoff_dict
 
-def alpha_beta_step_payoff(alpha, beta, step):
 
-    """Payoff function factory. This function creates a payoff function using the
-    given parameters.
-    
-    Parameters
-    ----------
-    
-    alpha : float
-        number that accounts for the devaluation of money over time
-    beta : float
-        number that accounts for the diminishment of the payoff for each block in
-        the Bitcoin structure after a certain amount of blocks have been created
-    step : int
-        amount of blocks in the blockchain after which the payoff for each block
-        diminishes
-        
-    Results
-    -------
-    
-    ab_payoff : function
-        payoff function that uses the given parameters for the described
-        purposes"""
+class PowerTable:
+
+    """Generate a table of the powers of a number. The powers are computed as the
+    product of two cached tables, one for the low bits of the exponent and one for
+    the high bits, so that the table stays small for large exponents. The table of
+    high powers grows as larger exponents are requested."""
+
+    low_bits = 12
+
+    def __init__(self, base):
+
+        """Parameters
+        ----------
+
+        base : float
+            number to be raised to the requested exponents"""
+
+        self.base = base
+        self.low = base ** np.arange(1 << self.low_bits, dtype=float)
+        self.high = np.ones(1)
+
+    def __getitem__(self, exponents):
+
+        """Raise the base of the table to each of the given exponents.
+
+        Parameters
+        ----------
+
+        exponents : numpy.ndarray
+            array of non-negative integer exponents
+
+        Results
+        -------
+
+        powers : numpy.ndarray
+            array with the base raised to each exponent"""
+
+        if self.base == 1:
+            return np.ones(len(exponents))
+
+        high_exponents = exponents >> self.low_bits
+        if len(exponents) and high_exponents.max() >= len(self.high):
+            size = max(2 * len(self.high), int(high_exponents.max()) + 1)
+            self.high = self.base ** (np.arange(size, dtype=float) * (1 << self.low_bits))
+
+        return self.high[high_exponents] * self.low[exponents & ((1 << self.low_bits) - 1)]
+
+
+class Payoff:
+
+    """Payoff function model. Each block is assigned a value that depends on its
+    timestamp and its depth, and the payoff of a miner is the sum of the values of
+    its blocks."""
+
+    batched = True
+
+    def values(self, tstamps, depths):
+
+        """Compute the value of a batch of blocks.
+
+        Parameters
+        ----------
+
+        tstamps : numpy.ndarray
+            timestamp of each block
+        depths : numpy.ndarray
+            depth of each block
+
+        Results
+        -------
+
+        values : numpy.ndarray
+            value of each block"""
+
+        raise NotImplementedError
+
+    def block_value(self, block):
+
+        """Compute the value of a single block.
+
+        Parameters
+        ----------
+
+        block : blocksim.simulation.Block
+            block to evaluate
+
+        Results
+        -------
+
+        value : float
+            value of the block"""
+
+        return float(self.values(np.array([block.tstamp]), np.array([block.depth]))[0])
+
+    def settle(self, owners, tstamps, depths, miner_nr):
+
+        """Compute the number of blocks and the payoff of each miner for a batch
+        of confirmed blocks.
+
+        Parameters
+        ----------
+
+        owners : list
+            index of the owner of each block
+        tstamps : list
+            timestamp of each block
+        depths : list
+            depth of each block
+        miner_nr : int
+            number of miners
+
+        Results
+        -------
+
+        block_numbers : numpy.ndarray
+            number of blocks owned by each miner
+        payoffs : numpy.ndarray
+            payoff of each miner"""
+
+        owners = np.asarray(owners, dtype=np.intp)
+        values = self.values(np.asarray(tstamps, dtype=np.int64), np.asarray(depths, dtype=np.int64))
+        return np.bincount(owners, minlength=miner_nr), np.bincount(owners, weights=values, minlength=miner_nr)
 
-    def ab_payoff(start_block, end_block, base):
+    def __call__(self, start_block, end_block, base):
+
+        """Compute the payoff for the branch that exists between `start_block`
+        and `end_block`, including both ends.
 
-        """Payoff function that assigns a value for each block in the
-        branch that exists between `start_block` and `end_block`,
-        including both ends accounting for devaulation of money and
-        diminishment of payoff in the Bitcoin structure over time.
-        
         Parameters
         ----------
-        
+
         start_block : blocksim.simulation.Block
             deepest block in the branch
         end_block : blocksim.simulation.Block
@@ -81,24 +194,161 @@ def alpha_beta_step_payoff(alpha, beta, step):
         base : blocksim.simulation.Block
             root of the structure. Used if `start_block` and `end_block`
             are not on the same branch as an ending condition for the calculation
-            
+
         Results
         -------
-        
+
         payoff_dict : dict
             dictionary that contains the information regarding payoff and number
             of blocks owned by each miner in the branch"""
 
-        payoff_dict = {}
-        
-        block = start_block
+        return branch_payoff(self.block_value, start_block, end_block, base)
+
+
+class CallablePayoff(Payoff):
+
+    """Adapter for payoff functions that follow the old calling convention, that
+    is, functions that receive a starting block, an ending block and the root of
+    the structure and return a dictionary with the payoff of each miner. Blocks
+    are evaluated one at a time by calling the function on a single block branch."""
+
+    batched = False
+
+    def __init__(self, function):
+
+        """Parameters
+        ----------
+
+        function : function
+            payoff function with signature ``function(start_block, end_block, base)``"""
+
+        self.function = function
+
+    def block_value(self, block):
+
+        """Compute the value of a single block.
+
+        Parameters
+        ----------
+
+        block : blocksim.simulation.Block
+            block to evaluate
+
+        Results
+        -------
+
+        value : float
+            value of the block"""
+
+        payoff_dict = self.function(block, block, None)
+        return payoff_dict[block.owner.name]["payoff"] if block.owner.name in payoff_dict else 0
+
+    def __call__(self, start_block, end_block, base):
+
+        """Compute the payoff for the branch that exists between `start_block`
+        and `end_block` using the wrapped function."""
+
+        return self.function(start_block, end_block, base)
+
+
+class ConstantPayoff(Payoff):
+
+    """Payoff function that assigns a constant value for each block in the
+    branch that exists between `start_block` and `end_block`, including
+    both ends."""
+
+    def values(self, tstamps, depths):
+
+        """Compute the value of a batch of blocks, which is always 1."""
+
+        return np.ones(len(tstamps))
+
+    def block_value(self, block):
+
+        """Compute the value of a single block, which is always 1."""
+
+        return 1
+
+
+class AlphaBetaStepPayoff(Payoff):
+
+    """Payoff function that assigns a value for each block in the
+    branch that exists between `start_block` and `end_block`,
+    including both ends accounting for devaulation of money and
+    diminishment of payoff in the Bitcoin structure over time. The
+    value of a block is ``(alpha**tstamp)*(beta**(depth // step))``."""
+
+    def __init__(self, alpha, beta, step):
 
-        while (block != end_block.parent) and (block != base):
-            if block.owner.name not in payoff_dict:
-                payoff_dict[block.owner.name] = {"block_number": 0, "payoff": 0}
-            payoff_dict[block.owner.name]["block_number"] += 1
-            payoff_dict[block.owner.name]["payoff"] += (alpha**block.tstamp)*(beta**(block.depth // step))
-            block = block.parent
+        """Parameters
+        ----------
+
+        alpha : float
+            number that accounts for the devaluation of money over time
+        beta : float
+            number that accounts for the diminishment of the payoff for each block in
+            the Bitcoin structure after a certain amount of blocks have been created
+        step : int
+            amount of blocks in the blockchain after which the payoff for each block
+            diminishes"""
+
+        self.alpha = alpha
+        self.beta = beta
+        self.step = step
+        self.alpha_powers = PowerTable(alpha)
+        self.beta_powers = PowerTable(beta)
+
+    def values(self, tstamps, depths):
+
+        """Compute the value of a batch of blocks using the cached power tables.
+
+        Parameters
+        ----------
+
+        tstamps : numpy.ndarray
+            timestamp of each block
+        depths : numpy.ndarray
+            depth of each block
+
+        Results
+        -------
+
+        values : numpy.ndarray
+            value of each block"""
+
+        return self.alpha_powers[tstamps] * self.beta_powers[depths // self.step]
+
+    def block_value(self, block):
+
+        """Compute the value of a single block."""
+
+        return (self.alpha**block.tstamp)*(self.beta**(block.depth // self.step))
+
+
+constant_payoff = ConstantPayoff()
+
+def alpha_beta_step_payoff(alpha, beta, step):
+
+    """Payoff function factory. This function creates a payoff function using the
+    given parameters.
+
+    Parameters
+    ----------
+
+    alpha : float
+        number that accounts for the devaluation of money over time
+    beta : float
+        number that accounts for the diminishment of the payoff for each block in
+        the Bitcoin structure after a certain amount of blocks have been created
+    step : int
+        amount of blocks in the blockchain after which the payoff for each block
+        diminishes
+
+    Results
+    -------
+
+    ab_payoff : blocksim.payoff.AlphaBetaStepPayoff
+        payoff function that uses the given parameters for the described
+        purposes"""
 
-        return payoff_dict
-    return ab_payoff
\ No newline at end of file
+    return AlphaBetaStepPayoff(alpha, beta, step)
@@ -0,0 +1,290 @@
+"""Progress reporting for the simulations. A reporter is told how many steps a
+simulation has done every `every` steps, so the simulation loop runs in chunks and
+reporting adds no per-step cost. A simulation without a reporter runs its steps in
+a single plain loop.
+
+`TqdmProgress` displays a progress bar, `CallbackProgress` calls a function and
+`SharedProgress` writes the number of steps done to a slot of a `SharedCounter`,
+which a parent process can read to follow the progress of many worker processes
+at once. Custom reporters inherit from `Progress` and override its methods.
+`SharedCounter` and `SharedProgress` rely on `multiprocessing.shared_memory`, which
+needs Python 3.8, while the rest of the module works on older versions."""
+
+import numpy as np
+from tqdm import tqdm
+
+
+class Progress:
+
+    """Progress reporter model. It reports nothing."""
+
+    def __init__(self, every=1024):
+
+        """Parameters
+        ----------
+
+        every : int
+            number of steps between consecutive updates"""
+
+        self.every = every
+
+    def start(self, total):
+
+        """This method is called before the first step of a simulation.
+
+        Parameters
+        ----------
+
+        total : int
+            number of steps of the simulation"""
+
+        pass
+
+    def update(self, done):
+
+        """This method is called every `every` steps and after the last one.
+
+        Parameters
+        ----------
+
+        done : int
+            number of steps done so far"""
+
+        pass
+
+    def close(self):
+
+        """This method is called after the last step of a simulation."""
+
+        pass
+
+
+class TqdmProgress(Progress):
+
+    """Generate a reporter that displays a tqdm progress bar."""
+
+    def start(self, total):
+
+        """Open the progress bar.
+
+        Parameters
+        ----------
+
+        total : int
+            number of steps of the simulation"""
+
+        self.bar = tqdm(total=total)
+
+    def update(self, done):
+
+        """Move the progress bar.
+
+        Parameters
+        ----------
+
+        done : int
+            number of steps done so far"""
+
+        self.bar.update(done - self.bar.n)
+
+    def close(self):
+
+        """Close the progress bar."""
+
+        self.bar.close()
+
+
+class CallbackProgress(Progress):
+
+    """Generate a reporter that calls a function periodically."""
+
+    def __init__(self, callback, every=1024):
+
+        """Parameters
+        ----------
+
+        callback : function
+            function with signature ``callback(done, total)``
+        every : int
+            number of steps between consecutive calls"""
+
+        super().__init__(every)
+        self.callback = callback
+        self.total = 0
+
+    def start(self, total):
+
+        """Save the number of steps of the simulation.
+
+        Parameters
+        ----------
+
+        total : int
+            number of steps of the simulation"""
+
+        self.total = total
+
+    def update(self, done):
+
+        """Call the function with the progress of the simulation.
+
+        Parameters
+        ----------
+
+        done : int
+            number of steps done so far"""
+
+        self.callback(done, self.total)
+
+
+class SharedCounter:
+
+    """Generate an array of step counters in shared memory. Each simulation writes
+    to its own slot, so no locks are needed, and the parent process adds them up."""
+
+    def __init__(self, slots):
+
+        """Parameters
+        ----------
+
+        slots : int
+            number of counters, usually one per simulation"""
+
+        # imported here because multiprocessing.shared_memory needs Python 3.8
+        from multiprocessing import shared_memory
+
+        self.slots = slots
+        self.memory = shared_memory.SharedMemory(create=True, size=8 * max(1, slots))
+        self.counts = np.ndarray((slots,), dtype=np.int64, buffer=self.memory.buf)
+        self.counts[:] = 0
+
+    def reporter(self, slot, every=1024):
+
+        """Create a reporter that writes to one of the counters. The reporter can
+        be sent to another process.
+
+        Parameters
+        ----------
+
+        slot : int
+            index of the counter
+        every : int
+            number of steps between consecutive updates
+
+        Results
+        -------
+
+        reporter : blocksim.progress.SharedProgress
+            reporter for the counter"""
+
+        return SharedProgress(self.memory.name, slot, every)
+
+    def total(self):
+
+        """Add up the counters.
+
+        Results
+        -------
+
+        total : int
+            number of steps done by every simulation"""
+
+        return int(self.counts.sum())
+
+    def close(self):
+
+        """Release the shared memory. The counters can't be used afterwards."""
+
+        del self.counts
+        self.memory.close()
+        self.memory.unlink()
+
+
+class SharedProgress(Progress):
+
+    """Generate a reporter that writes the number of steps done to a counter of a
+    `blocksim.progress.SharedCounter`."""
+
+    def __init__(self, name, slot, every=1024):
+
+        """Parameters
+        ----------
+
+        name : str
+            name of the shared memory block of the counters
+        slot : int
+            index of the counter
+        every : int
+            number of steps between consecutive updates"""
+
+        super().__init__(every)
+        self.name = name
+        self.slot = slot
+        self.memory = None
+
+    def start(self, total):
+
+        """Attach to the shared memory of the counters.
+
+        Parameters
+        ----------
+
+        total : int
+            number of steps of the simulation"""
+
+        from multiprocessing import shared_memory
+
+        self.memory = shared_memory.SharedMemory(name=self.name)
+        self.counts = np.ndarray((self.slot + 1,), dtype=np.int64, buffer=self.memory.buf)
+
+    def update(self, done):
+
+        """Write the number of steps done to the counter.
+
+        Parameters
+        ----------
+
+        done : int
+            number of steps done so far"""
+
+        self.counts[self.slot] = done
+
+    def close(self):
+
+        """Detach from the shared memory of the counters."""
+
+        del self.counts
+        self.memory.close()
+        self.memory = None
+
+    def __getstate__(self):
+
+        """Leave the attached memory out when the reporter is sent to another
+        process."""
+
+        return {'every': self.every, 'name': self.name, 'slot': self.slot, 'memory': None}
+
+
+def reporter(progress):
+
+    """Turn the `progress` argument of `blocksim.simulation.Simulation.simulate`
+    into a reporter.
+
+    Parameters
+    ----------
+
+    progress : bool or blocksim.progress.Progress
+        reporter to use. True displays a progress bar, whilst None and False
+        disable reporting
+
+    Results
+    -------
+
+    reporter : blocksim.progress.Progress
+        reporter to use, or None if there is nothing to report"""
+
+    if progress is True:
+        return TqdmProgress()
+    if progress is None or progress is False:
+        return None
+    return progress
@@ -0,0 +1,190 @@
+"""Propagation engine for the simulations. After a miner finds a new block, and once
+more when the simulation ends, miners are given the chance to reveal hidden blocks
+and to inform other miners of them. Each reveal or message can prompt other miners
+to react, so the process is repeated in rounds until no miner has anything left to
+do or until a termination policy stops it.
+
+The engine only calls the miners that react to the events of the previous round,
+keeps its buffers between rounds and collects statistics about every propagation,
+namely the number of rounds it took and the number of blocks published and informed."""
+
+
+def max_rounds(rounds):
+
+    """Termination policy factory. This function creates a policy that stops a
+    propagation after a fixed number of rounds, even if the miners still have
+    something to do.
+
+    Parameters
+    ----------
+
+    rounds : int
+        maximum number of rounds of each propagation
+
+    Results
+    -------
+
+    policy : function
+        termination policy that receives the number of rounds done so far and
+        returns whether the propagation has to stop"""
+
+    def policy(rounds_done):
+
+        """Check whether the propagation has to stop.
+
+        Parameters
+        ----------
+
+        rounds_done : int
+            number of rounds done so far
+
+        Results
+        -------
+
+        stop : bool
+            flag indicating whether the propagation has to stop"""
+
+        return rounds_done >= rounds
+    return policy
+
+
+class Propagation:
+
+    """Generate a propagation engine that spreads the publications and messages
+    of the miners of a simulation."""
+
+    def __init__(self, struct, registry, hidden_blocks, subscribers, policy=None):
+
+        """Parameters
+        ----------
+
+        struct : blocksim.simulation.Structure
+            data structure of the simulation
+        registry : blocksim.simulation.MinerRegistry
+            registry of the miners of the simulation
+        hidden_blocks : blocksim.simulation.HiddenBlocks
+            hidden blocks of the simulation, from which published blocks are
+            removed
+        subscribers : dict
+            dictionary of pairs ``event: set of miners`` with the miners that
+            react to each event of `blocksim.simulation.EVENTS`
+        policy : function
+            termination policy, such as the ones created by
+            `blocksim.propagation.max_rounds`. If it is not given each
+            propagation runs until no miner has anything left to do"""
+
+        self.struct = struct
+        self.registry = registry
+        self.hidden_blocks = hidden_blocks
+        self.subscribers = {event: {registry.ids[miner.name] for miner in miners}
+            for event, miners in subscribers.items()}
+        self.policy = policy
+        self.publishable = {}
+        self.informable = {}
+        self.last_rounds = 0
+        self.last_published = 0
+        self.last_informs = 0
+        self.runs = 0
+        self.rounds = 0
+        self.published = 0
+        self.informs = 0
+        self.max_rounds = 0
+
+    def run(self, miners, end=False):
+
+        """Spread information starting with the given miners. In each round the
+        miners are called in the order of their ids, the blocks they choose to
+        reveal are added to the structure in the order in which they were
+        created and the blocks they choose to communicate are delivered. The
+        miners that react to what happened in the round are called in the next
+        one.
+
+        Parameters
+        ----------
+
+        miners : iterable
+            miners that are called in the first round
+        end : bool
+            flag indicating whether the propagation happens because the
+            simulation is ending"""
+
+        struct = self.struct
+        registry = self.registry
+        subscribers = self.subscribers
+        publishable = self.publishable
+        informable = self.informable
+
+        pending = {registry.ids[miner.name] for miner in miners}
+        rounds = published = informs = 0
+        while pending and (self.policy is None or not self.policy(rounds)):
+            rounds += 1
+            calls = sorted(pending)
+            pending = set()
+            publishable.clear()
+            informable.clear()
+            depth = struct.depth
+
+            for miner_id in calls:
+                miner = registry.miners[miner_id]
+                publish = miner.publish(struct, end)
+                inform = miner.inform(struct, end)
+                if publish:
+                    publishable.update(dict.fromkeys(publish))
+                    if miner_id in subscribers['published']:
+                        pending.add(miner_id)
+                if inform:
+                    for miner_name in inform:
+                        if miner_name not in informable:
+                            informable[miner_name] = {}
+                        informable[miner_name].update(dict.fromkeys(inform[miner_name]))
+
+            if publishable:
+                for block in self.hidden_blocks.ordered(publishable):
+                    struct.add_block(block)
+                    self.hidden_blocks.remove(block)
+                published += len(publishable)
+                pending |= subscribers['tip']
+                if struct.depth > depth:
+                    pending |= subscribers['depth']
+
+            for miner_name in informable:
+                miner_id = registry.ids[miner_name]
+                miner = registry.miners[miner_id]
+                for block in informable[miner_name]:
+                    miner.add_known_block(block)
+                    if struct.trace is not None:
+                        struct.trace.informed(block, miner_id)
+                informs += len(informable[miner_name])
+                if miner_id in subscribers['inform']:
+                    pending.add(miner_id)
+
+        self.last_rounds = rounds
+        self.last_published = published
+        self.last_informs = informs
+        self.runs += 1
+        self.rounds += rounds
+        self.published += published
+        self.informs += informs
+        self.max_rounds = max(self.max_rounds, rounds)
+
+    def stats(self):
+
+        """Summarize the statistics of the propagations run so far.
+
+        Results
+        -------
+
+        stats : dict
+            dictionary with the number of propagations (``runs``), the total
+            and maximum number of rounds (``rounds``, ``max_rounds``), the
+            average number of rounds until reaching a fixpoint
+            (``mean_rounds``), the total number of blocks published and
+            informed (``published``, ``informs``) and the same values for the
+            last propagation (``last_rounds``, ``last_published``,
+            ``last_informs``)"""
+
+        return {'runs': self.runs, 'rounds': self.rounds, 'max_rounds': self.max_rounds,
+            'mean_rounds': self.rounds / self.runs if self.runs else 0,
+            'published': self.published, 'informs': self.informs,
+            'last_rounds': self.last_rounds, 'last_published': self.last_published,
+            'last_informs': self.last_informs}
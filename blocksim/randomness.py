@@ -0,0 +1,315 @@
+"""Sources of randomness for the simulations. Every random decision taken during a
+simulation, namely choosing the owner of each new block and breaking ties between
+blocks, is drawn from a stream object so that a whole run can be reproduced from a
+single seed. `RandomStream` draws each value on demand using Python's `random`
+module, whilst `BatchedRandomStream` pre-draws the values in large NumPy chunks and
+consumes them lazily, which removes most of the per-step interpreter overhead on
+long runs."""
+
+from bisect import bisect_right
+from math import log
+from random import Random
+
+import numpy as np
+
+
+class RandomStream:
+
+    """Generate a stream of random draws using Python's `random` module."""
+
+    def __init__(self, seed=None):
+
+        """Parameters
+        ----------
+
+        seed : int
+            seed for the stream. If it is not given the stream is seeded
+            from the operating system"""
+
+        self.random = Random(seed)
+        self.set_weights([1])
+
+    def set_weights(self, cum_weights):
+
+        """Set the cumulative weights used to draw winners.
+
+        Parameters
+        ----------
+
+        cum_weights : list
+            cumulative weight of each candidate, in order"""
+
+        self.cum_weights = cum_weights
+        self.last = len(cum_weights) - 1
+
+    def winner(self):
+
+        """Draw the index of a candidate with probability proportional to
+        its weight.
+
+        Results
+        -------
+
+        index : int
+            index of the chosen candidate"""
+
+        return bisect_right(self.cum_weights, self.random.random() * self.cum_weights[-1], 0, self.last)
+
+    def draw_winners(self, n):
+
+        """Draw the indexes of many candidates at once. The values and the state
+        in which the stream is left are the same as with `n` calls to `winner`.
+        Python's `random` module and NumPy's legacy generator share the Mersenne
+        Twister algorithm, so the state is handed to NumPy, which draws the values
+        in a single call, and then given back.
+
+        Parameters
+        ----------
+
+        n : int
+            number of draws
+
+        Results
+        -------
+
+        indexes : numpy.ndarray
+            index of the chosen candidate of each draw"""
+
+        version, internal, gauss = self.random.getstate()
+        generator = np.random.RandomState()
+        generator.set_state(('MT19937', np.array(internal[:-1], dtype=np.uint32), internal[-1]))
+        draws = generator.random_sample(n) * self.cum_weights[-1]
+        _, key, pos, _, _ = generator.get_state()
+        self.random.setstate((version, tuple(key.tolist()) + (int(pos),), gauss))
+        return np.minimum(np.searchsorted(np.asarray(self.cum_weights, dtype=float), draws, side='right'), self.last)
+
+    def choice(self, seq):
+
+        """Choose an element of a non-empty sequence uniformly at random.
+
+        Parameters
+        ----------
+
+        seq : sequence
+            sequence to choose from
+
+        Results
+        -------
+
+        element : object
+            chosen element"""
+
+        return seq[int(self.random.random() * len(seq))]
+
+    def exponential(self, mean):
+
+        """Draw a value from an exponential distribution.
+
+        Parameters
+        ----------
+
+        mean : float
+            mean of the distribution
+
+        Results
+        -------
+
+        value : float
+            drawn value"""
+
+        return self.random.expovariate(1 / mean)
+
+    def get_state(self):
+
+        """Get the state of the stream, so that it can be restored later.
+
+        Results
+        -------
+
+        state : object
+            state of the stream"""
+
+        return self.random.getstate()
+
+    def set_state(self, state):
+
+        """Restore a state obtained through `get_state`. The weights are not part
+        of the state and have to be set beforehand.
+
+        Parameters
+        ----------
+
+        state : object
+            state of the stream"""
+
+        self.random.setstate(state)
+
+
+class BatchedRandomStream(RandomStream):
+
+    """Generate a stream of random draws that are pre-drawn in chunks using
+    a `numpy.random.Generator`."""
+
+    def __init__(self, seed=None, chunk_size=65536):
+
+        """Parameters
+        ----------
+
+        seed : int
+            seed for the stream. If it is not given the stream is seeded
+            from the operating system
+        chunk_size : int
+            amount of values drawn at once each time a buffer runs out"""
+
+        self.generator = np.random.default_rng(seed)
+        self.chunk_size = chunk_size
+        self.uniforms = []
+        self.uniform_pos = 0
+        super().__init__(seed)
+
+    def set_weights(self, cum_weights):
+
+        """Set the cumulative weights used to draw winners, discarding the
+        winners drawn with the previous weights.
+
+        Parameters
+        ----------
+
+        cum_weights : list
+            cumulative weight of each candidate, in order"""
+
+        super().set_weights(cum_weights)
+        self.np_cum_weights = np.asarray(cum_weights, dtype=float)
+        self.winners = []
+        self.winner_pos = 0
+
+    def winner(self):
+
+        """Draw the index of a candidate with probability proportional to
+        its weight.
+
+        Results
+        -------
+
+        index : int
+            index of the chosen candidate"""
+
+        if self.winner_pos == len(self.winners):
+            draws = self.generator.random(self.chunk_size) * self.np_cum_weights[-1]
+            self.winners = np.minimum(np.searchsorted(self.np_cum_weights, draws, side='right'), self.last).tolist()
+            self.winner_pos = 0
+        self.winner_pos += 1
+        return self.winners[self.winner_pos - 1]
+
+    def draw_winners(self, n):
+
+        """Draw the indexes of many candidates at once, taking first the winners
+        that have been pre-drawn but not consumed yet. The values and the state in
+        which the stream is left are the same as with `n` calls to `winner`.
+
+        Parameters
+        ----------
+
+        n : int
+            number of draws
+
+        Results
+        -------
+
+        indexes : numpy.ndarray
+            index of the chosen candidate of each draw"""
+
+        parts = [np.array(self.winners[self.winner_pos:self.winner_pos + n], dtype=np.intp)]
+        self.winner_pos += len(parts[0])
+        n -= len(parts[0])
+        while n > 0:
+            draws = self.generator.random(self.chunk_size) * self.np_cum_weights[-1]
+            winners = np.minimum(np.searchsorted(self.np_cum_weights, draws, side='right'), self.last)
+            if n >= self.chunk_size:
+                parts.append(winners)
+                self.winners = []
+                self.winner_pos = 0
+                n -= self.chunk_size
+            else:
+                parts.append(winners[:n])
+                self.winners = winners.tolist()
+                self.winner_pos = n
+                n = 0
+        return np.concatenate(parts)
+
+    def choice(self, seq):
+
+        """Choose an element of a non-empty sequence uniformly at random.
+
+        Parameters
+        ----------
+
+        seq : sequence
+            sequence to choose from
+
+        Results
+        -------
+
+        element : object
+            chosen element"""
+
+        if self.uniform_pos == len(self.uniforms):
+            self.uniforms = self.generator.random(self.chunk_size).tolist()
+            self.uniform_pos = 0
+        self.uniform_pos += 1
+        return seq[int(self.uniforms[self.uniform_pos - 1] * len(seq))]
+
+    def exponential(self, mean):
+
+        """Draw a value from an exponential distribution, using the pre-drawn
+        uniform values.
+
+        Parameters
+        ----------
+
+        mean : float
+            mean of the distribution
+
+        Results
+        -------
+
+        value : float
+            drawn value"""
+
+        if self.uniform_pos == len(self.uniforms):
+            self.uniforms = self.generator.random(self.chunk_size).tolist()
+            self.uniform_pos = 0
+        self.uniform_pos += 1
+        return -mean * log(1 - self.uniforms[self.uniform_pos - 1])
+
+    def get_state(self):
+
+        """Get the state of the stream, including the values that have been
+        pre-drawn but not consumed yet.
+
+        Results
+        -------
+
+        state : dict
+            state of the stream"""
+
+        return {'generator': self.generator.bit_generator.state,
+            'winners': self.winners[self.winner_pos:],
+            'uniforms': self.uniforms[self.uniform_pos:]}
+
+    def set_state(self, state):
+
+        """Restore a state obtained through `get_state`. The weights are not part
+        of the state and have to be set beforehand.
+
+        Parameters
+        ----------
+
+        state : dict
+            state of the stream"""
+
+        self.generator.bit_generator.state = state['generator']
+        self.winners = list(state['winners'])
+        self.winner_pos = 0
+        self.uniforms = list(state['uniforms'])
+        self.uniform_pos = 0
@@ -0,0 +1,308 @@
+"""Re-scoring of recorded runs under other payoff functions and safe distances. The
+blocks that a miner publishes and where it mines depend on the payoff function and
+on ``safe_dist`` only if its strategy reads them, which none of
+`PAYOFF_FREE_STRATEGIES` does. For those strategies the published blocks of a run are
+the same whatever the payoff and the safe distance, and only the blocks that are
+paid and their value change, so a single run can be settled again for many of
+them without running it again.
+
+A `Replay` is built from a finished simulation with `from_simulation`, or from a
+`blocksim.trace.Trace` file with `from_trace`, which also works for runs whose
+structure was pruned. Blocks are paid when a block at least ``safe_dist`` deeper
+becomes the deepest block of the structure, so a block is paid under a safe
+distance if and only if it is at most the depth of the deepest of those
+descendants, called its margin, above it. The margins are found in one pass over
+the published blocks, after which settling the run under a payoff function and a
+safe distance takes a few array operations. Replays of runs with miners whose
+strategies may read the payoff or the safe distance are flagged through
+`Replay.readers`, since their blocks would have been different."""
+
+import numpy as np
+
+from .miners import Miner, SelfishMiner, AlwaysForkMiner
+from .results import Results
+from .simulation import MinerRegistry
+from .trace import load, CREATED, PUBLISHED
+
+
+PAYOFF_FREE_STRATEGIES = frozenset({Miner, SelfishMiner, AlwaysForkMiner})
+"""Miner classes whose decisions don't depend on the payoff function nor on the
+safe distance. `blocksim.miners.DefaultMiner` breaks ties by payoff, and subclasses
+are not included, since they can override any of this behaviour."""
+
+
+def payoff_readers(miners):
+
+    """Find the miners whose strategies may read the payoff function or the safe
+    distance.
+
+    Parameters
+    ----------
+
+    miners : list
+        miners of the simulation
+
+    Results
+    -------
+
+    readers : list
+        names of the miners that don't follow one of `PAYOFF_FREE_STRATEGIES`"""
+
+    return [miner.name for miner in miners if type(miner) not in PAYOFF_FREE_STRATEGIES]
+
+
+class Replay:
+
+    """Generate a recorded run whose published blocks can be settled under any
+    payoff function and safe distance."""
+
+    def __init__(self, names, hash_power, owners, parents, depths, steps, readers=()):
+
+        """The published blocks are given as arrays indexed by timestamp, whose
+        first item is the genesis block.
+
+        Parameters
+        ----------
+
+        names : list
+            name of each miner
+        hash_power : list
+            hash power value of each miner
+        owners : numpy.ndarray
+            id of the owner of each block
+        parents : numpy.ndarray
+            timestamp of the parent of each block
+        depths : numpy.ndarray
+            depth of each block
+        steps : int
+            number of steps of the run
+        readers : list
+            names of the miners whose strategies may read the payoff function or
+            the safe distance"""
+
+        self.names = list(names)
+        self.hash_power = list(hash_power)
+        self.owners = np.asarray(owners, dtype=np.intp)
+        self.parents = np.asarray(parents, dtype=np.int64)
+        self.depths = np.asarray(depths, dtype=np.int64)
+        self.tstamps = np.arange(len(self.depths), dtype=np.int64)
+        self.steps = steps
+        self.readers = list(readers)
+        self.published_numbers = np.bincount(self.owners[1:], minlength=len(self.names))
+        self.margins = self.reach() - self.depths
+        self.margins[0] = -1
+
+    @property
+    def reusable(self):
+
+        """Flag indicating whether the run would have published the same blocks
+        under any payoff function and safe distance."""
+
+        return not self.readers
+
+    def reach(self):
+
+        """Find, for every block, the depth of its deepest descendant, itself
+        included, that became the deepest block of the structure when it was
+        published, or -1 if there is none. Since parents are published before
+        their children, a single pass in reverse timestamp order is enough.
+
+        Results
+        -------
+
+        reach : numpy.ndarray
+            depth reached by the descendants of each block"""
+
+        deepest = np.maximum.accumulate(self.depths)
+        record = np.zeros(len(self.depths), dtype=bool)
+        record[1:] = self.depths[1:] > deepest[:-1]
+        reach = np.where(record, self.depths, -1).tolist()
+        parents = self.parents.tolist()
+
+        for tstamp in range(len(reach) - 1, 0, -1):
+            parent = parents[tstamp]
+            if reach[tstamp] > reach[parent]:
+                reach[parent] = reach[tstamp]
+        return np.array(reach, dtype=np.int64)
+
+    def unsettled_numbers(self, safe_dist):
+
+        """Count the blocks of each miner at the end of the main branch that are
+        not paid under a safe distance, which are the last ``safe_dist`` blocks of
+        the branch of the first block that reached the final depth.
+
+        Parameters
+        ----------
+
+        safe_dist : int
+            safe distance of the settlement
+
+        Results
+        -------
+
+        unsettled : numpy.ndarray
+            number of unpaid blocks of each miner in the main branch, indexed by
+            miner id"""
+
+        unsettled = np.zeros(len(self.names), dtype=np.int64)
+        block = int(np.argmax(self.depths))
+        for _ in range(min(safe_dist, int(self.depths[block]))):
+            unsettled[self.owners[block]] += 1
+            block = int(self.parents[block])
+        return unsettled
+
+    def rescore(self, payoffs, safe_dists):
+
+        """Settle the run under every combination of payoff function and safe
+        distance. The value of each block is computed once per payoff function
+        and the blocks paid under each safe distance are picked by their margin.
+
+        Parameters
+        ----------
+
+        payoffs : dict
+            dictionary of pairs ``name: payoff``, where each payoff is a
+            `blocksim.payoff.Payoff` that evaluates blocks in batches
+        safe_dists : iterable
+            safe distances of the settlements
+
+        Results
+        -------
+
+        results : dict
+            dictionary of pairs ``(payoff_name, safe_dist): results``, where each
+            value is a `blocksim.results.Results` whose orphans are the published
+            blocks never paid under its safe distance, whose depth is that of
+            the run and whose wall time is zero"""
+
+        for name, payoff in payoffs.items():
+            if not getattr(payoff, 'batched', False):
+                raise ValueError("Payoff {} can't evaluate blocks in batches".format(name))
+
+        miner_nr = len(self.names)
+        paid = {safe_dist: self.margins >= safe_dist for safe_dist in safe_dists}
+        block_numbers = {safe_dist: np.bincount(self.owners[mask], minlength=miner_nr)
+            for safe_dist, mask in paid.items()}
+        orphans = {safe_dist: self.published_numbers - block_numbers[safe_dist] - self.unsettled_numbers(safe_dist)
+            for safe_dist in paid}
+        depth = int(self.depths.max())
+
+        results = {}
+        for name, payoff in payoffs.items():
+            values = payoff.values(self.tstamps, self.depths)
+            for safe_dist, mask in paid.items():
+                payoff_table = np.bincount(self.owners[mask], weights=values[mask], minlength=miner_nr)
+                results[name, safe_dist] = Results(self.names, self.hash_power, block_numbers[safe_dist],
+                    payoff_table, orphans[safe_dist], depth, self.steps, 0.0)
+        return results
+
+    def settle(self, payoff, safe_dist):
+
+        """Settle the run under a single payoff function and safe distance.
+
+        Parameters
+        ----------
+
+        payoff : blocksim.payoff.Payoff
+            payoff function that evaluates blocks in batches
+        safe_dist : int
+            safe distance of the settlement
+
+        Results
+        -------
+
+        results : blocksim.results.Results
+            results of the run under the given payoff function and safe distance"""
+
+        return self.rescore({None: payoff}, [safe_dist])[None, safe_dist]
+
+
+def from_simulation(sim):
+
+    """Record the published blocks of a finished simulation, walking its structure
+    from the genesis block.
+
+    Parameters
+    ----------
+
+    sim : blocksim.simulation.Simulation
+        simulation whose structure hasn't been pruned. Runs in which every
+        miner is honest go through `blocksim.fastpath` unless the simulation
+        is created with ``fast_path=False``, and only keep their unpaid blocks
+
+    Results
+    -------
+
+    replay : blocksim.replay.Replay
+        recorded run"""
+
+    struct = sim.struct
+    if struct.pruned_blocks or struct.base.parent is not None or struct.base.tstamp != 0:
+        if sim.vectorized:
+            raise ValueError("The run went through the vectorized engine, which doesn't keep the paid blocks, "
+                "run it with fast_path=False or re-score a trace of the run instead")
+        raise ValueError("The structure has been pruned, re-score a trace of the run instead")
+
+    size = struct.last_tstamp + 1
+    owners = np.full(size, -1, dtype=np.intp)
+    parents = np.full(size, -1, dtype=np.int64)
+    depths = np.zeros(size, dtype=np.int64)
+    ids = sim.registry.ids
+
+    stack = [struct.base]
+    while stack:
+        block = stack.pop()
+        for child in block.children:
+            owners[child.tstamp] = ids[child.owner.name]
+            parents[child.tstamp] = block.tstamp
+            depths[child.tstamp] = child.depth
+            stack.append(child)
+
+    return Replay(sim.registry.names, sim.hash_power, owners, parents, depths, sim.steps, payoff_readers(sim.miners))
+
+
+def from_trace(trace, miners, h):
+
+    """Record the published blocks of a run from its trace.
+
+    Parameters
+    ----------
+
+    trace : str or numpy.ndarray
+        path of the trace file or its records, see `blocksim.trace.load`
+    miners : list
+        miners of the simulation, in the order in which they were given to it
+    h : dict
+        dictionary of pairs {miner name: hash power value}
+
+    Results
+    -------
+
+    replay : blocksim.replay.Replay
+        recorded run"""
+
+    records = load(trace) if isinstance(trace, str) else trace
+    published = records[records['kind'] == PUBLISHED]
+    tstamps = published['tstamp'].astype(np.int64)
+    size = int(tstamps.max(initial=0)) + 1
+    if len(published) != size - 1:
+        raise ValueError("The trace doesn't cover every published block of the run")
+
+    tstamp_of = np.full(int(published['block'].max(initial=0)) + 1, -1, dtype=np.int64)
+    tstamp_of[0] = 0
+    tstamp_of[published['block']] = tstamps
+    parents = np.where(published['parent_tstamp'] >= 0, published['parent_tstamp'],
+        tstamp_of[np.maximum(published['parent'], 0)])
+
+    owners = np.full(size, -1, dtype=np.intp)
+    parent_table = np.full(size, -1, dtype=np.int64)
+    depths = np.zeros(size, dtype=np.int64)
+    owners[tstamps] = published['owner']
+    parent_table[tstamps] = parents
+    depths[tstamps] = published['depth']
+    if (parent_table[1:] < 0).any():
+        raise ValueError("The trace doesn't cover every published block of the run")
+
+    registry = MinerRegistry(miners)
+    return Replay(registry.names, registry.table(h), owners, parent_table, depths,
+        int((records['kind'] == CREATED).sum()), payoff_readers(miners))
@@ -0,0 +1,158 @@
+"""Results of the simulations in a machine-readable form. `Results` holds, for each
+miner, its hash power, the blocks and payoff it has been given and the number of its
+published blocks that have never been paid and are not waiting to be paid in the
+main branch, called orphans, along with the depth of the structure, the number of
+steps done and the time they took.
+
+Orphans are counted as the published blocks that are neither paid nor among the
+last ``safe_dist`` blocks of the main branch, which is not the same as the blocks
+left out of the final main branch. A block is paid once it is ``safe_dist`` blocks
+deep, and it stays paid even if a longer branch later leaves it out of the main
+branch, which can happen when `safe_dist` is small. Such a block counts as paid
+and not as an orphan.
+
+Results are built from the tables that the structure keeps updated during the
+simulation, so taking one takes time proportional to the number of miners and to
+`safe_dist` and doesn't copy the structure. This makes it possible to take
+snapshots during a run, for example from a `blocksim.progress.CallbackProgress`."""
+
+import numpy as np
+
+
+class Results:
+
+    """Generate the results of a simulation, or a snapshot of them."""
+
+    def __init__(self, names, hash_power, block_numbers, payoffs, orphans, depth, steps, wall_time):
+
+        """Parameters
+        ----------
+
+        names : list
+            name of each miner
+        hash_power : list
+            hash power value of each miner
+        block_numbers : numpy.ndarray
+            number of blocks given out to each miner
+        payoffs : numpy.ndarray
+            payoff given out to each miner
+        orphans : numpy.ndarray
+            number of published blocks of each miner that have never been paid,
+            leaving out the unpaid blocks at the end of the main branch
+        depth : int
+            depth of the structure
+        steps : int
+            number of steps done
+        wall_time : float
+            seconds spent running the steps"""
+
+        self.names = list(names)
+        self.hash_power = np.array(hash_power, dtype=float)
+        self.block_numbers = np.array(block_numbers, dtype=np.int64)
+        self.payoffs = np.array(payoffs, dtype=float)
+        self.orphans = np.array(orphans, dtype=np.int64)
+        self.depth = depth
+        self.steps = steps
+        self.wall_time = wall_time
+
+        self.hash_shares = self.shares(self.hash_power)
+        self.block_shares = self.shares(self.block_numbers)
+        self.payoff_shares = self.shares(self.payoffs)
+
+    @staticmethod
+    def shares(values):
+
+        """Divide each value by the total, leaving zeros if the total is zero.
+
+        Parameters
+        ----------
+
+        values : numpy.ndarray
+            value of each miner
+
+        Results
+        -------
+
+        shares : numpy.ndarray
+            share of each miner"""
+
+        total = values.sum()
+        return values / total if total else np.zeros(len(values))
+
+    @property
+    def throughput(self):
+
+        """Number of steps done per second."""
+
+        return self.steps / self.wall_time if self.wall_time else 0.0
+
+    def to_dict(self):
+
+        """Convert the results to built-in types.
+
+        Results
+        -------
+
+        results : dict
+            dictionary with the key ``miners``, holding pairs ``miner_name: dict``
+            with the values of each miner, and the keys ``depth``, ``steps``,
+            ``wall_time`` and ``throughput``"""
+
+        return {'miners': {name: {'hash_power': float(self.hash_power[i]),
+            'hash_share': float(self.hash_shares[i]),
+            'block_number': int(self.block_numbers[i]),
+            'block_share': float(self.block_shares[i]),
+            'payoff': float(self.payoffs[i]),
+            'payoff_share': float(self.payoff_shares[i]),
+            'orphans': int(self.orphans[i])} for i, name in enumerate(self.names)},
+            'depth': self.depth, 'steps': self.steps, 'wall_time': self.wall_time,
+            'throughput': self.throughput}
+
+    def to_records(self):
+
+        """Convert the values of each miner to a NumPy record array.
+
+        Results
+        -------
+
+        records : numpy.recarray
+            record array with one record per miner and the fields ``name``,
+            ``hash_power``, ``hash_share``, ``block_number``, ``block_share``,
+            ``payoff``, ``payoff_share`` and ``orphans``"""
+
+        return np.rec.fromarrays([np.array(self.names, dtype=str), self.hash_power, self.hash_shares,
+            self.block_numbers, self.block_shares, self.payoffs, self.payoff_shares, self.orphans],
+            names=['name', 'hash_power', 'hash_share', 'block_number', 'block_share',
+            'payoff', 'payoff_share', 'orphans'])
+
+    def to_pandas(self):
+
+        """Convert the values of each miner to a pandas data frame indexed by
+        miner name. The values of the whole run are kept in its ``attrs``. This
+        method requires pandas, which is imported when it is called.
+
+        Results
+        -------
+
+        frame : pandas.DataFrame
+            data frame with one row per miner"""
+
+        import pandas as pd
+
+        frame = pd.DataFrame.from_records(self.to_records()).set_index('name')
+        frame.attrs.update({'depth': self.depth, 'steps': self.steps, 'wall_time': self.wall_time,
+            'throughput': self.throughput})
+        return frame
+
+    def print_results(self):
+
+        """Prints the results, displaying the hash power value, the block number
+        and the payoff for each of the miners."""
+
+        print("==========")
+        for i, name in enumerate(self.names):
+            print("Miner: {}".format(name))
+            print("Hash Power: {:g} ({:.2f}%)".format(self.hash_power[i], self.hash_shares[i] * 100))
+            print("Block Number: {} ({:.2f}%)".format(self.block_numbers[i], self.block_shares[i] * 100))
+            print("Payoff: {:.2f} ({:.2f}%)".format(self.payoffs[i], self.payoff_shares[i] * 100))
+            print("==========")
@@ -0,0 +1,253 @@
+"""Settlement of a simulation under several payoff functions and safe distances at
+once. Besides its own payoff function and ``safe_dist``, a structure can keep one
+table of blocks and payoff for every combination of a named collection of payoff
+functions and a group of safe distances, all of them filled during the same run.
+
+A block is paid under a safe distance once a block at least that much deeper
+becomes the deepest block of the structure, so a block paid under a safe distance
+is also paid under every smaller one. Each block therefore only needs a level, the
+number of safe distances under which it has been paid, and when a new deepest block
+is published, the blocks that have just been confirmed under each safe distance
+are found by walking towards the root from its ancestor at that distance while the
+level allows it. Every block is visited once for each safe distance, and the
+payoff functions evaluate the confirmed blocks together, in batches.
+
+Levels are only kept for the blocks paid under some safe distances but not under
+all of them. The safe distance of the structure is always one of the group, so a
+block without a level is paid under all of them if it has been paid by the
+structure and under none otherwise."""
+
+import numpy as np
+
+
+class Settlements:
+
+    """Generate the settlement tables of a structure for every combination of a
+    collection of payoff functions and a group of safe distances."""
+
+    def __init__(self, payoffs, safe_dists, registry, settle_batch=4096):
+
+        """Parameters
+        ----------
+
+        payoffs : dict
+            dictionary of pairs ``name: payoff`` with the payoff functions to
+            evaluate, where each payoff is a `blocksim.payoff.Payoff`
+        safe_dists : iterable
+            safe distances to settle the blocks with, which must include the safe
+            distance of the structure
+        registry : blocksim.simulation.MinerRegistry
+            registry of the miners of the simulation
+        settle_batch : int
+            number of confirmed blocks gathered under each safe distance before
+            the payoff functions evaluate them"""
+
+        self.payoffs = dict(payoffs)
+        self.safe_dists = sorted(set(safe_dists))
+        self.registry = registry
+        self.settle_batch = settle_batch
+        self.levels = {}
+        self.pending = [([], [], []) for _ in self.safe_dists]
+        self.block_numbers = np.zeros((len(self.safe_dists), len(registry)), dtype=np.int64)
+        self.payoff_tables = {name: np.zeros((len(self.safe_dists), len(registry))) for name in self.payoffs}
+        self.batched = [name for name, payoff in self.payoffs.items() if payoff.batched]
+        self.unbatched = [(name, payoff) for name, payoff in self.payoffs.items() if not payoff.batched]
+
+    def level(self, block):
+
+        """Count the safe distances under which a block has been paid.
+
+        Parameters
+        ----------
+
+        block : blocksim.simulation.Block
+            published block
+
+        Results
+        -------
+
+        level : int
+            number of safe distances, starting from the smallest one, under which
+            the block has been paid"""
+
+        level = self.levels.get(block)
+        if level is not None:
+            return level
+        return len(self.safe_dists) if block.is_paid() else 0
+
+    def settle(self, struct, block):
+
+        """Pay out, under every safe distance, the blocks confirmed by a new deepest
+        block. This has to be done before the structure pays out the blocks
+        confirmed under its own safe distance.
+
+        Parameters
+        ----------
+
+        struct : blocksim.simulation.Structure
+            data structure of the simulation
+        block : blocksim.simulation.Block
+            new deepest block of the structure"""
+
+        full = len(self.safe_dists)
+        for index, safe_dist in enumerate(self.safe_dists):
+            if block.depth <= safe_dist:
+                break
+            paid = struct.ancestor(block, block.depth - safe_dist)
+            owners, tstamps, depths = self.pending[index]
+            while paid is not None and self.level(paid) == index:
+                if index + 1 < full:
+                    self.levels[paid] = index + 1
+                else:
+                    self.levels.pop(paid, None)
+                miner_id = self.registry.ids[paid.owner.name]
+                owners.append(miner_id)
+                tstamps.append(paid.tstamp)
+                depths.append(paid.depth)
+                for name, payoff in self.unbatched:
+                    self.payoff_tables[name][index, miner_id] += payoff.block_value(paid)
+                paid = paid.parent
+            if len(owners) >= self.settle_batch:
+                self.flush(index)
+
+    def flush(self, index=None):
+
+        """Evaluate the confirmed blocks gathered under a safe distance with every
+        payoff function and add them to the tables.
+
+        Parameters
+        ----------
+
+        index : int
+            position of the safe distance in `safe_dists`. Every safe distance is
+            flushed if not given"""
+
+        if index is None:
+            for index in range(len(self.safe_dists)):
+                self.flush(index)
+            return
+
+        owners, tstamps, depths = self.pending[index]
+        if not owners:
+            return
+
+        owners = np.asarray(owners, dtype=np.intp)
+        tstamps = np.asarray(tstamps, dtype=np.int64)
+        depths = np.asarray(depths, dtype=np.int64)
+        self.block_numbers[index] += np.bincount(owners, minlength=len(self.registry))
+        for name in self.batched:
+            self.payoff_tables[name][index] += np.bincount(owners, weights=self.payoffs[name].values(tstamps, depths),
+                minlength=len(self.registry))
+        self.pending[index] = ([], [], [])
+
+    def forget(self, block):
+
+        """Drop the level of a block removed from the structure.
+
+        Parameters
+        ----------
+
+        block : blocksim.simulation.Block
+            block dropped by `blocksim.simulation.Structure.prune`"""
+
+        self.levels.pop(block, None)
+
+    def index(self, payoff, safe_dist):
+
+        """Check that a combination is settled and find the position of its safe
+        distance.
+
+        Parameters
+        ----------
+
+        payoff : str
+            name of the payoff function
+        safe_dist : int
+            safe distance
+
+        Results
+        -------
+
+        index : int
+            position of the safe distance in `safe_dists`"""
+
+        if payoff not in self.payoffs or safe_dist not in self.safe_dists:
+            raise ValueError("No settlement for payoff {!r} and safe distance {}".format(payoff, safe_dist))
+        return self.safe_dists.index(safe_dist)
+
+    def tables(self, payoff, safe_dist):
+
+        """Read the blocks and the payoff given out to each miner under a payoff
+        function and a safe distance, settling any blocks still pending.
+
+        Parameters
+        ----------
+
+        payoff : str
+            name of the payoff function
+        safe_dist : int
+            safe distance
+
+        Results
+        -------
+
+        block_numbers : numpy.ndarray
+            number of blocks given out to each miner
+        payoffs : numpy.ndarray
+            payoff given out to each miner"""
+
+        index = self.index(payoff, safe_dist)
+        self.flush(index)
+        return self.block_numbers[index].copy(), self.payoff_tables[payoff][index].copy()
+
+    def unsettled_numbers(self, safe_dist, tip):
+
+        """Count the blocks of each miner in the branch of the deepest block that
+        have not been paid under a safe distance.
+
+        Parameters
+        ----------
+
+        safe_dist : int
+            safe distance
+        tip : blocksim.simulation.Block
+            first block that reached the depth of the structure
+
+        Results
+        -------
+
+        unsettled : numpy.ndarray
+            number of unpaid blocks of each miner in the main branch, indexed by
+            miner id"""
+
+        index = self.safe_dists.index(safe_dist)
+        unsettled = np.zeros(len(self.registry), dtype=np.int64)
+        block = tip
+        while block is not None and self.level(block) <= index:
+            unsettled[self.registry.ids[block.owner.name]] += 1
+            block = block.parent
+        return unsettled
+
+    def partial_payoff(self, payoff, safe_dist):
+
+        """Dictionary of pairs ``miner_name: {'block_number': int, 'payoff': float}``
+        with the blocks and payoff given out to each miner so far under a payoff
+        function and a safe distance.
+
+        Parameters
+        ----------
+
+        payoff : str
+            name of the payoff function
+        safe_dist : int
+            safe distance
+
+        Results
+        -------
+
+        partial_payoff : dict
+            blocks and payoff of each miner"""
+
+        block_numbers, payoffs = self.tables(payoff, safe_dist)
+        return {name: {'block_number': int(block_numbers[i]), 'payoff': float(payoffs[i])}
+            for i, name in enumerate(self.registry.names)}
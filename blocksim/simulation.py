@@ -1,19 +1,41 @@
 """Classes consisting of the main logic behind the simulations."""
 
-from functools import reduce
-from random import randint
+from collections import OrderedDict, deque
+from itertools import accumulate
+from sys import float_info
+from time import perf_counter
 
-from tqdm import tqdm
+import numpy as np
 
 # from tree_format import format_tree
 
-from .payoff import constant_payoff, alpha_beta_step_payoff
+from .payoff import Payoff, CallablePayoff, constant_payoff, alpha_beta_step_payoff
+from .progress import reporter
+from .propagation import Propagation
+from .randomness import RandomStream, BatchedRandomStream
+from .results import Results
+from .settlement import Settlements
+from .store import ColumnarStore
 
 
+EVENTS = frozenset({'own_block', 'published', 'depth', 'tip', 'inform'})
+"""Events of the simulation that a miner can react to. ``own_block`` happens when
+the miner finds a new block, ``published`` when some of its blocks have just been
+published, ``depth`` when the depth of the structure increases, ``tip`` when any
+block is published and ``inform`` when the miner is informed of hidden blocks."""
+
+RECENT_BRANCHES = 32
+"""Number of the most recently extended blocks whose running payoff sums are kept
+by a `Structure` besides those of the tips of its frontier, so that branches that
+fall behind but are still being extended, such as those of
+`blocksim.miners.AlwaysForkMiner`, don't have their sums rebuilt every time."""
+
 class Block:
 
     """Generate block of the data structure."""
 
+    __slots__ = ('parent', 'jump', 'owner', 'depth', 'tstamp', 'children', 'paid', 'published')
+
     def __init__(self, parent, owner, tstamp=-1):
 
         """Parameters
@@ -24,15 +46,25 @@ class Block:
         owner : blocksim.miners.Miner
             miner that created the block
         tstamp : int
-            timestamp of moment in which the block was published"""
+            timestamp of moment in which the block was published
+
+        Besides its parent, each block keeps a jump pointer to one of its
+        ancestors, chosen following a skew-binary scheme, which allows finding
+        ancestors and common ancestors in logarithmic time."""
         
         self.parent = parent
         self.owner = owner
         self.depth = parent.depth + 1 if parent is not None else 0
+        if parent is None:
+            self.jump = self
+        elif parent.depth - parent.jump.depth == parent.jump.depth - parent.jump.jump.depth:
+            self.jump = parent.jump.jump
+        else:
+            self.jump = parent
         self.tstamp = tstamp
         self.children = []
-        self.is_hidden = lambda: self not in self.parent.children
         self.paid = False
+        self.published = False
 
     def add_child(self, child):
 
@@ -58,6 +90,18 @@ class Block:
 
         self.tstamp = tstamp
 
+    def set_published(self):
+
+        """Mark block as published in the data structure."""
+
+        self.published = True
+
+    def is_hidden(self):
+
+        """Check whether block has not been published yet."""
+
+        return not self.published
+
     def set_paid(self):
 
         """Mark block as paid."""
@@ -71,31 +115,719 @@ class Block:
         return self.paid
 
 
+class HiddenBlocks:
+
+    """Generate an insertion-ordered collection of hidden blocks. It can be used
+    like a list to append blocks, iterate over them and read the first or the last
+    one, but removing a block takes constant time. Blocks are kept in an
+    `OrderedDict`, which can be iterated in reverse on every supported version of
+    Python, unlike a plain dictionary."""
+
+    __slots__ = ('blocks', 'count')
+
+    def __init__(self, blocks=()):
+
+        """Parameters
+        ----------
+        
+        blocks : iterable
+            initial blocks of the collection, in order"""
+
+        self.blocks = OrderedDict()
+        self.count = 0
+        for block in blocks:
+            self.append(block)
+
+    def append(self, block):
+
+        """Add a block at the end of the collection.
+        
+        Parameters
+        ----------
+        
+        block : blocksim.simulation.Block
+            block to add"""
+
+        self.blocks[block] = self.count
+        self.count += 1
+
+    def ordered(self, blocks):
+
+        """Sort blocks of the collection in the order in which they were added.
+        
+        Parameters
+        ----------
+        
+        blocks : iterable
+            blocks of the collection
+            
+        Results
+        -------
+        
+        blocks : list
+            the given blocks in the order in which they were added"""
+
+        return sorted(blocks, key=self.blocks.__getitem__)
+
+    def clear(self):
+
+        """Remove every block from the collection."""
+
+        self.blocks.clear()
+
+    def remove(self, block):
+
+        """Remove a block from the collection.
+        
+        Parameters
+        ----------
+        
+        block : blocksim.simulation.Block
+            block to remove"""
+
+        del self.blocks[block]
+
+    def __getitem__(self, index):
+        if not self.blocks:
+            raise IndexError("no hidden blocks")
+        if index == -1:
+            return next(reversed(self.blocks))
+        if index == 0:
+            return next(iter(self.blocks))
+        return list(self.blocks)[index]
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+    def __reversed__(self):
+        return reversed(self.blocks)
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __contains__(self, block):
+        return block in self.blocks
+
+    def __eq__(self, other):
+        return list(self.blocks) == list(other)
+
+
+class Frontier:
+
+    """Generate an index of the tips of the structure, that is, the published blocks
+    without published children, grouped by depth. The tips of each depth are kept in
+    a list, so that any of them can be read or chosen at random in constant time.
+    Tips of the deepest level are kept in the order in which they were published.
+
+    Only the tips at most `horizon` levels below the deepest level are kept. Deeper
+    levels drop the ones that fall behind, so the orphaned tips left by forks don't
+    pile up during the run, and tips published below the horizon are ignored."""
+
+    __slots__ = ('levels', 'positions', 'depth', 'floor', 'horizon')
+
+    def __init__(self, blocks=(), horizon=16):
+
+        """Parameters
+        ----------
+
+        blocks : iterable
+            initial tips of the frontier
+        horizon : int
+            number of levels below the deepest level whose tips are kept"""
+
+        self.levels = {}
+        self.positions = {}
+        self.depth = -1
+        self.floor = None
+        self.horizon = horizon
+        for block in blocks:
+            self.add(block)
+
+    def add(self, block):
+
+        """Add a tip to the frontier, unless it is below the horizon.
+
+        Parameters
+        ----------
+
+        block : blocksim.simulation.Block
+            published block without published children"""
+
+        if block.depth < self.depth - self.horizon:
+            return
+
+        level = self.levels.get(block.depth)
+        if level is None:
+            level = self.levels[block.depth] = []
+        self.positions[block] = len(level)
+        level.append(block)
+        if self.floor is None or block.depth < self.floor:
+            self.floor = block.depth
+        if block.depth > self.depth:
+            self.depth = block.depth
+            self.trim()
+
+    def trim(self):
+
+        """Drop the levels below the horizon. Levels are dropped one at a time from
+        the lowest kept level, unless the deepest level has jumped further than
+        the number of levels kept."""
+
+        limit = self.depth - self.horizon
+        if self.floor >= limit:
+            return
+        if limit - self.floor > len(self.levels):
+            depths = [depth for depth in self.levels if depth < limit]
+        else:
+            depths = range(self.floor, limit)
+        for depth in depths:
+            for block in self.levels.pop(depth, ()):
+                del self.positions[block]
+        self.floor = limit
+
+    def discard(self, block):
+
+        """Remove a block from the frontier if it is one of its tips, for example
+        because it has just got a child. Tips of the deepest level are removed
+        keeping the order of the rest, whilst tips of other levels are replaced
+        by the last tip of their level.
+
+        Parameters
+        ----------
+
+        block : blocksim.simulation.Block
+            block to remove"""
+
+        position = self.positions.pop(block, None)
+        if position is None:
+            return
+
+        level = self.levels[block.depth]
+        if block.depth == self.depth:
+            del level[position]
+            for index in range(position, len(level)):
+                self.positions[level[index]] = index
+        else:
+            last = level.pop()
+            if position < len(level):
+                level[position] = last
+                self.positions[last] = position
+
+        if not level:
+            del self.levels[block.depth]
+            if block.depth == self.depth:
+                self.depth = max(self.levels, default=-1)
+
+    def clear(self):
+
+        """Remove every tip from the frontier."""
+
+        self.levels.clear()
+        self.positions.clear()
+        self.depth = -1
+        self.floor = None
+
+    def deepest(self):
+
+        """Get the tips of the deepest level, in the order in which they were
+        published. The list is the one kept by the frontier, so it must not be
+        modified.
+
+        Results
+        -------
+
+        blocks : list
+            deepest blocks of the structure"""
+
+        return self.levels.get(self.depth, [])
+
+    def peek(self):
+
+        """Get the deepest tip that was published first, without modifying the
+        frontier.
+
+        Results
+        -------
+
+        block : blocksim.simulation.Block
+            first published block among the deepest blocks"""
+
+        return self.levels[self.depth][0]
+
+    def tips(self, depth):
+
+        """Get the tips at a given depth.
+
+        Parameters
+        ----------
+
+        depth : int
+            depth of the tips
+
+        Results
+        -------
+
+        blocks : list
+            tips at the given depth, which is empty if there are none"""
+
+        return list(self.levels.get(depth, ()))
+
+    def within(self, distance):
+
+        """Get the tips that are at most a given distance below the deepest
+        level, deepest first, in time proportional to the distance and the number
+        of tips found. Strategies that mine on forks can use it to find the tips
+        close enough to the deepest blocks without walking the structure.
+
+        Parameters
+        ----------
+
+        distance : int
+            maximum distance between the depth of a tip and the depth of the
+            deepest blocks. Tips below the horizon of the frontier are never
+            returned
+
+        Results
+        -------
+
+        blocks : list
+            tips at depths ``depth``, ``depth - 1``, ..., ``depth - distance``,
+            deepest first"""
+
+        return [block for depth in range(self.depth, self.depth - distance - 1, -1)
+            for block in self.levels.get(depth, ())]
+
+    def __iter__(self):
+        for depth in sorted(self.levels):
+            yield from self.levels[depth]
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, block):
+        return block in self.positions
+
+
+class MinerRegistry:
+
+    """Generate a registry that assigns a dense integer id to each miner, in the
+    order in which the miners are given, so that per-miner data can be kept in
+    tables indexed by id instead of dictionaries keyed by name."""
+
+    def __init__(self, miners):
+
+        """Parameters
+        ----------
+        
+        miners : list
+            list of miners participating in the simulation"""
+
+        self.miners = list(miners)
+        self.names = [miner.name for miner in self.miners]
+        self.ids = {name: i for i, name in enumerate(self.names)}
+
+    def miner(self, name):
+
+        """Find a miner by name.
+        
+        Parameters
+        ----------
+        
+        name : string
+            name of the miner
+            
+        Results
+        -------
+        
+        miner : blocksim.miners.Miner
+            miner with the given name"""
+
+        return self.miners[self.ids[name]]
+
+    def table(self, values):
+
+        """Build a table indexed by miner id from a dictionary keyed by name.
+        
+        Parameters
+        ----------
+        
+        values : dict
+            dictionary of pairs ``miner_name: value``
+            
+        Results
+        -------
+        
+        table : list
+            value of each miner, indexed by id"""
+
+        return [values[name] for name in self.names]
+
+    def __len__(self):
+        return len(self.miners)
+
+
 class Structure:
 
     """Generate data structure for conducting simulation."""
 
-    def __init__(self, payoff, miners, safe_dist):
+    def __init__(self, payoff, miners, safe_dist, rng=None, settle_batch=4096, prune_horizon=None,
+        columnar=False, frontier_horizon=16):
 
         """Parameters
         ----------
         
-        payoff : function
-            payoff function for simulation
-        miners : list
-            list of miners participating to keep track of their payoffs
+        payoff : blocksim.payoff.Payoff
+            payoff function for simulation. Plain functions are wrapped with
+            `blocksim.payoff.CallablePayoff`
+        miners : blocksim.simulation.MinerRegistry
+            registry of the miners participating to keep track of their payoffs.
+            A list of miners is also accepted
         safe_dist : int
             number indicating how many blocks have to be ahead of certain block in the
-            blockchain for its payoff to be given out"""
+            blockchain for its payoff to be given out
+        rng : blocksim.randomness.RandomStream
+            stream from which miners draw random values, for example to break
+            ties between the deepest blocks
+        settle_batch : int
+            amount of confirmed blocks that are gathered before their payoff
+            is computed at once
+        prune_horizon : int
+            if given, the structure drops the blocks that are more than this
+            amount of blocks below the deepest paid block of the main branch,
+            keeping only aggregate counters for them. See
+            `blocksim.simulation.Structure.prune` for the effect this has on
+            miners
+        columnar : bool
+            flag indicating whether blocks are kept in a
+            `blocksim.store.ColumnarStore` instead of one object per block. The
+            store is then available as `store` and blocks are
+            `blocksim.store.BlockHandle` objects, which have to be compared with
+            ``==`` instead of ``is``. Pruning doesn't free the rows of the store
+        frontier_horizon : int
+            number of levels below the deepest blocks whose tips are kept in the
+            `frontier`, see `blocksim.simulation.Frontier`"""
 
-        self.base = Block(None, None, 0)
+        self.registry = miners if isinstance(miners, MinerRegistry) else MinerRegistry(miners)
+        self.store = ColumnarStore(self.registry) if columnar else None
+        self.new_block = self.store if columnar else Block
+        self.base = self.new_block(None, None, 0)
+        self.base.set_published()
         self.base.set_paid()
-        self.deep_blocks = {self.base}
+        self.frontier = Frontier([self.base], frontier_horizon)
         self.depth = 0
         self.last_tstamp = 0
-        self.payoff = payoff
+        self.payoff = payoff if isinstance(payoff, Payoff) else CallablePayoff(payoff)
         self.safe_dist = safe_dist
-        self.partial_payoff = {miner.name: {'block_number': 0, 'payoff': 0} for miner in miners}
+        self.rng = rng if rng is not None else RandomStream()
+        self.safe_chain = deque([self.base], maxlen=safe_dist + 1)
+        self.block_numbers = np.zeros(len(self.registry), dtype=np.int64)
+        self.payoffs = np.zeros(len(self.registry))
+        self.published_numbers = np.zeros(len(self.registry), dtype=np.int64)
+        self.settle_batch = settle_batch
+        self.pending_owners = []
+        self.pending_tstamps = []
+        self.pending_depths = []
+        self.branch_sums = None
+        self.branch_payoffs = [self.payoff]
+        self.branch_index = {None: 0}
+        self.settlements = None
+        self.prune_horizon = prune_horizon
+        self.pruned_blocks = 0
+        self.pruned_orphans = 0
+        self.journal = None
+        self.paid_journal = None
+        self.trace = None
+
+    @property
+    def partial_payoff(self):
+
+        """Dictionary of pairs ``miner_name: {'block_number': int, 'payoff': float}``
+        with the blocks and payoff given out to each miner so far, built from the
+        `block_numbers` and `payoffs` tables, which are indexed by miner id.
+        Reading it settles any confirmed blocks whose payoff is still pending."""
+
+        self.flush()
+        return {name: {'block_number': int(self.block_numbers[i]), 'payoff': float(self.payoffs[i])}
+            for i, name in enumerate(self.registry.names)}
+
+    @property
+    def deep_blocks(self):
+
+        """List of the deepest blocks of the structure, in the order in which they
+        were published, kept by the `frontier` of the structure. It must not be
+        modified."""
+
+        return self.frontier.deepest()
+
+    def random_deep_block(self):
+
+        """Choose one of the deepest blocks of the structure uniformly at random,
+        in constant time. The frontier keeps the deepest blocks ordered by
+        timestamp, so that the choice only depends on the random stream of the
+        structure.
+        
+        Results
+        -------
+        
+        block : blocksim.simulation.Block
+            randomly chosen block among the deepest blocks"""
+
+        deep_blocks = self.frontier.deepest()
+        if len(deep_blocks) == 1:
+            return deep_blocks[0]
+        return self.rng.choice(deep_blocks)
+
+    def ancestor(self, block, depth):
+
+        """Find the ancestor of a block at a given depth in logarithmic time,
+        following the jump pointers of the blocks.
+        
+        Parameters
+        ----------
+        
+        block : blocksim.simulation.Block
+            block whose ancestor is requested
+        depth : int
+            depth of the ancestor
+            
+        Results
+        -------
+        
+        ancestor : blocksim.simulation.Block
+            ancestor of the block at the given depth, or None if it is not part
+            of the structure anymore because it has been pruned"""
+
+        while block.depth > depth:
+            if block.parent is None:
+                return None
+            block = block.jump if block.jump.depth >= depth else block.parent
+        return block
+
+    def common_ancestor(self, blocks):
+
+        """Find the deepest common ancestor of a group of blocks in logarithmic
+        time for each block.
+        
+        Parameters
+        ----------
+        
+        blocks : iterable
+            non-empty group of blocks
+            
+        Results
+        -------
+        
+        ancestor : blocksim.simulation.Block
+            deepest block that is an ancestor of every block of the group, or
+            None if it is not part of the structure anymore because it has been
+            pruned"""
+
+        blocks = iter(blocks)
+        common = next(blocks)
+        for block in blocks:
+            if common is None:
+                return None
+            depth = min(common.depth, block.depth)
+            common = self.ancestor(common, depth)
+            block = self.ancestor(block, depth)
+            while common != block:
+                if common is None or block is None or common.parent is None or block.parent is None:
+                    return None
+                if common.jump != block.jump:
+                    common, block = common.jump, block.jump
+                else:
+                    common, block = common.parent, block.parent
+        return common
+
+    def branch_payoff(self, block, miner):
+
+        """Compute the payoff a miner gets from the branch that goes from the
+        root of the structure to a published block. Running sums of the payoff
+        of each miner are kept for the tips of the `frontier`, so the result is
+        obtained in constant time for those blocks, which include the deepest
+        blocks. For any other block, the sums are rebuilt by `path_sums`. The
+        sums carry rounding errors, so branches are compared exactly through
+        `best_branches`.
+
+        The sums are only kept once this method has been called for the first
+        time, which takes a single pass over the structure.
+        
+        Parameters
+        ----------
+        
+        block : blocksim.simulation.Block
+            published block where the branch ends
+        miner : blocksim.miners.Miner
+            miner whose payoff is requested
+            
+        Results
+        -------
+        
+        payoff : float
+            payoff of the miner in the branch"""
+
+        if self.branch_sums is None:
+            self.track_branches()
+
+        miner_id = self.branch_index[getattr(miner, 'payoff', None)] * len(self.registry) + self.registry.ids[miner.name]
+        if block in self.branch_sums:
+            return self.branch_sums[block][miner_id]
+        return self.path_sums(block)[miner_id]
+
+    def best_branches(self, blocks, miner):
+
+        """Find the blocks of a group whose branch from the common ancestor of the
+        group gives a miner the largest payoff. The running sums of
+        `branch_payoff` rule out the blocks that are clearly behind, allowing for
+        their rounding errors, and the payoff of the rest is added up again from
+        the common ancestor by the payoff function, so that branches that tie
+        are found exactly.
+
+        Parameters
+        ----------
+
+        blocks : list
+            published blocks at the same depth, such as the deepest blocks
+        miner : blocksim.miners.Miner
+            miner whose payoff is compared
+
+        Results
+        -------
+
+        best : list
+            blocks whose branch gives the largest payoff, in the order in which
+            they were given"""
+
+        sums = [self.branch_payoff(block, miner) for block in blocks]
+        best = max(sums)
+        margin = 4 * (self.depth + 2) * float_info.epsilon * max(abs(best), abs(min(sums)))
+        candidates = [block for block, payoff in zip(blocks, sums) if payoff >= best - margin]
+        if len(candidates) == 1:
+            return candidates
+
+        common = self.common_ancestor(blocks)
+        if common is None:
+            common = self.base
+        payoff = self.branch_payoffs[self.branch_index[getattr(miner, 'payoff', None)]]
+        exact = []
+        for block in candidates:
+            payoff_dict = payoff(block, common, self.base)
+            exact.append(payoff_dict[miner.name]['payoff'] if miner.name in payoff_dict else 0)
+        best = max(exact)
+        return [block for block, payoff in zip(candidates, exact) if payoff == best]
+
+    def track_branches(self):
+
+        """Start keeping the running payoff sums of every tip of the `frontier`,
+        computing them in a single pass over the structure. Tips that fall out of
+        the frontier lose their sums once they stop being extended, and the
+        sums are rebuilt by `path_sums` if they are needed again. The sums are
+        kept in the order in which the blocks were added."""
+
+        self.branch_sums = OrderedDict()
+        stack = [(self.base, [0] * (len(self.registry) * len(self.branch_payoffs)))]
+        while stack:
+            block, sums = stack.pop()
+            if block.children:
+                for child in block.children:
+                    child_sums = list(sums)
+                    self.add_values(child_sums, child)
+                    stack.append((child, child_sums))
+            elif block in self.frontier:
+                self.branch_sums[block] = sums
+
+    def trim_branches(self):
+
+        """Drop the running payoff sums of the blocks that are no longer tips of
+        the `frontier`, except for the `RECENT_BRANCHES` blocks extended last. It
+        is called when the sums outnumber the tips by far, so that its cost is
+        spread over the blocks added in between."""
+
+        recent = set(list(self.branch_sums)[-RECENT_BRANCHES:])
+        self.branch_sums = OrderedDict((block, sums) for block, sums in self.branch_sums.items()
+            if block in self.frontier or block in recent)
+
+    def path_sums(self, block):
+
+        """Rebuild the running payoff sums of a published block whose sums aren't
+        kept, going through its common ancestor with the first of the deepest
+        blocks, whose sums are always kept. The values of the blocks between
+        the deepest block and the common ancestor are subtracted from the sums
+        of the former and those of the blocks between the common ancestor and
+        the block are added. If the block is no longer connected to the root
+        of the structure, its sums are added up towards the root.
+        
+        Parameters
+        ----------
+        
+        block : blocksim.simulation.Block
+            published block
+            
+        Results
+        -------
+        
+        sums : list
+            payoff of each miner in the branch from the root to the block,
+            indexed by miner id"""
+
+        leaf = self.frontier.peek()
+        common = self.common_ancestor((leaf, block))
+
+        if common is None:
+            sums = [0] * (len(self.registry) * len(self.branch_payoffs))
+            while block.parent is not None:
+                self.add_values(sums, block)
+                block = block.parent
+            return sums
+
+        sums = list(self.branch_sums[leaf])
+        while leaf != common:
+            self.add_values(sums, leaf, -1)
+            leaf = leaf.parent
+        while block != common:
+            self.add_values(sums, block)
+            block = block.parent
+        return sums
+
+    def add_values(self, sums, block, sign=1):
+
+        """Add the value of a block under every payoff function whose branch sums
+        are kept to the running sums of its owner.
+        
+        Parameters
+        ----------
+        
+        sums : list
+            running payoff sums, holding the payoff of each miner under each
+            payoff function in `branch_payoffs`, one after the other
+        block : blocksim.simulation.Block
+            published block
+        sign : int
+            1 to add the values of the block and -1 to subtract them"""
+
+        miner_id = self.registry.ids[block.owner.name]
+        miner_nr = len(self.registry)
+        for i, payoff in enumerate(self.branch_payoffs):
+            sums[i * miner_nr + miner_id] += sign * payoff.block_value(block)
+
+    def track_payoff(self, name, payoff):
+
+        """Keep the branch sums of a payoff function besides the payoff function
+        of the structure, so that miners whose `payoff` attribute holds its name
+        can optimize it through `branch_payoff`. It has to be called before the
+        simulation starts.
+        
+        Parameters
+        ----------
+        
+        name : str
+            name of the payoff function
+        payoff : blocksim.payoff.Payoff
+            payoff function"""
+
+        if name not in self.branch_index:
+            self.branch_index[name] = len(self.branch_payoffs)
+            self.branch_payoffs.append(payoff)
 
     def add_block(self, block):
 
@@ -108,38 +840,201 @@ class Structure:
             revealed block to add to the data structure"""
 
         block.set_tstamp(self.last_tstamp + 1)
+        block.set_published()
+        self.published_numbers[self.registry.ids[block.owner.name]] += 1
+        if self.journal is not None:
+            self.journal.append(block)
+        if self.trace is not None:
+            self.trace.published(block)
+
+        if self.branch_sums is not None:
+            sums = self.branch_sums.pop(block.parent, None)
+            if sums is None:
+                sums = self.path_sums(block.parent)
+            self.add_values(sums, block)
+            self.branch_sums[block] = sums
+
         block.parent.add_child(block)
+        self.frontier.add(block)
+        self.frontier.discard(block.parent)
+        if self.branch_sums is not None and len(self.branch_sums) > 2 * (len(self.frontier) + RECENT_BRANCHES):
+            self.trim_branches()
 
-        if block.depth == self.depth:
-            self.deep_blocks.add(block)
-        elif block.depth > self.depth:
-            self.deep_blocks = {block}
+        if block.depth > self.depth:
             self.depth = block.depth
+            self.extend_safe_chain(block)
+            if self.settlements is not None:
+                self.settlements.settle(self, block)
             if block.depth > self.safe_dist:
-                first_paid = block
-                for _ in range(self.safe_dist):
-                    first_paid = first_paid.parent
-
-                last_paid = first_paid
-                last_paid.set_paid()
-                while last_paid.parent is not None and not last_paid.parent.is_paid():
-                    last_paid = last_paid.parent
-                    last_paid.set_paid()
-                
-                new_payoffs = self.payoff(first_paid, last_paid, self.base)
-
-                for miner_name in new_payoffs:
-                    self.partial_payoff[miner_name]['block_number'] += new_payoffs[miner_name]['block_number']
-                    self.partial_payoff[miner_name]['payoff'] += new_payoffs[miner_name]['payoff']
+                self.settle(self.safe_chain[0])
+                if self.prune_horizon is not None and \
+                    self.safe_chain[0].depth - self.base.depth > 2 * self.prune_horizon:
+                    root = self.safe_chain[0]
+                    for _ in range(self.prune_horizon):
+                        root = root.parent
+                    self.prune(root)
 
         self.last_tstamp += 1
+
+    def unsettled_numbers(self):
+
+        """Count the blocks of each miner in the branch of the deepest block
+        that have not been paid yet, which are at most ``safe_dist`` blocks.
+        
+        Results
+        -------
+        
+        unsettled : numpy.ndarray
+            number of unpaid blocks of each miner in the main branch, indexed by
+            miner id"""
+
+        unsettled = np.zeros(len(self.registry), dtype=np.int64)
+        block = self.safe_chain[-1]
+        while not block.is_paid():
+            unsettled[self.registry.ids[block.owner.name]] += 1
+            block = block.parent
+        return unsettled
+
+    def extend_safe_chain(self, block):
+
+        """Update the safe chain, which holds the last ``safe_dist + 1`` blocks of
+        the branch ending in the deepest block, so that its first element is the
+        block that has just become safe. When the new deepest block extends the
+        previous one this takes constant time. Otherwise the chain is rebuilt by
+        walking ``safe_dist`` parents from the new deepest block.
+        
+        Parameters
+        ----------
+        
+        block : blocksim.simulation.Block
+            new deepest block of the data structure"""
+
+        if block.parent == self.safe_chain[-1]:
+            self.safe_chain.append(block)
+        else:
+            self.safe_chain.clear()
+            while block is not None and len(self.safe_chain) < self.safe_chain.maxlen:
+                self.safe_chain.appendleft(block)
+                block = block.parent
+
+    def settle(self, first_paid):
+
+        """Pay out a block that has just become safe along with every ancestor
+        that has not been paid yet, in a single walk towards the root. Blocks are
+        gathered so that their payoff is computed in batches by the payoff
+        function, unless it can only evaluate one block at a time.
         
+        Parameters
+        ----------
+        
+        first_paid : blocksim.simulation.Block
+            deepest block to be paid"""
+
+        block = first_paid
+        if self.payoff.batched:
+            while not block.is_paid():
+                block.set_paid()
+                if self.paid_journal is not None:
+                    self.paid_journal.append(block)
+                if self.trace is not None:
+                    self.trace.paid(block)
+                self.pending_owners.append(self.registry.ids[block.owner.name])
+                self.pending_tstamps.append(block.tstamp)
+                self.pending_depths.append(block.depth)
+                block = block.parent
+            if len(self.pending_owners) >= self.settle_batch:
+                self.flush()
+        else:
+            while not block.is_paid():
+                block.set_paid()
+                if self.paid_journal is not None:
+                    self.paid_journal.append(block)
+                if self.trace is not None:
+                    self.trace.paid(block)
+                miner_id = self.registry.ids[block.owner.name]
+                self.block_numbers[miner_id] += 1
+                self.payoffs[miner_id] += self.payoff.block_value(block)
+                block = block.parent
+
+    def prune(self, root):
+
+        """Make a paid block of the main branch the new root of the structure,
+        dropping every block that is not one of its descendants. Dropped blocks
+        are only kept as the aggregate counters `pruned_blocks` and
+        `pruned_orphans`, the latter counting the dropped blocks that were never
+        paid. Pruning is done in batches, so the root lags between
+        ``prune_horizon`` and ``2 * prune_horizon`` blocks behind the deepest
+        paid block.
+
+        After pruning, `base` is the new root and its parent is None. The
+        dropped blocks lose their children, so they are no longer reachable
+        from `base`. The dropped blocks of the main branch also lose their
+        parents, whilst the rest keep them. A miner that holds a reference
+        to a dropped block, or to a hidden block built on top of one, can still
+        publish blocks on top of it. Those blocks are added normally but their
+        branch does not lead to `base`, so miners that walk towards the root have
+        to stop at a block whose parent is None, and the blocks of such a branch
+        are not counted in the pruning counters. The built-in miners only hold
+        blocks this far behind when a withheld or forked branch is longer than
+        ``safe_dist + prune_horizon`` blocks.
+
+        Parameters
+        ----------
+
+        root : blocksim.simulation.Block
+            paid block of the main branch that becomes the new root"""
+
+        block = root
+        parent = root.parent
+        root.parent = None
+        while parent is not None:
+            stack = [child for child in parent.children if child != block]
+            while stack:
+                dropped = stack.pop()
+                stack.extend(dropped.children)
+                dropped.children = []
+                if self.branch_sums is not None:
+                    self.branch_sums.pop(dropped, None)
+                if self.settlements is not None:
+                    self.settlements.forget(dropped)
+                self.frontier.discard(dropped)
+                self.pruned_blocks += 1
+                if not dropped.is_paid():
+                    self.pruned_orphans += 1
+            parent.children = []
+            if parent.owner is not None:
+                self.pruned_blocks += 1
+            block, parent = parent, parent.parent
+            block.parent = None
+            block.jump = block
+
+        self.base = root
+
+    def flush(self):
+
+        """Compute the payoff of the confirmed blocks gathered so far and add it
+        to the tables of their owners."""
+
+        if not self.pending_owners:
+            return
+
+        block_numbers, payoffs = self.payoff.settle(self.pending_owners, self.pending_tstamps,
+            self.pending_depths, len(self.registry))
+        self.block_numbers += block_numbers
+        self.payoffs += payoffs
+
+        self.pending_owners = []
+        self.pending_tstamps = []
+        self.pending_depths = []
+
 
 class Simulation:
 
     """Generate a simulation object to run simulations using certain parameters."""
 
-    def __init__(self, miners, h, step_nr, safe_dist=0, payoff=alpha_beta_step_payoff(1, 1, 1)):
+    def __init__(self, miners, h, step_nr, safe_dist=0, payoff=alpha_beta_step_payoff(1, 1, 1),
+        seed=None, chunk_size=None, prune_horizon=None, termination=None, columnar=False, fast_path=True,
+        payoffs=None, safe_dists=None):
 
         """Parameters
         ----------
@@ -149,21 +1044,145 @@ class Simulation:
         h : dict
             dictionary of pairs {miner name: hash power value}. The greater
             the hash power value the likelier it is for the miner to get
-            assigned the next new block
+            assigned the next new block. Values can be integers or floats
         step_nr : int
             number of blocks to generate before the simulation ends
         safe_dist : int
             number indicating how many blocks have to be ahead of a certain
             block in the blockchain for its payoff to be given out
-        payoff : function
-            payoff function for simulation blocks"""
+        payoff : blocksim.payoff.Payoff
+            payoff function for simulation blocks
+        seed : int
+            seed for every random draw of the simulation. Runs with the same
+            seed and parameters are identical
+        chunk_size : int
+            if given, the random values are pre-drawn with NumPy in chunks of
+            this size instead of being drawn one at a time, which is faster
+            on long runs
+        prune_horizon : int
+            if given, settled blocks far enough behind the deepest paid block
+            are dropped from the structure so that memory stays bounded. See
+            `blocksim.simulation.Structure.prune`
+        termination : function
+            termination policy for the spread of information after each step,
+            such as the ones created by `blocksim.propagation.max_rounds`. By
+            default information spreads until no miner has anything left to do
+        columnar : bool
+            flag indicating whether blocks are kept in columns instead of one
+            object per block, which takes less memory in very long runs. See
+            `blocksim.store`
+        fast_path : bool
+            flag indicating whether runs in which every miner is honest go
+            through the vectorized engine of `blocksim.fastpath`, which gives
+            the same results much faster but only keeps the blocks that have
+            not been paid yet. The `vectorized` attribute tells whether a run went
+            through it
+        payoffs : dict
+            dictionary of pairs ``name: payoff`` with other payoff functions to
+            settle the blocks with during the same run, see
+            `blocksim.settlement`. Miners optimize the payoff function named by
+            their `payoff` attribute, or `payoff` if it is None
+        safe_dists : iterable
+            other safe distances to settle the blocks with during the same run.
+            Every combination of them, `safe_dist`, `payoff` and the payoff
+            functions in `payoffs` is available through `results`. When the
+            structure is pruned they can be at most ``safe_dist + prune_horizon``"""
 
         self.miners = miners
-        self.h = h
+        self.registry = MinerRegistry(miners)
         self.step_nr = step_nr
-        self.tot_h = reduce(lambda x, y: x + y, h.values())
-        self.struct = Structure(payoff, miners, safe_dist)
-        self.hidden_blocks = []
+        self.rng = BatchedRandomStream(seed, chunk_size) if chunk_size else RandomStream(seed)
+        self.set_hash_power(h)
+        self.struct = Structure(payoff, self.registry, safe_dist, self.rng, prune_horizon=prune_horizon,
+            columnar=columnar)
+        if payoffs or safe_dists:
+            self.settle_many(payoffs or {}, safe_dists or ())
+        self.hidden_blocks = HiddenBlocks()
+        self.steps = 0
+        self.wall_time = 0
+        self.started = None
+        self.fast_path = fast_path
+        self.vectorized = False
+        self.subscribers = {event: set() for event in EVENTS}
+        for miner in miners:
+            for event in self.miner_events(miner):
+                self.subscribers[event].add(miner)
+        self.propagation = Propagation(self.struct, self.registry, self.hidden_blocks, self.subscribers, termination)
+
+    def settle_many(self, payoffs, safe_dists):
+
+        """Settle the blocks of the simulation under several payoff functions and
+        safe distances, besides the ones of the structure, and keep the branch
+        sums of the payoff functions named by the miners.
+        
+        Parameters
+        ----------
+        
+        payoffs : dict
+            dictionary of pairs ``name: payoff`` with other payoff functions
+        safe_dists : iterable
+            other safe distances"""
+
+        struct = self.struct
+        payoffs = {name: payoff if isinstance(payoff, Payoff) else CallablePayoff(payoff)
+            for name, payoff in payoffs.items()}
+        safe_dists = set(safe_dists) | {struct.safe_dist}
+        if struct.prune_horizon is not None and max(safe_dists) > struct.safe_dist + struct.prune_horizon:
+            raise ValueError("Safe distances can be at most safe_dist + prune_horizon when pruning")
+
+        for miner in self.miners:
+            name = getattr(miner, 'payoff', None)
+            if name is not None:
+                if name not in payoffs:
+                    raise ValueError("Miner {} optimizes unknown payoff {!r}".format(miner.name, name))
+                struct.track_payoff(name, payoffs[name])
+
+        struct.settlements = Settlements({None: struct.payoff, **payoffs}, safe_dists, self.registry,
+            struct.settle_batch)
+
+    def miner_events(self, miner):
+
+        """Find the events a miner reacts to. Miners declare them through an
+        ``events`` class attribute. If a class overrides `publish` or `inform`
+        without declaring its events again, or if no class declares them, the
+        miner is assumed to react to every event.
+        
+        Parameters
+        ----------
+        
+        miner : blocksim.miners.Miner
+            miner whose events are requested
+            
+        Results
+        -------
+        
+        events : frozenset
+            events the miner reacts to"""
+
+        for cls in type(miner).__mro__:
+            if 'events' in vars(cls):
+                return EVENTS & vars(cls)['events']
+            if 'publish' in vars(cls) or 'inform' in vars(cls):
+                break
+        return EVENTS
+
+    def set_hash_power(self, h):
+
+        """Set the hash power values of the miners and rebuild the cumulative
+        weights used to choose the owner of each new block. This method has to
+        be called whenever the hash power values change.
+        
+        Parameters
+        ----------
+        
+        h : dict
+            dictionary of pairs {miner name: hash power value}"""
+
+        self.h = h
+        self.hash_power = self.registry.table(h)
+        self.cum_h = list(accumulate(self.hash_power))
+        self.tot_h = self.cum_h[-1]
+        self.rng.set_weights(self.cum_h)
 
     def add_hidden_block(self, owner, parent):
 
@@ -177,8 +1196,10 @@ class Simulation:
         parent : blocksim.simulation.Block
             parent block for the new block"""
 
-        new_block = Block(parent, owner)
+        new_block = self.struct.new_block(parent, owner)
         self.hidden_blocks.append(new_block)
+        if self.struct.trace is not None:
+            self.struct.trace.created(new_block)
         owner.add_hidden_block(new_block)
 
     def check_publishable(self, miner):
@@ -188,9 +1209,13 @@ class Simulation:
         to reveal any of their hidden blocks or to communicate any of them to other
         miners. After this, any miner which has gotten new information through
         the reveal of a new block or through a message received can choose to
-        reveal a block or communicate blocks to other miners. This iterative
+        reveal a block or communicate blocks to other miners. Only the miners
+        that react to the events that took place are called again, according to
+        the events they declare (see `blocksim.simulation.EVENTS`). This iterative
         process continues until there is a cycle in which no miners have gotten
-        new information.
+        new information. The process is carried out by the propagation engine of
+        the simulation, `blocksim.propagation.Propagation`, which also collects
+        statistics about it.
         
         Parameters
         ----------
@@ -198,51 +1223,21 @@ class Simulation:
         miner : blocksim.miners.Miner
             owner of the block generated in the current cycle"""
 
-        updated_miners = {miner}
-        while updated_miners:
-            prev_miners = updated_miners
-            updated_miners = set()
-            publishable = set()
-            informable = dict()
-            for miner in prev_miners:
-                publish = miner.publish(self.struct)
-                inform = miner.inform(self.struct)
-                if publish:
-                    updated_miners = set(self.miners)
-                    publishable |= publish
-                if inform:
-                    for i_miner in inform:
-                        updated_miners.add(i_miner)
-                        if i_miner not in informable:
-                            informable[i_miner] = set()
-                        informable[i_miner] |= inform[i_miner]
-            
-            for block in publishable:
-                self.struct.add_block(block)
-                self.hidden_blocks.remove(block)
-            
-            for miner_name in informable:
-                for block in informable[miner_name]:
-                    miner = next((x for x in self.miners if x.name == miner_name), None)
-                    miner.add_known_block(block)
+        self.propagation.run([miner] if miner in self.subscribers['own_block'] else [])
 
     def step(self):
 
         """Simulates one step of the experiment. Firstly, the algorithm
         chooses one miner randomly, with the probability of selecting a
         miner being determined by their hash power value divided by
-        the total hash power value of all miners. After this a block
+        the total hash power value of all miners. The miner is drawn from the
+        random stream of the simulation through a binary search over the
+        cumulative hash power values. After this a block
         is created with said miner as its owner. Lastly, we call the
         `blocksim.simulation.Simulation.check_publishable` method, which
         spreads information between the different miners."""
 
-        rand_miner = randint(1, self.tot_h)
-        for miner in self.miners:
-            if rand_miner <= self.h[miner.name]:
-                owner = miner
-                break
-            else:
-                rand_miner -= self.h[miner.name]
+        owner = self.miners[self.rng.winner()]
         parent = owner.strat(self.struct)
         self.add_hidden_block(owner, parent)
         self.check_publishable(owner)
@@ -252,62 +1247,141 @@ class Simulation:
         """Considering that the simulation has a finite number on steps,
         this method is called at the end of the process, to make sure that
         every miner can disclose their hidden blocks at the end of the
-        simulation, for them to count towards their payoff."""
-
-        updated_miners = set(self.miners)
-        while updated_miners:
-            prev_miners = updated_miners
-            updated_miners = set()
-            publishable = set()
-            informable = dict()
-            for miner in prev_miners:
-                publish = miner.publish(self.struct, True)
-                inform = miner.inform(self.struct, True)
-                if publish:
-                    updated_miners = set(self.miners)
-                    publishable |= publish
-                if inform:
-                    for i_miner in inform:
-                        updated_miners.add(i_miner)
-                        if i_miner not in informable:
-                            informable[i_miner] = set()
-                        informable[i_miner] |= inform[i_miner]
-            
-            for block in publishable:
-                self.struct.add_block(block)
-                self.hidden_blocks.remove(block)
-            
-            for miner_name in informable:
-                for block in informable[miner_name]:
-                    miner = next((x for x in self.miners if x.name == miner_name), None)
-                    miner.add_known_block(block)
+        simulation, for them to count towards their payoff. It uses the same
+        propagation engine as `blocksim.simulation.Simulation.check_publishable`,
+        starting with every miner."""
+
+        self.propagation.run(self.miners, True)
 
-    def simulate(self):
+    def simulate(self, progress=None, checkpoint=None, instrumentation=None, trace=None):
 
         """Conducts the simulation itself. Runs the number of steps specified
         on the instatiation of the simulation object and calculates the payoff
-        that each miner receives and saves this data."""
+        that each miner receives and saves this data. When there is a progress
+        reporter or a checkpointer the steps are run in chunks, between which
+        they are updated, so they add no per-step cost. A simulation restored
+        from a checkpoint only runs the steps that are left. Simulations in
+        which every miner is honest are run through the vectorized engine of
+        `blocksim.fastpath` unless `fast_path` is False or there is a
+        checkpointer or an instrumentation.
+        
+        Parameters
+        ----------
+        
+        progress : bool or blocksim.progress.Progress
+            progress reporter, see `blocksim.progress`. True displays a progress
+            bar, whilst None and False disable reporting
+        checkpoint : blocksim.checkpoint.Checkpointer
+            checkpointer that saves the state of the simulation every `every`
+            steps, see `blocksim.checkpoint`
+        instrumentation : blocksim.instrumentation.Instrumentation
+            instrumentation that counts and times the phases of the steps, see
+            `blocksim.instrumentation`. It can't be combined with a checkpointer
+        trace : blocksim.trace.Trace
+            trace to which a record is written for every block created,
+            published, communicated to a miner or paid, see `blocksim.trace`"""
+
+        # imported here because blocksim.fastpath depends on blocksim.miners,
+        # which imports this module
+        from .fastpath import honest, run_honest
 
-        for _ in tqdm(range(self.step_nr)):
-            self.step()
+        if checkpoint is not None and self.struct.settlements is not None:
+            raise ValueError("Runs with several payoffs or safe distances can't be checkpointed")
+        if instrumentation is not None:
+            if checkpoint is not None:
+                raise ValueError("Instrumented runs can't be checkpointed")
+            instrumentation.attach(self)
+        if trace is not None:
+            trace.attach(self)
 
-        self.uncover_on_end()
+        progress = reporter(progress)
+        self.started = perf_counter()
+
+        try:
+            if self.fast_path and checkpoint is None and instrumentation is None and honest(self):
+                run_honest(self, progress)
+            elif progress is None and checkpoint is None:
+                for _ in range(self.step_nr - self.steps):
+                    self.step()
+                self.steps = max(self.steps, self.step_nr)
+            else:
+                if progress is not None:
+                    progress.start(self.step_nr)
+                if checkpoint is not None:
+                    checkpoint.attach(self)
+                while self.steps < self.step_nr:
+                    chunk = self.step_nr - self.steps
+                    for periodic in (progress, checkpoint):
+                        if periodic is not None:
+                            chunk = min(chunk, periodic.every - self.steps % periodic.every)
+                    for _ in range(chunk):
+                        self.step()
+                    self.steps += chunk
+                    if progress is not None and (self.steps % progress.every == 0 or self.steps == self.step_nr):
+                        progress.update(self.steps)
+                    if checkpoint is not None and self.steps % checkpoint.every == 0:
+                        checkpoint.save(self)
+                if progress is not None:
+                    progress.close()
+
+            self.uncover_on_end()
+            self.struct.flush()
+            if self.struct.settlements is not None:
+                self.struct.settlements.flush()
+        finally:
+            if instrumentation is not None:
+                instrumentation.detach()
+            if trace is not None:
+                trace.detach()
+        self.wall_time += perf_counter() - self.started
+        self.started = None
+
+    def results(self, payoff=None, safe_dist=None):
+
+        """Collect the results of the simulation. It can also be called while
+        the simulation runs, for example from a progress reporter, to take a
+        snapshot of the results so far, in which case the steps are counted up
+        to the last update of the reporter.
+        
+        Parameters
+        ----------
+        
+        payoff : str
+            name of one of the payoff functions given in `payoffs`, or None for
+            the payoff function of the simulation
+        safe_dist : int
+            one of the safe distances of the simulation, or None for `safe_dist`
+        
+        Results
+        -------
+        
+        results : blocksim.results.Results
+            results of the simulation under the given payoff function and safe
+            distance"""
+
+        struct = self.struct
+        wall_time = self.wall_time + (perf_counter() - self.started if self.started is not None else 0)
+        if payoff is None and safe_dist in (None, struct.safe_dist):
+            struct.flush()
+            block_numbers, payoffs = struct.block_numbers, struct.payoffs
+            unsettled = struct.unsettled_numbers()
+        elif struct.settlements is None:
+            raise ValueError("The simulation only settles its own payoff and safe distance")
+        else:
+            safe_dist = struct.safe_dist if safe_dist is None else safe_dist
+            block_numbers, payoffs = struct.settlements.tables(payoff, safe_dist)
+            unsettled = struct.settlements.unsettled_numbers(safe_dist, struct.safe_chain[-1])
+        orphans = struct.published_numbers - block_numbers - unsettled
+
+        return Results(self.registry.names, self.hash_power, block_numbers, payoffs,
+            orphans, struct.depth, self.steps, wall_time)
 
     def print_results(self):
 
         """Prints the results of the simulation, displaying the hash power value,
         the block number and the payoff for each of the miners."""
 
-        tot_blocks = reduce(lambda x, y: x + y, map(lambda x: x["block_number"], self.struct.partial_payoff.values()))
-        tot_payoff = reduce(lambda x, y: x + y, map(lambda x: x["payoff"], self.struct.partial_payoff.values()))
-
-        print("==========")
-        for miner in self.miners:
-            print("Miner: {}".format(miner.name))
-            print("Hash Power: {} ({:.2f}%)".format(self.h[miner.name], self.h[miner.name] * 100 / self.tot_h))
-            print("Block Number: {} ({:.2f}%)".format(self.struct.partial_payoff[miner.name]["block_number"], self.struct.partial_payoff[miner.name]["block_number"] * 100 / tot_blocks if tot_blocks else 0))
-            print("Payoff: {:.2f} ({:.2f}%)".format(self.struct.partial_payoff[miner.name]["payoff"], self.struct.partial_payoff[miner.name]["payoff"] * 100 / tot_payoff if tot_payoff else 0))
-            print("==========")
+        self.results().print_results()
 
     # def print_struct(self):
 
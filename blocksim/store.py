@@ -0,0 +1,309 @@
+"""Columnar storage for the blocks of a simulation. Instead of one Python object per
+block, `ColumnarStore` keeps the parent, jump pointer, owner id, depth, timestamp,
+first child, next sibling and flags of every block in growable columns of the
+`array` module. A run of a million steps takes around 46 bytes per block, the
+spare capacity of the columns included. Blocks are identified by their row in the
+columns.
+
+Miners and the structure access the blocks through `BlockHandle` objects, which
+are created on demand and follow the attribute API of `blocksim.simulation.Block`.
+Two handles of the same block compare equal and have the same hash, but they are
+not necessarily the same object, so blocks have to be compared with ``==`` rather
+than ``is``. After a run the columns can be read as NumPy arrays, without copying
+them, for vectorized analysis."""
+
+from array import array
+
+import numpy as np
+
+
+PUBLISHED = 1
+"""Flag of the published blocks."""
+
+PAID = 2
+"""Flag of the paid blocks."""
+
+
+class BlockHandle:
+
+    """Generate a handle to a block of a `blocksim.store.ColumnarStore`."""
+
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+
+        """Parameters
+        ----------
+
+        store : blocksim.store.ColumnarStore
+            store that holds the block
+        index : int
+            row of the block in the columns of the store"""
+
+        self.store = store
+        self.index = index
+
+    @property
+    def parent(self):
+
+        """Parent block, or None for the root of the structure."""
+
+        parent = self.store.parents[self.index]
+        return BlockHandle(self.store, parent) if parent >= 0 else None
+
+    @parent.setter
+    def parent(self, parent):
+        self.store.parents[self.index] = parent.index if parent is not None else -1
+
+    @property
+    def jump(self):
+
+        """Ancestor to which the jump pointer of the block points."""
+
+        return BlockHandle(self.store, self.store.jumps[self.index])
+
+    @jump.setter
+    def jump(self, jump):
+        self.store.jumps[self.index] = jump.index
+
+    @property
+    def owner(self):
+
+        """Miner that created the block, or None for the genesis block."""
+
+        owner = self.store.owners[self.index]
+        return self.store.registry.miners[owner] if owner >= 0 else None
+
+    @property
+    def depth(self):
+
+        """Depth of the block."""
+
+        return self.store.depths[self.index]
+
+    @depth.setter
+    def depth(self, depth):
+        self.store.depths[self.index] = depth
+
+    @property
+    def tstamp(self):
+
+        """Timestamp of publication of the block."""
+
+        return self.store.tstamps[self.index]
+
+    @property
+    def children(self):
+
+        """List of the children of the block, in the order in which they were
+        added. Assigning an empty list removes every child."""
+
+        store = self.store
+        children = []
+        child = store.first_children[self.index]
+        while child >= 0:
+            children.append(BlockHandle(store, child))
+            child = store.next_siblings[child]
+        children.reverse()
+        return children
+
+    @children.setter
+    def children(self, children):
+        self.store.first_children[self.index] = -1
+        for child in children:
+            self.add_child(child)
+
+    @property
+    def published(self):
+
+        """Flag indicating whether the block has been published."""
+
+        return bool(self.store.flags[self.index] & PUBLISHED)
+
+    @property
+    def paid(self):
+
+        """Flag indicating whether the block has been paid."""
+
+        return bool(self.store.flags[self.index] & PAID)
+
+    def add_child(self, child):
+
+        """Add child block to current block.
+
+        Parameters
+        ----------
+
+        child : blocksim.store.BlockHandle
+            child block of current block"""
+
+        self.store.next_siblings[child.index] = self.store.first_children[self.index]
+        self.store.first_children[self.index] = child.index
+
+    def set_tstamp(self, tstamp):
+
+        """Set timestamp of publication for current block.
+
+        Parameters
+        ----------
+
+        tstamp : int
+            timestamp of publication for current block"""
+
+        self.store.tstamps[self.index] = tstamp
+
+    def set_published(self):
+
+        """Mark block as published in the data structure."""
+
+        self.store.flags[self.index] |= PUBLISHED
+
+    def is_hidden(self):
+
+        """Check whether block has not been published yet."""
+
+        return not self.store.flags[self.index] & PUBLISHED
+
+    def set_paid(self):
+
+        """Mark block as paid."""
+
+        self.store.flags[self.index] |= PAID
+
+    def is_paid(self):
+
+        """Check whether block has been paid."""
+
+        return bool(self.store.flags[self.index] & PAID)
+
+    def __eq__(self, other):
+        return isinstance(other, BlockHandle) and self.index == other.index and self.store is other.store
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.index)
+
+    def __repr__(self):
+        return 'BlockHandle({})'.format(self.index)
+
+
+class ColumnarStore:
+
+    """Generate a columnar store of blocks. Calling the store creates a block, with
+    the same arguments as `blocksim.simulation.Block`, and returns its handle."""
+
+    def __init__(self, registry):
+
+        """Parameters
+        ----------
+
+        registry : blocksim.simulation.MinerRegistry
+            registry of the miners, used to store the owner of each block as
+            its id"""
+
+        self.registry = registry
+        self.parents = array('q')
+        self.jumps = array('q')
+        self.first_children = array('q')
+        self.next_siblings = array('q')
+        self.owners = array('i')
+        self.depths = array('i')
+        self.tstamps = array('i')
+        self.flags = array('B')
+
+    def __call__(self, parent, owner, tstamp=-1):
+
+        """Create a block. Its jump pointer follows the same skew-binary scheme
+        as `blocksim.simulation.Block`.
+
+        Parameters
+        ----------
+
+        parent : blocksim.store.BlockHandle
+            parent block for the new block
+        owner : blocksim.miners.Miner
+            miner that created the block
+        tstamp : int
+            timestamp of moment in which the block was published
+
+        Results
+        -------
+
+        block : blocksim.store.BlockHandle
+            handle of the new block"""
+
+        index = len(self.parents)
+        depths = self.depths
+        jumps = self.jumps
+
+        if parent is None:
+            self.parents.append(-1)
+            jumps.append(index)
+            depths.append(0)
+        else:
+            parent = parent.index
+            jump = jumps[parent]
+            self.parents.append(parent)
+            if depths[parent] - depths[jump] == depths[jump] - depths[jumps[jump]]:
+                jumps.append(jumps[jump])
+            else:
+                jumps.append(parent)
+            depths.append(depths[parent] + 1)
+
+        self.first_children.append(-1)
+        self.next_siblings.append(-1)
+        self.owners.append(self.registry.ids[owner.name] if owner is not None else -1)
+        self.tstamps.append(tstamp)
+        self.flags.append(0)
+
+        return BlockHandle(self, index)
+
+    def __len__(self):
+
+        """Number of blocks in the store, published or not."""
+
+        return len(self.parents)
+
+    def block(self, index):
+
+        """Get the handle of a block.
+
+        Parameters
+        ----------
+
+        index : int
+            row of the block
+
+        Results
+        -------
+
+        block : blocksim.store.BlockHandle
+            handle of the block"""
+
+        return BlockHandle(self, index)
+
+    def columns(self):
+
+        """Read the columns as NumPy arrays that share memory with the store. The
+        store can't create new blocks while any of these arrays is alive, so this
+        method is meant for the analysis of finished runs.
+
+        Results
+        -------
+
+        columns : dict
+            dictionary with the arrays ``parent``, ``jump``, ``owner``, ``depth``,
+            ``tstamp``, ``published`` and ``paid``, indexed by block row. Parents
+            are -1 for roots, owners are -1 for the genesis block and timestamps
+            are -1 for hidden blocks"""
+
+        flags = np.frombuffer(self.flags, dtype=np.uint8)
+        return {'parent': np.frombuffer(self.parents, dtype=np.int64),
+            'jump': np.frombuffer(self.jumps, dtype=np.int64),
+            'owner': np.frombuffer(self.owners, dtype=np.int32),
+            'depth': np.frombuffer(self.depths, dtype=np.int32),
+            'tstamp': np.frombuffer(self.tstamps, dtype=np.int32),
+            'published': (flags & PUBLISHED).astype(bool),
+            'paid': (flags & PAID).astype(bool)}
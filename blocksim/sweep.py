@@ -0,0 +1,274 @@
+"""Tools for running parameter sweeps. A sweep evaluates a simulation configuration
+for every cell of a parameter grid, for example for every combination of hash power
+share, `safe_dist` and payoff parameters, scheduling the cells across a process pool.
+
+Each completed cell is appended as a JSON line to an output file as soon as it
+finishes, so a sweep that gets interrupted can be resumed by running it again with
+the same output file, which skips the cells that are already there. The seed of
+each cell is derived from the seed of the sweep and from the values of the cell,
+not from its position in the grid, so resuming a sweep over an extended grid gives
+the cells that were already there the same seeds. Miners are
+described through `MinerFactory` objects, which hold the miner classes and names
+instead of miner instances and create fresh miners inside each worker process."""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+
+import numpy as np
+
+from .montecarlo import MonteCarlo
+
+
+class MinerFactory:
+
+    """Generate a factory that creates a fresh list of miners each time it is
+    called."""
+
+    def __init__(self, *specs):
+
+        """Parameters
+        ----------
+
+        specs : tuple
+            tuples ``(miner_class, name)`` or ``(miner_class, name, kwargs)``
+            describing each miner, for example ``(SelfishMiner, 'Selfish Miner')``"""
+
+        self.specs = specs
+
+    def __call__(self):
+
+        """Create the miners.
+
+        Results
+        -------
+
+        miners : list
+            list of newly created miners"""
+
+        return [spec[0](spec[1], **(spec[2] if len(spec) > 2 else {})) for spec in self.specs]
+
+
+def cell_key(cell):
+
+    """Compute the key that identifies a cell in the output file.
+
+    Parameters
+    ----------
+
+    cell : dict
+        dictionary of pairs ``parameter_name: value``
+
+    Results
+    -------
+
+    key : str
+        canonical JSON representation of the cell"""
+
+    return json.dumps(cell, sort_keys=True)
+
+
+def cell_seed(root, cell):
+
+    """Derive the seed of a cell from the seed sequence of the sweep, using a hash
+    of the key of the cell as the spawn key.
+
+    Parameters
+    ----------
+
+    root : numpy.random.SeedSequence
+        seed sequence of the sweep
+    cell : dict
+        dictionary of pairs ``parameter_name: value``
+
+    Results
+    -------
+
+    seed : int
+        seed of the cell"""
+
+    digest = hashlib.sha256(cell_key(cell).encode()).digest()
+    spawn_key = tuple(int.from_bytes(digest[i:i + 4], 'little') for i in range(0, 16, 4))
+    return int(np.random.SeedSequence(root.entropy, spawn_key=spawn_key).generate_state(1)[0])
+
+
+def run_cell(task):
+
+    """Run the replicas of a single cell of a sweep.
+
+    Parameters
+    ----------
+
+    task : tuple
+        tuple ``(configure, cell, trials, seed, chunk_size)`` describing the cell
+
+    Results
+    -------
+
+    record : dict
+        dictionary with the cell, the number of trials and the summary of the
+        results of each miner"""
+
+    configure, cell, trials, seed, chunk_size = task
+    config = configure(cell)
+
+    result = MonteCarlo(config['miners'], config['h'], config['step_nr'], config.get('safe_dist', 0),
+        config['payoff'], seed, chunk_size).run(trials, processes=1)
+
+    return {'cell': cell, 'trials': trials, 'results': result.summary()}
+
+
+def repair(path):
+
+    """Remove the incomplete last line that a sweep killed while writing may
+    have left in its output file, so that new records start on a new line.
+
+    Parameters
+    ----------
+
+    path : str
+        path of the output file"""
+
+    if not os.path.exists(path):
+        return
+
+    with open(path, 'rb+') as output:
+        content = output.read()
+        if content and not content.endswith(b'\n'):
+            output.truncate(content.rfind(b'\n') + 1)
+
+
+def load(path):
+
+    """Read the completed cells of a sweep from its output file. Incomplete lines,
+    left by a sweep that was killed while writing, are ignored.
+
+    Parameters
+    ----------
+
+    path : str
+        path of the output file
+
+    Results
+    -------
+
+    records : list
+        list of the records of the completed cells"""
+
+    records = []
+    if not os.path.exists(path):
+        return records
+
+    with open(path) as output:
+        for line in output:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+
+    return records
+
+
+class Sweep:
+
+    """Generate a sweep over a grid of parameters."""
+
+    def __init__(self, grid, configure, path, trials=1, seed=None, chunk_size=None):
+
+        """Parameters
+        ----------
+
+        grid : dict
+            dictionary of pairs ``parameter_name: list of values``. A cell is
+            evaluated for every combination of values. Values have to be
+            serializable to JSON
+        configure : function
+            function that receives a cell, as a dictionary of pairs
+            ``parameter_name: value``, and returns a dictionary with the keys
+            ``miners`` (a `blocksim.sweep.MinerFactory` or any function defined
+            at module level returning the miners), ``h``, ``step_nr``,
+            ``safe_dist`` and ``payoff``. It has to be defined at module level
+        path : str
+            path of the file to which completed cells are appended
+        trials : int
+            number of replicas to run for each cell
+        seed : int
+            seed from which the seed of each cell is derived, along with the
+            values of the cell
+        chunk_size : int
+            chunk size for pre-drawing random values in each replica"""
+
+        self.grid = grid
+        self.configure = configure
+        self.path = path
+        self.trials = trials
+        self.seed = seed
+        self.chunk_size = chunk_size
+
+    def cells(self):
+
+        """List the cells of the grid, in a fixed order.
+
+        Results
+        -------
+
+        cells : list
+            list of dictionaries of pairs ``parameter_name: value``"""
+
+        names = list(self.grid)
+        return [dict(zip(names, values)) for values in product(*(self.grid[name] for name in names))]
+
+    def run(self, processes=None):
+
+        """Run every cell that is not in the output file yet, appending each one
+        to the file as soon as it finishes.
+
+        Parameters
+        ----------
+
+        processes : int
+            number of worker processes. Defaults to the number of processors
+            of the machine. If it is 1 the cells run in the current process
+
+        Results
+        -------
+
+        records : list
+            list of the records of every completed cell of the grid"""
+
+        repair(self.path)
+        root = np.random.SeedSequence(self.seed)
+        done = {cell_key(record['cell']) for record in load(self.path)}
+
+        tasks = [(self.configure, cell, self.trials, cell_seed(root, cell), self.chunk_size)
+            for cell in self.cells() if cell_key(cell) not in done]
+
+        with open(self.path, 'a') as output:
+            if processes == 1:
+                for task in tasks:
+                    self.write(output, run_cell(task))
+            else:
+                with ProcessPoolExecutor(max_workers=processes) as executor:
+                    for future in as_completed([executor.submit(run_cell, task) for task in tasks]):
+                        self.write(output, future.result())
+
+        return load(self.path)
+
+    def write(self, output, record):
+
+        """Append the record of a completed cell to the output file and make sure
+        it reaches the disk.
+
+        Parameters
+        ----------
+
+        output : file
+            output file opened for appending
+        record : dict
+            record of the completed cell"""
+
+        output.write(json.dumps(record) + '\n')
+        output.flush()
+        os.fsync(output.fileno())
@@ -0,0 +1,318 @@
+"""Append-only binary trace of the blocks of a simulation. A `Trace` given to
+`blocksim.simulation.Simulation.simulate` streams a fixed-width record to a file
+every time a block is created, published, communicated to a miner by an `inform`
+call or paid, so that the history of a run can be analyzed afterwards with NumPy
+without keeping its blocks in memory, for instance when the structure is pruned
+(see `blocksim.simulation.Structure.prune`).
+
+The file starts with the 16 bytes of `HEADER`, followed by the records, laid out
+as `RECORD`. Every field is a little-endian integer, except for the time, and the
+fields that don't apply to a record are set to -1:
+
+- ``kind``: `CREATED`, `PUBLISHED`, `INFORMED` or `PAID`
+- ``owner``: id of the owner of the block, as in `blocksim.simulation.MinerRegistry`
+- ``receiver``: id of the miner that receives the block, for `INFORMED` records
+- ``depth``: depth of the block
+- ``block``: creation id of the block, which is 0 for the genesis block and ``k``
+  for the ``k``-th block created in the run. It is only known while the block is
+  hidden, so records of published blocks leave it out
+- ``tstamp``: timestamp of the block once published
+- ``parent``, ``parent_tstamp``: creation id of the parent, if it is hidden, or
+  its timestamp otherwise, for `CREATED` and `PUBLISHED` records
+- ``time``: number of blocks created so far, which is the step in the step mode,
+  or the time of the event in `blocksim.events.EventSimulation`
+
+Each `PUBLISHED` record holds both the creation id and the timestamp of the block,
+so `resolve` can fill in every missing id with a single pass over the trace. The
+records are buffered in memory and written in chunks, and the file can be read
+while the simulation runs with `load`, which maps it into memory.
+
+Runs through the vectorized engine of `blocksim.fastpath` write the records of a
+whole chunk of steps at once, and give the same file as the general engine. A
+trace only covers the runs it is attached to, so a simulation restored from a
+checkpoint starts a new trace where the checkpoint was taken."""
+
+import numpy as np
+
+
+HEADER = b'BLOCKSIMTRACE\x00\x00\x01'
+"""Magic bytes at the start of every trace file, ending in the format version."""
+
+RECORD = np.dtype([('kind', '<u1'), ('owner', '<i4'), ('receiver', '<i4'), ('depth', '<i4'),
+    ('block', '<i8'), ('tstamp', '<i8'), ('parent', '<i8'), ('parent_tstamp', '<i8'), ('time', '<f8')])
+"""Layout of the records, which are packed without padding."""
+
+CREATED = 0
+"""Kind of the records of blocks found by a miner."""
+PUBLISHED = 1
+"""Kind of the records of blocks added to the structure."""
+INFORMED = 2
+"""Kind of the records of hidden blocks communicated to another miner."""
+PAID = 3
+"""Kind of the records of blocks paid out."""
+
+
+class Trace:
+
+    """Generate a sink that streams the records of the blocks of the simulations it
+    is attached to into a trace file."""
+
+    def __init__(self, path, buffer_size=1 << 16):
+
+        """Create the trace file, overwriting it if it exists, and write its
+        header. The same object can be given to several runs of a simulation,
+        whose records are appended to the file.
+
+        Parameters
+        ----------
+
+        path : str
+            path of the trace file
+        buffer_size : int
+            number of records kept in memory before they are written"""
+
+        self.path = path
+        self.buffer_size = buffer_size
+        self.file = open(path, 'wb')
+        self.file.write(HEADER)
+        self.rows = []
+        self.records = 0
+        self.sim = None
+        self.hidden = None
+        self.ids = None
+
+    def attach(self, sim):
+
+        """Start recording the blocks of a simulation.
+
+        Parameters
+        ----------
+
+        sim : blocksim.simulation.Simulation
+            simulation to trace"""
+
+        self.sim = sim
+        self.hidden = sim.hidden_blocks.blocks
+        self.ids = sim.registry.ids
+        sim.struct.trace = self
+
+    def detach(self):
+
+        """Stop recording the blocks of the simulation and write the buffered
+        records."""
+
+        self.sim.struct.trace = None
+        self.sim = None
+        self.flush()
+
+    def now(self):
+
+        """Time of the records written now.
+
+        Results
+        -------
+
+        time : float
+            time of the event being handled by an event-driven simulation, or
+            number of blocks created so far otherwise"""
+
+        time = getattr(self.sim, 'time', None)
+        return float(time if time is not None else self.sim.hidden_blocks.count)
+
+    def ref(self, block):
+
+        """Reference a block by its creation id, if it is hidden, or by its
+        timestamp otherwise.
+
+        Parameters
+        ----------
+
+        block : blocksim.simulation.Block
+            block to reference
+
+        Results
+        -------
+
+        block_id : int
+            creation id of the block, or -1 if it is published
+        tstamp : int
+            timestamp of the block, or -1 if it is hidden"""
+
+        if block is None:
+            return -1, -1
+        seq = self.hidden.get(block)
+        if seq is None:
+            return -1, block.tstamp
+        return seq + 1, -1
+
+    def write(self, kind, block, receiver, block_id, tstamp, parent, parent_tstamp):
+
+        """Add a record to the buffer, writing the buffer to the file when full.
+
+        Parameters
+        ----------
+
+        kind : int
+            kind of the record
+        block : blocksim.simulation.Block
+            block of the record
+        receiver : int
+            id of the miner that receives the block, or -1
+        block_id, tstamp, parent, parent_tstamp : int
+            references to the block and its parent, or -1"""
+
+        self.rows.append((kind, self.ids[block.owner.name], receiver, block.depth, block_id, tstamp,
+            parent, parent_tstamp, self.now()))
+        if len(self.rows) >= self.buffer_size:
+            self.flush()
+
+    def created(self, block):
+
+        """Record a block that has just been found.
+
+        Parameters
+        ----------
+
+        block : blocksim.simulation.Block
+            new hidden block"""
+
+        self.write(CREATED, block, -1, self.hidden[block] + 1, -1, *self.ref(block.parent))
+
+    def published(self, block):
+
+        """Record a block that has just been added to the structure, while it is
+        still among the hidden blocks of the simulation.
+
+        Parameters
+        ----------
+
+        block : blocksim.simulation.Block
+            published block, with its timestamp already set"""
+
+        self.write(PUBLISHED, block, -1, self.hidden[block] + 1, block.tstamp, *self.ref(block.parent))
+
+    def informed(self, block, receiver):
+
+        """Record a block communicated to a miner.
+
+        Parameters
+        ----------
+
+        block : blocksim.simulation.Block
+            communicated block
+        receiver : int
+            id of the miner that receives the block"""
+
+        self.write(INFORMED, block, receiver, *self.ref(block), -1, -1)
+
+    def paid(self, block):
+
+        """Record a block that has just been paid.
+
+        Parameters
+        ----------
+
+        block : blocksim.simulation.Block
+            paid block"""
+
+        self.write(PAID, block, -1, -1, block.tstamp, -1, -1)
+
+    def extend(self, records):
+
+        """Write records built elsewhere, after the buffered ones.
+
+        Parameters
+        ----------
+
+        records : numpy.ndarray
+            array of `RECORD` items"""
+
+        self.flush()
+        self.file.write(np.ascontiguousarray(records, dtype=RECORD).tobytes())
+        self.records += len(records)
+
+    def flush(self):
+
+        """Write the buffered records to the file."""
+
+        if self.rows:
+            self.file.write(np.array(self.rows, dtype=RECORD).tobytes())
+            self.records += len(self.rows)
+            self.rows = []
+        self.file.flush()
+
+    def close(self):
+
+        """Write the buffered records and close the file."""
+
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load(path, mode='r'):
+
+    """Map the records of a trace file into memory, without reading them.
+
+    Parameters
+    ----------
+
+    path : str
+        path of the trace file
+    mode : str
+        mode of `numpy.memmap`, read-only by default
+
+    Results
+    -------
+
+    records : numpy.memmap
+        array of `RECORD` items"""
+
+    with open(path, 'rb') as file:
+        if file.read(len(HEADER)) != HEADER:
+            raise ValueError("{} is not a trace file of this version".format(path))
+        file.seek(0, 2)
+        size = file.tell() - len(HEADER)
+
+    if size < RECORD.itemsize:
+        return np.zeros(0, dtype=RECORD)
+    return np.memmap(path, dtype=RECORD, mode=mode, offset=len(HEADER), shape=(size // RECORD.itemsize,))
+
+
+def resolve(records):
+
+    """Find the creation id of the block and of the parent of every record, using
+    the `PUBLISHED` records to translate timestamps into creation ids.
+
+    Parameters
+    ----------
+
+    records : numpy.ndarray
+        array of `RECORD` items, for example as returned by `load`
+
+    Results
+    -------
+
+    block_ids : numpy.ndarray
+        creation id of the block of each record
+    parent_ids : numpy.ndarray
+        creation id of the parent of each record, or -1 where the record doesn't
+        reference it"""
+
+    published = records[records['kind'] == PUBLISHED]
+    id_of = np.full(max(int(published['tstamp'].max(initial=0)), 0) + 1, -1, dtype=np.int64)
+    id_of[0] = 0
+    id_of[published['tstamp']] = published['block']
+
+    def fill(ids, tstamps):
+        ids = np.array(ids, dtype=np.int64)
+        missing = (ids < 0) & (tstamps >= 0)
+        ids[missing] = id_of[tstamps[missing]]
+        return ids
+
+    return fill(records['block'], records['tstamp']), fill(records['parent'], records['parent_tstamp'])
@@ -15,5 +15,5 @@ if __name__ == "__main__":
         'Default Random Miner': 1}
 
     sim = Simulation(players, h, 10000, safe_dist=0, payoff=alpha_beta_step_payoff(1, 1, 1))
-    sim.simulate()
+    sim.simulate(progress=True)
     sim.print_results()
\ No newline at end of file
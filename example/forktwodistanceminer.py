@@ -1,5 +1,4 @@
 import sys
-from random import sample
 
 sys.path.append("./")
 
@@ -12,7 +11,7 @@ class ForkTwoDistanceMiner(Miner):
 
     def strat(self, struct):
         if self.last_block is None or self.last_block.depth < struct.depth - 2:
-            return sample(struct.deep_blocks, 1)[0]
+            return struct.random_deep_block()
         else:
             return self.last_block
 
@@ -0,0 +1,58 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from blocksim import Simulation, Miner, DefaultMiner, SelfishMiner, AlwaysForkMiner, alpha_beta_step_payoff
+from blocksim.simulation import RECENT_BRANCHES
+
+
+def walked_ties(struct, miner):
+    # the original choice of DefaultMiner: walk every deepest block back to their
+    # common ancestor and compare the payoff of each branch from there exactly
+    next_blocks = set(struct.deep_blocks)
+    while len(next_blocks) > 1 and None not in next_blocks:
+        next_blocks = {block.parent for block in next_blocks}
+    common_block = next_blocks.pop() if None not in next_blocks else struct.base
+
+    block_payoff = {}
+    for block in struct.deep_blocks:
+        payoff_dict = struct.payoff(block, common_block, struct.base)
+        block_payoff[block] = payoff_dict[miner.name]['payoff'] if miner.name in payoff_dict else 0
+    max_payoff = max(block_payoff.values())
+    return [block for block in struct.deep_blocks if block_payoff[block] == max_payoff]
+
+
+def run_checked(payoff, seed, step_nr=8000):
+    miners = [DefaultMiner('d1'), DefaultMiner('d2'), AlwaysForkMiner('f'), SelfishMiner('s')]
+    sim = Simulation(miners, {'d1': 3, 'd2': 3, 'f': 2, 's': 2}, step_nr, 6, payoff, seed=seed)
+    struct = sim.struct
+    best_branches = struct.best_branches
+    decisions = []
+
+    def checked(blocks, miner):
+        chosen = best_branches(blocks, miner)
+        decisions.append(chosen == walked_ties(struct, miner))
+        return chosen
+
+    struct.best_branches = checked
+    sim.simulate()
+    return decisions
+
+
+def test_ties_match_the_walk_from_the_common_ancestor():
+    for seed in range(3):
+        decisions = run_checked(alpha_beta_step_payoff(0.9999, 0.7, 3), seed)
+        assert len(decisions) > 500
+        assert all(decisions)
+
+
+def test_branch_sums_stay_within_the_frontier():
+    miners = [DefaultMiner('d'), AlwaysForkMiner('f'), SelfishMiner('s'), Miner('m')]
+    sim = Simulation(miners, {'d': 3, 'f': 2, 's': 2, 'm': 3}, 20000, 6, seed=4)
+    sim.simulate()
+
+    struct = sim.struct
+    assert len(struct.branch_sums) <= 2 * (len(struct.frontier) + RECENT_BRANCHES)
+    assert all(block in struct.frontier for block in struct.deep_blocks)
+    assert all(block in struct.branch_sums for block in struct.deep_blocks)
@@ -0,0 +1,41 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from blocksim import Simulation, Miner, SelfishMiner, AlwaysForkMiner
+
+
+def leaves(struct):
+    found = []
+    stack = [struct.base]
+    while stack:
+        block = stack.pop()
+        if block.children:
+            stack.extend(block.children)
+        else:
+            found.append(block)
+    return found
+
+
+def test_retained_tips_stay_bounded():
+    miners = [SelfishMiner('s'), AlwaysForkMiner('f'), Miner('m')]
+    sim = Simulation(miners, {'s': 1, 'f': 1, 'm': 2}, 20000, 6, seed=1)
+    sim.simulate()
+
+    frontier = sim.struct.frontier
+    orphaned = len(leaves(sim.struct))
+    assert orphaned > 1000
+    assert len(frontier) <= 10 * (frontier.horizon + 1)
+    assert all(block.depth >= sim.struct.depth - frontier.horizon for block in frontier)
+
+
+def test_frontier_holds_every_tip_within_the_horizon():
+    miners = [SelfishMiner('s'), AlwaysForkMiner('f'), Miner('m')]
+    sim = Simulation(miners, {'s': 1, 'f': 1, 'm': 2}, 5000, 6, seed=2, columnar=True)
+    sim.simulate()
+
+    frontier = sim.struct.frontier
+    recent = {block for block in leaves(sim.struct) if block.depth >= sim.struct.depth - frontier.horizon}
+    assert recent == set(frontier)
+    assert frontier.depth == sim.struct.depth
@@ -0,0 +1,28 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from blocksim import Simulation, Instrumentation, Miner, DefaultMiner, SelfishMiner
+
+
+def test_short_runs_time_the_last_batch():
+    instrumentation = Instrumentation()
+    sim = Simulation([SelfishMiner('s'), Miner('m')], {'s': 1, 'm': 2}, 3000, 6, seed=1)
+    sim.simulate(instrumentation=instrumentation)
+
+    phases = instrumentation.report()['phases']
+    assert phases['payoff']['calls'] == 1
+    assert phases['branch_payoff']['calls'] == 0
+    assert sim.struct.pending_owners == []
+
+
+def test_branch_sums_are_not_counted_as_payoff():
+    instrumentation = Instrumentation()
+    sim = Simulation([DefaultMiner('d'), SelfishMiner('s')], {'d': 2, 's': 1}, 3000, 6, seed=1)
+    sim.simulate(instrumentation=instrumentation)
+
+    phases = instrumentation.report()['phases']
+    assert phases['branch_payoff']['calls'] > 0
+    assert phases['payoff']['calls'] == 1
+    assert 'block_value' not in vars(sim.struct.payoff)
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from blocksim import Simulation, Trace, Miner, DefaultMiner
+from blocksim.replay import from_simulation, from_trace
+
+
+def honest_run(**kwargs):
+    miners = [Miner('m'), DefaultMiner('d')]
+    h = {'m': 1, 'd': 2}
+    return miners, h, Simulation(miners, h, 2000, 6, seed=3, **kwargs)
+
+
+def test_vectorized_runs_point_to_the_alternatives():
+    _, _, sim = honest_run()
+    sim.simulate()
+
+    assert sim.vectorized
+    with pytest.raises(ValueError, match='fast_path=False'):
+        from_simulation(sim)
+
+
+def test_general_engine_and_trace_give_the_same_replay(tmp_path):
+    _, _, sim = honest_run(fast_path=False)
+    sim.simulate()
+    replay = from_simulation(sim)
+
+    miners, h, fast = honest_run()
+    with Trace(str(tmp_path / 'run.trace')) as trace:
+        fast.simulate(trace=trace)
+    traced = from_trace(str(tmp_path / 'run.trace'), miners, h)
+
+    assert not sim.vectorized
+    assert np.array_equal(replay.owners, traced.owners)
+    assert np.array_equal(replay.parents, traced.parents)
+    settled = replay.settle(sim.struct.payoff, 6)
+    assert np.array_equal(settled.block_numbers, sim.results().block_numbers)
+    assert np.allclose(settled.payoffs, sim.results().payoffs)
@@ -0,0 +1,25 @@
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from blocksim import Simulation, Miner, SelfishMiner
+
+
+def test_columnar_footprint_per_block():
+    step_nr = 50000
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        sim = Simulation([SelfishMiner('s'), Miner('m')], {'s': 1, 'm': 2}, step_nr, 6, seed=1, columnar=True)
+        sim.simulate()
+        gc.collect()
+        used = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+    assert len(sim.struct.store) > step_nr // 2
+    assert used / step_nr < 56